@@ -1,58 +1,127 @@
 from django.contrib import admin
 
+from api import catalogue
 from api.models import *
 
 
+class CatalogueAdminMixin:
+    """Invalidate the cached consumables catalogue whenever it is changed in the admin."""
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        catalogue.consumable_cache.invalidate()
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        catalogue.consumable_cache.invalidate()
+
+    def delete_queryset(self, request, queryset):
+        super().delete_queryset(request, queryset)
+        catalogue.consumable_cache.invalidate()
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """Defaults for tables which grow large.
+
+    Foreign keys are shown with their related rows joined in and edited with an autocomplete or a raw id instead
+    of a select listing every row. Counting all rows of the table for the change list is skipped.
+    """
+
+    show_full_result_count = False
+    list_per_page = 50
+
+
 @admin.register(ApplicationModel)
 class ApplicationAdmin(admin.ModelAdmin):
-    pass
+    list_display = ["id"]
 
 
 @admin.register(UserModel)
-class UserAdmin(admin.ModelAdmin):
-    pass
+class UserAdmin(LargeTableAdmin):
+    list_display = ["id", "name", "balance", "active", "internal", "voucher", "modified"]
+    list_filter = ["active", "internal"]
+    list_select_related = ["voucher"]
+    search_fields = ["=id", "name"]
+    autocomplete_fields = ["voucher"]
 
 
 @admin.register(VoteModel)
-class VoteAdmin(admin.ModelAdmin):
-    pass
+class VoteAdmin(LargeTableAdmin):
+    list_display = ["id", "user", "positive", "refund", "membership_poll", "modified"]
+    list_select_related = ["user", "refund", "membership_poll"]
+    autocomplete_fields = ["user"]
+    raw_id_fields = ["refund", "membership_poll"]
 
 
 @admin.register(UserAliasModel)
-class UserAliasAdmin(admin.ModelAdmin):
-    pass
+class UserAliasAdmin(LargeTableAdmin):
+    list_display = ["user_alias", "application", "user"]
+    list_filter = ["application"]
+    list_select_related = ["application", "user"]
+    search_fields = ["=user_alias"]
+    autocomplete_fields = ["user"]
 
 
 @admin.register(ConsumableMessageModel)
-class ConsumableMessageAdmin(admin.ModelAdmin):
-    pass
+class ConsumableMessageAdmin(CatalogueAdminMixin, admin.ModelAdmin):
+    list_display = ["message"]
 
 
 @admin.register(ConsumableModel)
-class ConsumableAdmin(admin.ModelAdmin):
-    pass
+class ConsumableAdmin(CatalogueAdminMixin, admin.ModelAdmin):
+    list_display = ["name", "price", "symbol"]
+    search_fields = ["name"]
 
 
 @admin.register(CommunismModel)
-class CommunismAdmin(admin.ModelAdmin):
-    pass
+class CommunismAdmin(LargeTableAdmin):
+    list_display = ["id", "reason", "amount", "active", "creator", "created"]
+    list_filter = ["active"]
+    list_select_related = ["creator"]
+    autocomplete_fields = ["creator"]
+    raw_id_fields = ["participants"]
 
 
 @admin.register(CommunismUserModel)
-class CommunismUserAdmin(admin.ModelAdmin):
-    pass
+class CommunismUserAdmin(LargeTableAdmin):
+    list_display = ["id", "user", "quantity"]
+    list_select_related = ["user"]
+    autocomplete_fields = ["user"]
 
 
 @admin.register(TransactionModel)
-class TransactionAdmin(admin.ModelAdmin):
-    pass
+class TransactionAdmin(LargeTableAdmin):
+    list_display = ["id", "sender", "receiver", "amount", "reason", "created"]
+    list_select_related = ["sender", "receiver"]
+    search_fields = ["=id"]
+    autocomplete_fields = ["sender", "receiver"]
+    # Backed by the index on created of the transactions and the archived transactions
+    date_hierarchy = "created"
+
+
+@admin.register(ArchivedTransactionModel)
+class ArchivedTransactionAdmin(TransactionAdmin):
+    """Archived transactions are read only, they are written by the archive command."""
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
 
 
 @admin.register(MembershipPollModel)
-class MembershipPollAdmin(admin.ModelAdmin):
-    pass
+class MembershipPollAdmin(LargeTableAdmin):
+    list_display = ["id", "creator", "active", "positive_votes", "negative_votes", "created"]
+    list_filter = ["active"]
+    list_select_related = ["creator"]
+    autocomplete_fields = ["creator"]
 
 
 @admin.register(RefundModel)
-class RefundAdmin(admin.ModelAdmin):
-    pass
+class RefundAdmin(LargeTableAdmin):
+    list_display = ["id", "creator", "amount", "reason", "active", "positive_votes", "negative_votes", "created"]
+    list_filter = ["active"]
+    list_select_related = ["creator"]
+    autocomplete_fields = ["creator"]
+    raw_id_fields = ["transaction"]
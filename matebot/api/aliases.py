@@ -0,0 +1,94 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.db import transaction
+
+from api import models
+from api.generations import Generation
+from matebot import settings
+
+# Changed whenever aliases are created or deleted
+generation = Generation("matebot:aliases:generation")
+
+
+class AliasCache:
+    """In-process LRU cache mapping the alias of an application to the id of its user.
+
+    Aliases which do not exist are not cached, as another process may create them at any time. Creating and
+    deleting aliases evicts them and changes a generation in the shared cache. Every lookup compares it with the
+    generation the entries were cached at and drops all entries if they differ, so aliases deleted in another
+    process are evicted as well. Entries also expire after ``ALIAS_CACHE_TTL`` seconds.
+    """
+
+    def __init__(self, size, ttl):
+        self.size = size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._generation = None
+
+    def cached(self, application_id, aliases):
+        """Look up the aliases without touching the database.
+
+        :return: Tuple of a dict mapping the found aliases to their user id and a list of the missing aliases
+        """
+        return self._cached(application_id, aliases, generation.get())
+
+    async def acached(self, application_id, aliases):
+        """Async version of cached."""
+        return self._cached(application_id, aliases, await generation.aget())
+
+    def _cached(self, application_id, aliases, current):
+        found, missing = {}, []
+        now = time.monotonic()
+        with self._lock:
+            if current != self._generation:
+                self._entries.clear()
+                self._generation = current
+            for alias in aliases:
+                entry = self._entries.get((application_id, alias))
+                if entry is None or now - entry[1] > self.ttl:
+                    missing.append(alias)
+                else:
+                    self._entries.move_to_end((application_id, alias))
+                    found[alias] = entry[0]
+        return found, missing
+
+    def get(self, application_id, aliases):
+        """Return a dict mapping each alias to the id of its user or None if the alias does not exist."""
+        current = generation.get()
+        found, missing = self._cached(application_id, aliases, current)
+        if missing:
+            loaded = dict(
+                models.UserAliasModel.objects.filter(
+                    application_id=application_id, user_alias__in=missing
+                ).values_list("user_alias", "user_id")
+            )
+            now = time.monotonic()
+            with self._lock:
+                for alias in missing:
+                    found[alias] = loaded.get(alias)
+                    # Aliases read before the generation changed again may already be deleted
+                    if found[alias] is not None and current == self._generation:
+                        self._entries[application_id, alias] = (found[alias], now)
+                        self._entries.move_to_end((application_id, alias))
+                while len(self._entries) > self.size:
+                    self._entries.popitem(last=False)
+        return found
+
+    def evict(self, application_id, aliases):
+        """Drop the aliases once the current transaction is committed, other processes drop all their entries."""
+        def clear():
+            with self._lock:
+                for alias in aliases:
+                    self._entries.pop((application_id, alias), None)
+        transaction.on_commit(clear)
+        generation.bump()
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+
+
+alias_cache = AliasCache(size=settings.ALIAS_CACHE_SIZE, ttl=settings.ALIAS_CACHE_TTL)
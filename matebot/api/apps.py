@@ -1,6 +1,30 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+
+from matebot import settings
+
+
+def configure_connection(sender, connection, **kwargs):
+    """Apply SQLITE_PRAGMAS to new SQLite connections."""
+    if connection.vendor == "sqlite":
+        with connection.cursor() as cursor:
+            for name, value in settings.SQLITE_PRAGMAS.items():
+                cursor.execute(f"PRAGMA {name} = {value}")
+
+
+def application_changed(sender, **kwargs):
+    """Reload the cached tokens in every process after an application was saved or deleted."""
+    from api import auth
+    auth.generation.bump()
 
 
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        connection_created.connect(configure_connection)
+        application = self.get_model("ApplicationModel")
+        post_save.connect(application_changed, sender=application)
+        post_delete.connect(application_changed, sender=application)
@@ -0,0 +1,79 @@
+"""Moving old transactions out of the ledger.
+
+Archived transactions are copied to ArchivedTransactionModel, keeping their ids, and deleted from
+TransactionModel. In their place every user gets one carry-forward transaction with the community user for the
+net amount of its archived transactions, so balances still equal the sum of the ledger.
+
+Carry-forward transactions have the id -(user id + 1). They sort before every other transaction of the user,
+are replaced by the next archival and, being below every watermark, are never folded by the reconciliation or
+the statistics again. Both already contain the archived transactions.
+"""
+import itertools
+
+from django.db import transaction
+from django.db.models import Max
+
+from api import models, reconciliation, rollups
+from matebot import settings
+
+# Transactions copied to the archive per INSERT statement
+ARCHIVE_BATCH_SIZE = 1000
+
+FIELDS = ["id", "sender_id", "receiver_id", "amount", "reason", "consumable", "quantity", "created"]
+
+
+def carry_forward_id(user_id):
+    return -(user_id + 1)
+
+
+def archive(before):
+    """Archive the transactions created before the given time.
+
+    The reconciliation and the statistics are folded first, only transactions both have seen are archived.
+    Transactions referenced by a refund stay in the ledger.
+
+    :raises UserModel.DoesNotExist: The community user does not exist. Nothing is changed in this case.
+    :return: Tuple of the number of archived transactions and the number of carry-forward transactions
+    """
+    reconciliation.fold()
+    rollups.fold()
+    with transaction.atomic():
+        reconciled = models.ReconciliationModel.objects.select_for_update().get(id=1).last_transaction_id
+        folded = models.StatisticStateModel.objects.select_for_update().get(id=1).last_transaction_id
+        last_id = models.TransactionModel.objects.filter(
+            id__gt=0, id__lte=min(reconciled, folded), created__lt=before
+        ).aggregate(last=Max("id"))["last"]
+        if last_id is None:
+            return 0, 0
+        old = models.TransactionModel.objects.filter(id__lte=last_id).exclude(
+            id__in=models.RefundModel.objects.filter(transaction__isnull=False).values("transaction_id")
+        )
+
+        community = settings.COMMUNITY_USER_ID
+        deltas = reconciliation.net_amounts(old)
+        carried = [
+            models.TransactionModel(
+                id=carry_forward_id(user_id),
+                sender_id=community if amount > 0 else user_id,
+                receiver_id=user_id if amount > 0 else community,
+                amount=abs(amount),
+                reason="Balance carried forward from the archive"
+            )
+            for user_id, amount in deltas.items() if user_id != community and amount != 0
+        ]
+        if carried and not models.UserModel.objects.filter(id=community).exists():
+            raise models.UserModel.DoesNotExist
+
+        archived = 0
+        # Previous carry-forward transactions are replaced, not archived
+        rows = old.filter(id__gt=0).values_list(*FIELDS).iterator(chunk_size=ARCHIVE_BATCH_SIZE)
+        while batch := list(itertools.islice(rows, ARCHIVE_BATCH_SIZE)):
+            models.ArchivedTransactionModel.objects.bulk_create(
+                models.ArchivedTransactionModel(**dict(zip(FIELDS, x))) for x in batch
+            )
+            archived += len(batch)
+        old.delete()
+        models.TransactionModel.objects.bulk_create(carried, batch_size=500)
+        # created is set on insert, carry-forward transactions are dated to the cutoff instead
+        models.TransactionModel.objects.filter(id__lte=0).update(created=before)
+    return archived, len(carried)
@@ -0,0 +1,127 @@
+import threading
+import time
+
+import rc_protocol
+from asgiref.sync import sync_to_async
+
+from api import models
+from api.generations import Generation
+from matebot import settings
+
+# Changed whenever an application is saved or deleted
+generation = Generation("matebot:auth:generation")
+
+
+class TokenCache:
+    """In-process cache of application tokens.
+
+    Tokens are looked up by application id, so authenticating a request costs a dict lookup instead of a query
+    and a checksum validation per registered application. Saving or deleting an application changes a generation
+    in the shared cache, every lookup compares it with the generation the tokens were loaded at and reloads them
+    if they differ. Entries also expire after ``AUTH_TOKEN_CACHE_TTL`` seconds.
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._tokens = {}
+        self._loaded_at = None
+        self._generation = None
+
+    def _load(self, current):
+        self._tokens = dict(models.ApplicationModel.objects.values_list("id", "token"))
+        self._loaded_at = time.monotonic()
+        self._generation = current
+
+    def _is_fresh(self, current):
+        return (
+            self._loaded_at is not None and time.monotonic() - self._loaded_at <= self.ttl
+            and current == self._generation
+        )
+
+    def _ensure_fresh(self):
+        current = generation.get()
+        with self._lock:
+            if not self._is_fresh(current):
+                self._load(current)
+
+    def get(self, application_id, refresh=False):
+        """Return the token of the given application or None if it does not exist.
+
+        :param refresh: Re-read the token of this single application from the database
+        """
+        self._ensure_fresh()
+        if refresh:
+            token = models.ApplicationModel.objects.filter(id=application_id).values_list("token", flat=True).first()
+            with self._lock:
+                if token is None:
+                    self._tokens.pop(application_id, None)
+                else:
+                    self._tokens[application_id] = token
+            return token
+        return self._tokens.get(application_id)
+
+    async def acached(self, application_id):
+        """Return the token if it is cached and still fresh, without touching the database."""
+        if not self._is_fresh(await generation.aget()):
+            return None
+        return self._tokens.get(application_id)
+
+    def all(self):
+        """Return all known tokens, used for requests without an application id."""
+        self._ensure_fresh()
+        return list(self._tokens.values())
+
+    def invalidate(self):
+        with self._lock:
+            self._tokens = {}
+            self._loaded_at = None
+
+
+token_cache = TokenCache(ttl=settings.AUTH_TOKEN_CACHE_TTL)
+
+
+def parse_authorization(header):
+    """Split the Authorization header into application id and checksum.
+
+    The header has the form ``<scheme> <application_id>:<checksum>``. For backwards compatibility
+    ``<scheme> <checksum>`` is accepted as well, in which case the application id is None.
+
+    :return: Tuple of application id and checksum or None if the header is malformed
+    """
+    if " " not in header:
+        return None
+    credentials = header.split(" ")[1]
+    if ":" not in credentials:
+        return None, credentials
+    application_id, checksum = credentials.split(":", 1)
+    try:
+        return int(application_id), checksum
+    except ValueError:
+        return None
+
+
+def validate(data, checksum, application_id, salt):
+    """Validate the checksum against the token of the given application.
+
+    If the cached token does not match, the cache is refreshed once, so a token rotated in another process
+    is picked up without waiting for the TTL to expire.
+    """
+    if application_id is None:
+        return any(
+            rc_protocol.validate_checksum(data, checksum, token, salt=salt) for token in token_cache.all()
+        )
+    token = token_cache.get(application_id)
+    if token is not None and rc_protocol.validate_checksum(data, checksum, token, salt=salt):
+        return True
+    token = token_cache.get(application_id, refresh=True)
+    return token is not None and rc_protocol.validate_checksum(data, checksum, token, salt=salt)
+
+
+async def avalidate(data, checksum, application_id, salt):
+    """Async version of validate, only accesses the database if the cached token does not match."""
+    if application_id is not None:
+        token = await token_cache.acached(application_id)
+        if token is not None and rc_protocol.validate_checksum(data, checksum, token, salt=salt):
+            return True
+    return await sync_to_async(validate)(data, checksum, application_id, salt)
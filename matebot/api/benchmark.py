@@ -0,0 +1,226 @@
+"""Helpers shared by the benchmark management commands.
+
+Benchmarks seed their data inside a transaction that is rolled back afterwards, so they can be run against
+any database without leaving rows behind.
+"""
+import contextlib
+import http.server
+import json
+import random
+import secrets
+import statistics
+import threading
+import time
+
+import rc_protocol
+from django.db import transaction
+from django.test import RequestFactory
+
+from api import models, rollups
+from matebot import settings
+
+
+class _Rollback(Exception):
+    pass
+
+
+@contextlib.contextmanager
+def rolled_back():
+    """Run the block inside a transaction which is always rolled back."""
+    try:
+        with transaction.atomic():
+            yield
+            raise _Rollback
+    except _Rollback:
+        pass
+
+
+def authorization(application, data, path):
+    """Build the Authorization header value for a request of the given application."""
+    checksum = rc_protocol.get_checksum(data, application.token, salt=path)
+    return f"RCP {application.id}:{checksum}"
+
+
+def signed_get(path, params, application):
+    return RequestFactory().get(
+        path, params, HTTP_AUTHORIZATION=authorization(application, params, path)
+    )
+
+
+def signed_post(path, data, application):
+    return RequestFactory().post(
+        path, json.dumps(data), content_type="application/json",
+        HTTP_AUTHORIZATION=authorization(application, data, path)
+    )
+
+
+def percentiles(timings):
+    """Return the median and the 99th percentile of the sorted timings."""
+    return statistics.median(timings), timings[min(len(timings) - 1, int(len(timings) * 0.99))]
+
+
+def measure(func, repeat):
+    """Call func repeat times and return the median and the 99th percentile in milliseconds."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return percentiles(timings)
+
+
+def seed(users=1000, aliases=2, transactions=10000, communisms=100, participants=10, votes=10):
+    """Create a synthetic dataset, the same arguments always create the same data.
+
+    Half of the users are internal. Every user gets an alias for each of ``aliases`` applications. Each communism
+    gets ``participants`` participants, one refund and one membership poll get ``votes`` votes, alternating between
+    negative and positive so another vote does not decide them.
+
+    :return: Dict with the rows requests can be built with
+    """
+    rng = random.Random(0)
+    applications = models.ApplicationModel.objects.bulk_create(
+        models.ApplicationModel(token=secrets.token_hex(32)) for _ in range(max(aliases, 1))
+    )
+    models.UserModel.objects.get_or_create(id=settings.COMMUNITY_USER_ID, defaults={"internal": True})
+    internal = models.UserModel.objects.bulk_create(
+        (models.UserModel(internal=True) for _ in range(max(users - users // 2, votes + 5))), batch_size=1000
+    )
+    external = models.UserModel.objects.bulk_create(
+        (models.UserModel() for _ in range(max(users // 2, 3))), batch_size=1000
+    )
+    everyone = internal + external
+    models.UserAliasModel.objects.bulk_create(
+        (
+            models.UserAliasModel(user=x, application=y, user_alias=f"{y.id}-{x.id}")
+            for x in everyone for y in applications[:aliases]
+        ),
+        batch_size=1000
+    )
+    external[0].voucher = internal[0]
+    external[0].save()
+    models.TransactionModel.objects.bulk_create(
+        (
+            models.TransactionModel(
+                sender=rng.choice(everyone), receiver=rng.choice(everyone), amount=1,
+                # Every second transaction pays for a consumable, so the statistics have something to show
+                consumable=f"benchmark {i % 20}" if i % 2 else None, quantity=1 if i % 2 else None
+            )
+            for i in range(transactions)
+        ),
+        batch_size=1000
+    )
+    rollups.fold(settle_delay=0)
+
+    participants = min(participants, len(everyone))
+    # The first communism belongs to the first internal user, the second internal user owns none
+    created = models.CommunismModel.objects.bulk_create(
+        models.CommunismModel(creator=internal[0] if i == 0 else rng.choice(internal[2:]), amount=100, reason="")
+        for i in range(max(communisms, 1))
+    )
+    members = models.CommunismUserModel.objects.bulk_create(
+        (
+            models.CommunismUserModel(user=x)
+            for _ in created for x in rng.sample(everyone, participants)
+        ),
+        batch_size=1000
+    )
+    through = models.CommunismModel.participants.through
+    through.objects.bulk_create(
+        (
+            through(communismmodel_id=x.id, communismusermodel_id=y.id)
+            for i, x in enumerate(created) for y in members[i * participants:(i + 1) * participants]
+        ),
+        batch_size=1000
+    )
+
+    refund = models.RefundModel.objects.create(creator=internal[0], amount=100)
+    poll = models.MembershipPollModel.objects.create(creator=external[1], active=True)
+    voters = internal[2:2 + votes]
+    for target, field in ((refund, "refund"), (poll, "membership_poll")):
+        models.VoteModel.objects.bulk_create(
+            models.VoteModel(user=x, positive=i % 2 == 1, **{field: target}) for i, x in enumerate(voters)
+        )
+        target.positive_votes, target.negative_votes = votes // 2, votes - votes // 2
+        target.save()
+
+    models.ConsumableModel.objects.bulk_create(
+        models.ConsumableModel(name=f"benchmark {i}", price=100 + i, symbol="x") for i in range(20)
+    )
+
+    return {
+        "application": applications[0],
+        "alias_application": applications[-1],
+        "internal": internal,
+        "external": external,
+        "communism": created[0],
+        "participant": members[0].user if participants else None,
+        "refund": refund,
+        "poll": poll,
+        "voter": internal[-1],
+        "previous_voter": voters[0] if voters else internal[2],
+    }
+
+
+class CallbackStub:
+    """Local HTTP server recording the callback requests it receives.
+
+    :param delay: Seconds each request takes to answer
+    :param failures: Number of requests answered with an error before the server starts to accept events
+    """
+
+    def __init__(self, delay=0.0, failures=0):
+        self.delay = delay
+        self.failures = failures
+        self.batches = []
+        self.latencies = []
+        self.max_concurrency = 0
+        self._active = 0
+        self._lock = threading.Lock()
+        self._server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+
+    @property
+    def uri(self):
+        return f"http://127.0.0.1:{self._server.server_port}/"
+
+    @property
+    def events(self):
+        return sum(len(x) for x in self.batches)
+
+    def _handler(self):
+        stub = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                with stub._lock:
+                    stub._active += 1
+                    stub.max_concurrency = max(stub.max_concurrency, stub._active)
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                time.sleep(stub.delay)
+                with stub._lock:
+                    stub._active -= 1
+                    failed = stub.failures > 0
+                    if failed:
+                        stub.failures -= 1
+                    else:
+                        stub.batches.append(body["events"])
+                        stub.latencies.extend(time.time() - x["created"] for x in body["events"])
+                self.send_response(500 if failed else 200)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def __enter__(self):
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *args):
+        self._server.shutdown()
+        self._server.server_close()
@@ -0,0 +1,103 @@
+import asyncio
+import itertools
+import logging
+import random
+from collections import defaultdict
+from datetime import timedelta
+
+import aiohttp
+from django.db.models import F
+from django.utils import timezone
+
+from api import models
+from matebot import settings
+
+logger = logging.getLogger(__name__)
+
+
+def emit(event, **data):
+    """Queue an event for every registered callback.
+
+    Call this inside the database transaction that makes the change, so the event is only sent if the change
+    is committed. Delivery happens asynchronously in the callbacks worker.
+    """
+    models.CallbackEventModel.objects.bulk_create([
+        models.CallbackEventModel(callback=x, event=event, data=data)
+        for x in models.ApplicationCallbackModel.objects.all()
+    ])
+
+
+def retry_delay(attempts):
+    """Exponential backoff with jitter for the given number of failed attempts."""
+    delay = min(settings.CALLBACK_RETRY_DELAY * 2 ** (attempts - 1), settings.CALLBACK_RETRY_MAX_DELAY)
+    return timedelta(seconds=delay * random.uniform(0.5, 1))
+
+
+class Dispatcher:
+    """Deliver queued events to the callbacks.
+
+    Events of the same callback are sent in batches of ``CALLBACK_BATCH_SIZE`` per POST, with at most
+    ``CALLBACK_CONCURRENCY`` requests in flight per callback. Connections are kept alive and reused.
+    Failed batches are retried with exponential backoff and dropped after ``CALLBACK_MAX_ATTEMPTS``.
+    """
+
+    def __init__(self, session):
+        self.session = session
+        self._limits = defaultdict(lambda: asyncio.Semaphore(settings.CALLBACK_CONCURRENCY))
+
+    async def _send(self, callback, events):
+        async with self._limits[callback.uri]:
+            try:
+                async with self.session.post(
+                        callback.uri,
+                        json={"events": [x.to_dict() for x in events]},
+                        auth=aiohttp.BasicAuth(callback.username, callback.password)
+                ) as response:
+                    return 200 <= response.status < 300
+            except (aiohttp.ClientError, asyncio.TimeoutError) as err:
+                logger.info("Sending to %s failed: %s", callback.uri, err)
+                return False
+
+    async def _deliver(self, callback, events):
+        ids = [x.id for x in events]
+        if await self._send(callback, events):
+            await models.CallbackEventModel.objects.filter(id__in=ids).adelete()
+            return len(events)
+        attempts = max(x.attempts for x in events) + 1
+        if attempts >= settings.CALLBACK_MAX_ATTEMPTS:
+            logger.warning("Dropping %d events for %s after %d attempts", len(events), callback.uri, attempts)
+            await models.CallbackEventModel.objects.filter(id__in=ids).adelete()
+        else:
+            await models.CallbackEventModel.objects.filter(id__in=ids).aupdate(
+                attempts=F("attempts") + 1, next_attempt=timezone.now() + retry_delay(attempts)
+            )
+        return 0
+
+    async def run_once(self, limit=1000):
+        """Send all due events, at most limit.
+
+        :return: Number of delivered events
+        """
+        due = models.CallbackEventModel.objects.filter(next_attempt__lte=timezone.now())
+        events = [x async for x in due.select_related("callback").order_by("id")[:limit]]
+        tasks = []
+        events.sort(key=lambda x: x.callback_id)
+        for _, group in itertools.groupby(events, key=lambda x: x.callback_id):
+            group = sorted(group, key=lambda x: x.id)
+            for i in range(0, len(group), settings.CALLBACK_BATCH_SIZE):
+                batch = group[i:i + settings.CALLBACK_BATCH_SIZE]
+                tasks.append(self._deliver(batch[0].callback, batch))
+        return sum(await asyncio.gather(*tasks))
+
+    async def run_forever(self):
+        while True:
+            if not await self.run_once():
+                await asyncio.sleep(settings.CALLBACK_POLL_INTERVAL)
+
+
+def session():
+    """Create the HTTP session used to deliver events."""
+    return aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(limit=settings.CALLBACK_CONNECTIONS),
+        timeout=aiohttp.ClientTimeout(total=settings.CALLBACK_TIMEOUT)
+    )
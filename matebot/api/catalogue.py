@@ -0,0 +1,79 @@
+import hashlib
+import json
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+
+from api import models
+from api.generations import Generation
+from matebot import settings
+
+# Changed whenever the catalogue is changed by the consumables command or in the admin
+generation = Generation("matebot:catalogue:generation")
+
+
+class ConsumableCache:
+    """In-process cache of the serialized consumables.
+
+    The catalogue only changes when the consumables command runs or a consumable is edited in the admin,
+    both invalidate the cache. As the command usually runs in another process, invalidating changes a
+    generation in the shared cache, which every lookup compares with the generation the catalogue was
+    loaded at. Entries also expire after ``CONSUMABLES_CACHE_TTL`` seconds.
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entry = None
+        self._loaded_at = None
+        self._generation = None
+
+    def _load(self):
+        consumables = models.ConsumableModel.objects.prefetch_related("messages").order_by("id")
+        data = [x.to_dict() for x in consumables]
+        body = json.dumps({"success": True, "data": data}, cls=DjangoJSONEncoder).encode("utf-8")
+        return data, body, f'"{hashlib.sha256(body).hexdigest()}"'
+
+    def _is_fresh(self, current):
+        return (
+            self._loaded_at is not None and time.monotonic() - self._loaded_at <= self.ttl
+            and current == self._generation
+        )
+
+    def get(self):
+        """Return the consumables, the encoded response body and its ETag."""
+        current = generation.get()
+        with self._lock:
+            if not self._is_fresh(current):
+                self._entry = self._load()
+                self._loaded_at = time.monotonic()
+                self._generation = current
+            return self._entry
+
+    async def aget(self):
+        """Async version of get, only leaves the event loop if the catalogue has to be loaded."""
+        entry = self._entry
+        if self._is_fresh(await generation.aget()):
+            return entry
+        return await sync_to_async(self.get)()
+
+    def find(self, key):
+        """Return the consumable with the given name or id, None if there is none."""
+        data, _, _ = self.get()
+        return next((x for x in data if x["name"] == key or x["identifier"] == key), None)
+
+    def invalidate(self):
+        """Drop the cached catalogue of all processes once the current transaction is committed."""
+        transaction.on_commit(self._clear)
+        generation.bump()
+
+    def _clear(self):
+        with self._lock:
+            self._entry = None
+            self._loaded_at = None
+
+
+consumable_cache = ConsumableCache(ttl=settings.CONSUMABLES_CACHE_TTL)
@@ -0,0 +1,135 @@
+"""Bulk export of the ledger.
+
+Transactions are read with values_list in chunks of ``STREAM_CHUNK_SIZE`` rows, using a server side cursor where
+the database supports it, and encoded chunk by chunk without creating model instances. Memory stays bounded by
+the chunk size, no matter how many rows are exported.
+
+Parquet needs the optional pyarrow package.
+"""
+import csv
+import importlib.util
+import io
+import itertools
+import json
+
+from api import ledger, models
+from matebot import settings
+
+FIELDS = ["id", "sender_id", "receiver_id", "amount", "reason", "consumable", "quantity", "created"]
+
+# Rows per row group of a parquet file, larger groups compress better but are kept in memory while they are written
+PARQUET_ROW_GROUP_SIZE = 50000
+
+
+def _chunks(rows, size):
+    while chunk := list(itertools.islice(rows, size)):
+        yield chunk
+
+
+def _csv(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(FIELDS)
+    for chunk in _chunks(rows, settings.STREAM_CHUNK_SIZE):
+        writer.writerows(x[:-1] + (x[-1].isoformat(),) for x in chunk)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue().encode()
+
+
+def _jsonl(rows):
+    for chunk in _chunks(rows, settings.STREAM_CHUNK_SIZE):
+        yield "".join(
+            json.dumps(dict(zip(FIELDS, x[:-1] + (x[-1].isoformat(),)))) + "\n" for x in chunk
+        ).encode()
+
+
+class _Sink(io.RawIOBase):
+    """Write-only file collecting what was written since it was last drained."""
+
+    def __init__(self):
+        super().__init__()
+        self.position = 0
+        self.chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self):
+        data, self.chunks = b"".join(self.chunks), []
+        return data
+
+
+def _parquet(rows):
+    import pyarrow
+    import pyarrow.parquet
+
+    schema = pyarrow.schema([
+        ("id", pyarrow.int64()),
+        ("sender_id", pyarrow.int64()),
+        ("receiver_id", pyarrow.int64()),
+        ("amount", pyarrow.int64()),
+        ("reason", pyarrow.string()),
+        ("consumable", pyarrow.string()),
+        ("quantity", pyarrow.int64()),
+        ("created", pyarrow.timestamp("us", tz="UTC")),
+    ])
+    sink = _Sink()
+    with pyarrow.parquet.ParquetWriter(sink, schema) as writer:
+        for chunk in _chunks(rows, PARQUET_ROW_GROUP_SIZE):
+            writer.write_table(pyarrow.Table.from_arrays(
+                [pyarrow.array(x, type=y.type) for x, y in zip(zip(*chunk), schema)], schema=schema
+            ))
+            yield sink.drain()
+    yield sink.drain()
+
+
+# Name of the format mapped to its writer, content type and required package
+FORMATS = {
+    "csv": (_csv, "text/csv", None),
+    "jsonl": (_jsonl, "application/jsonl", None),
+    "parquet": (_parquet, "application/vnd.apache.parquet", "pyarrow"),
+}
+
+
+def check(format):
+    """Raise a ValueError describing why the format can not be exported, if it can not."""
+    if format not in FORMATS:
+        raise ValueError(f"Format must be one of {', '.join(FORMATS)}")
+    package = FORMATS[format][2]
+    if package is not None and importlib.util.find_spec(package) is None:
+        raise ValueError(f"Exporting {format} needs {package} to be installed")
+
+
+def transactions(since=None, until=None, archive=False):
+    """Iterate over the transactions as tuples of FIELDS, ordered by id.
+
+    :param since: Only transactions created at or after this time
+    :param until: Only transactions created before this time
+    :param archive: Start with the archived transactions. The carry-forward transactions summing them up are
+        left out then.
+    """
+    current = models.TransactionModel.objects.all()
+    querysets = [models.ArchivedTransactionModel.objects.all(), current.filter(id__gt=0)] if archive else [current]
+    querysets = [ledger.created_between(x, since, until) for x in querysets]
+    return itertools.chain.from_iterable(
+        x.order_by("id").values_list(*FIELDS).iterator(chunk_size=settings.STREAM_CHUNK_SIZE) for x in querysets
+    )
+
+
+def export(format, since=None, until=None, archive=False):
+    """Iterate over the encoded chunks of the export of the transactions in the given format.
+
+    :raises ValueError: The format can not be exported, see check
+    """
+    check(format)
+    return FORMATS[format][0](transactions(since, until, archive))
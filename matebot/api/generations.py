@@ -0,0 +1,29 @@
+"""Generations in the shared cache, telling the in-process caches of all processes that their data changed.
+
+An in-process cache remembers the generation it loaded its data at and reloads the data once the generation in
+the shared cache differs. Changes are thereby picked up by every process with its next lookup, instead of after
+the TTL of the in-process cache. Checking costs one read of the ``default`` cache per lookup, see CACHES in the
+settings.
+"""
+import secrets
+
+from django.core.cache import cache
+from django.db import transaction
+
+
+class Generation:
+    """Generation of the data cached in process under the given key of the shared cache."""
+
+    def __init__(self, key):
+        self.key = key
+
+    def get(self):
+        """Return the current generation, None if it was never changed."""
+        return cache.get(self.key)
+
+    async def aget(self):
+        return await cache.aget(self.key)
+
+    def bump(self):
+        """Change the generation once the current transaction is committed."""
+        transaction.on_commit(lambda: cache.set(self.key, secrets.token_hex(8), None))
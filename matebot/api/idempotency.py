@@ -0,0 +1,80 @@
+import hashlib
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse, JsonResponse
+from django.utils import timezone
+
+from api import models
+from matebot import settings
+
+HEADER = "Idempotency-Key"
+
+
+def _replay(record, fingerprint):
+    if record.fingerprint != fingerprint:
+        return JsonResponse(
+            {"success": False, "info": "Idempotency key was already used for a different request"}, status=422
+        )
+    response = HttpResponse(bytes(record.response), status=record.status, content_type="application/json")
+    response["Idempotent-Replayed"] = "true"
+    return response
+
+
+def _lookup(application_id, key):
+    """Return the stored response for the key or None, expired keys are deleted."""
+    record = models.IdempotencyKeyModel.objects.filter(application_id=application_id, key=key).first()
+    if record is not None and record.created < timezone.now() - timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL):
+        record.delete()
+        return None
+    return record
+
+
+def respond(request, application_id, key, view):
+    """Answer a request carrying an Idempotency-Key.
+
+    If a response is stored for the key, it is returned without calling view. Otherwise view is called and its
+    response is stored in the same transaction as the changes it made. When two requests with the same key race,
+    the one committing second is rolled back and answered with the response of the first. On server errors the
+    changes of the view are rolled back and the response is not stored, so the request can be retried.
+
+    :param view: Callable returning the response of the request
+    """
+    if application_id is None:
+        return JsonResponse(
+            {"success": False, "info": "Idempotency keys require the application id in the Authorization header"},
+            status=400
+        )
+    if not key or len(key) > 255:
+        return JsonResponse({"success": False, "info": "Idempotency key is invalid"}, status=400)
+    fingerprint = hashlib.sha256(request.path.encode("utf-8") + b"\0" + request.body).hexdigest()
+    record = _lookup(application_id, key)
+    if record is not None:
+        return _replay(record, fingerprint)
+
+    with transaction.atomic():
+        response = view()
+        if response.status_code >= 500:
+            transaction.set_rollback(True)
+            return response
+        try:
+            with transaction.atomic():
+                models.IdempotencyKeyModel.objects.create(
+                    application_id=application_id, key=key, path=request.path, fingerprint=fingerprint,
+                    status=response.status_code, response=response.content
+                )
+        except IntegrityError:
+            transaction.set_rollback(True)
+            response = None
+    if response is None:
+        return _replay(models.IdempotencyKeyModel.objects.get(application_id=application_id, key=key), fingerprint)
+    return response
+
+
+def prune():
+    """Delete all expired keys.
+
+    :return: Number of deleted keys
+    """
+    expired = timezone.now() - timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL)
+    return models.IdempotencyKeyModel.objects.filter(created__lt=expired).delete()[0]
@@ -0,0 +1,159 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.db.models import Case, F, IntegerField, Max, Q, Subquery, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from api import models
+from matebot import settings
+
+# Users updated per UPDATE statement, keeps the number of query parameters below the SQLite limit
+BALANCE_BATCH_SIZE = 250
+
+
+def apply_balances(deltas):
+    """Add amounts to the balances of users.
+
+    The balances are changed with F() expressions in the database, so concurrent updates are not lost.
+
+    :param deltas: Mapping of user id to the amount that is added to the balance of that user
+    :return: Number of updated users
+    """
+    user_ids = list(deltas)
+    now = timezone.now()
+    updated = 0
+    for i in range(0, len(user_ids), BALANCE_BATCH_SIZE):
+        batch = user_ids[i:i + BALANCE_BATCH_SIZE]
+        change = Case(
+            *[When(id=user_id, then=Value(deltas[user_id])) for user_id in batch],
+            default=Value(0),
+            output_field=IntegerField()
+        )
+        updated += models.UserModel.objects.filter(id__in=batch).update(balance=F("balance") + change, modified=now)
+    return updated
+
+
+def transfer(sender_id, receiver_id, amount, reason, consumable=None, quantity=None):
+    """Move amount from sender to receiver and record it as transaction.
+
+    :param consumable: Name of the consumable the transaction pays for, if any
+    :param quantity: Number of consumables the transaction pays for
+
+    :raises UserModel.DoesNotExist: Sender or receiver does not exist. Nothing is changed in this case.
+    :return: The created TransactionModel
+    """
+    deltas = defaultdict(int)
+    deltas[sender_id] -= amount
+    deltas[receiver_id] += amount
+    with transaction.atomic():
+        if apply_balances(deltas) != len(deltas):
+            raise models.UserModel.DoesNotExist
+        return models.TransactionModel.objects.create(
+            sender_id=sender_id, receiver_id=receiver_id, amount=amount, reason=reason,
+            consumable=consumable, quantity=quantity
+        )
+
+
+def settle_communism(communism):
+    """Charge all participants of an active communism and close it.
+
+    The shares are computed in memory, the transactions are inserted with one bulk insert and every balance
+    is changed once, no matter how many participants there are.
+
+    :return: False if the communism was not active anymore, True otherwise
+    """
+    with transaction.atomic():
+        # Closing the communism first prevents concurrent requests from settling it twice
+        if not models.CommunismModel.objects.filter(id=communism.id, active=True).update(
+                active=False, modified=timezone.now()
+        ):
+            return False
+        participants = list(communism.participants.all())
+        share = communism.amount // len(participants) if participants else 0
+        deltas = defaultdict(int)
+        transactions = []
+        for participant in participants:
+            amount = share * participant.quantity
+            transactions.append(models.TransactionModel(
+                amount=amount,
+                sender_id=participant.user_id,
+                receiver_id=communism.creator_id,
+                reason=communism.reason
+            ))
+            deltas[participant.user_id] -= amount
+            deltas[communism.creator_id] += amount
+        models.TransactionModel.objects.bulk_create(transactions)
+        apply_balances(deltas)
+    communism.active = False
+    return True
+
+
+def settle_horizon(settle_delay):
+    """Return the time up to which rows created or modified so far are committed.
+
+    Timestamps are taken before a row is written, so a transaction waiting for locks can commit a row older than
+    rows committed before it. Rows younger than settle_delay seconds are not settled yet. On PostgreSQL the
+    horizon is also kept settle_delay seconds before the start of the oldest open transaction, as its rows are
+    not visible yet, no matter how long it waits for locks. That needs the database user to see the
+    transactions of the other connections in pg_stat_activity, which is the case for connections of the same
+    user.
+    """
+    horizon = timezone.now() - timedelta(seconds=settle_delay)
+    if connection.vendor == "postgresql":
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT min(xact_start) FROM pg_stat_activity "
+                "WHERE datname = current_database() AND pid <> pg_backend_pid() AND xact_start IS NOT NULL"
+            )
+            oldest = cursor.fetchone()[0]
+        if oldest is not None:
+            horizon = min(horizon, oldest - timedelta(seconds=settle_delay))
+    return horizon
+
+
+def settled(after_id, settle_delay=None):
+    """Return the transactions above a watermark which can be folded into running sums.
+
+    Ids are taken when a row is inserted, so a transaction can commit after one with a higher id. Moving a
+    watermark past it would skip it forever, transactions which are not settled yet, see settle_horizon, are
+    therefore left for the next run.
+
+    :param settle_delay: Defaults to ``LEDGER_SETTLE_DELAY``
+    :return: Tuple of the queryset of the transactions and the new watermark, or None if there are none
+    """
+    if settle_delay is None:
+        settle_delay = settings.LEDGER_SETTLE_DELAY
+    new = models.TransactionModel.objects.filter(id__gt=after_id)
+    last_id = new.filter(created__lte=settle_horizon(settle_delay)).aggregate(last=Max("id"))["last"]
+    if last_id is None:
+        return None
+    return new.filter(id__lte=last_id), last_id
+
+
+def _first_id(queryset, **lookup):
+    return Subquery(queryset.filter(id__gt=0, **lookup).order_by("created").values("id")[:1])
+
+
+def created_between(queryset, since=None, until=None):
+    """Filter a queryset of transactions or archived transactions by created.
+
+    Positive ids grow with created, the time bounds are turned into id bounds for them as well, so the rows are
+    read along an index on the id instead of filtering or sorting all rows in the range by created. The
+    carry-forward transactions of the archival have ids <= 0 but are created at the cutoff, they are filtered by
+    created alone.
+
+    :param since: Only transactions created at or after this time
+    :param until: Only transactions created before this time
+    """
+    if since is not None:
+        queryset = queryset.filter(
+            Q(id__lte=0) | Q(id__gte=_first_id(queryset, created__gte=since)), created__gte=since
+        )
+    if until is not None:
+        # Without a transaction after until, every id is below the bound
+        queryset = queryset.filter(Q(id__lte=0) | Q(id__lt=Coalesce(
+            _first_id(queryset, created__gte=until), Value(2 ** 63 - 1)
+        )), created__lt=until)
+    return queryset
@@ -0,0 +1,34 @@
+import datetime
+import time
+
+from django.core.management import BaseCommand, CommandError
+from django.utils import timezone
+
+from api import archival, models
+
+
+class Command(BaseCommand):
+    help = (
+        "Move transactions older than a cutoff to the archive, leaving one carry-forward transaction per user. "
+        "Archived transactions can still be read with getHistory?archive=1."
+    )
+
+    def add_arguments(self, parser):
+        cutoff = parser.add_mutually_exclusive_group(required=True)
+        cutoff.add_argument("--days", action="store", type=int, help="Keep the transactions of that many days")
+        cutoff.add_argument("--before", action="store", type=datetime.date.fromisoformat, help="ISO date")
+
+    def handle(self, *args, **options):
+        if options["days"] is not None:
+            before = timezone.now() - datetime.timedelta(days=options["days"])
+        else:
+            before = datetime.datetime.combine(options["before"], datetime.time(), tzinfo=datetime.timezone.utc)
+        start = time.perf_counter()
+        try:
+            archived, carried = archival.archive(before)
+        except models.UserModel.DoesNotExist:
+            raise CommandError("The community user does not exist")
+        self.stdout.write(
+            f"Archived {archived} transactions and carried {carried} balances forward "
+            f"in {time.perf_counter() - start:.2f}s"
+        )
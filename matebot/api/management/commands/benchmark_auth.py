@@ -0,0 +1,34 @@
+import secrets
+
+from django.core.management import BaseCommand
+
+from api import auth, benchmark, models
+from api.views import AuthView
+
+
+class Command(BaseCommand):
+    help = "Measure the authentication latency depending on the number of registered applications"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--steps", action="store", type=int, nargs="+", default=[1, 10, 100, 1000])
+        parser.add_argument("--repeat", action="store", type=int, default=200)
+
+    def handle(self, *args, **options):
+        view = AuthView()
+        path = "/api/v1/getUser"
+        self.stdout.write(f"{'applications':>12} {'median ms':>10} {'p99 ms':>10}")
+        with benchmark.rolled_back():
+            models.ApplicationModel.objects.all().delete()
+            existing = 0
+            for step in sorted(options["steps"]):
+                models.ApplicationModel.objects.bulk_create(
+                    models.ApplicationModel(token=secrets.token_hex(64)) for _ in range(step - existing)
+                )
+                existing = step
+                auth.token_cache.invalidate()
+                # The last application is the worst case for the previous implementation
+                application = models.ApplicationModel.objects.order_by("-id").first()
+                request = benchmark.signed_get(path, {}, application)
+                median, p99 = benchmark.measure(lambda: view._check_auth(request), options["repeat"])
+                self.stdout.write(f"{step:>12} {median:>10.3f} {p99:>10.3f}")
+        auth.token_cache.invalidate()
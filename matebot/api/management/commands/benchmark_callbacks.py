@@ -0,0 +1,42 @@
+import statistics
+import time
+
+from asgiref.sync import async_to_sync
+from django.core.management import BaseCommand
+
+from api import benchmark, callbacks, models
+
+
+class Command(BaseCommand):
+    help = "Measure throughput and latency of the callback delivery against a local stub server"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--events", action="store", type=int, default=5000)
+        parser.add_argument("--callbacks", action="store", type=int, default=4)
+        parser.add_argument("--delay", action="store", type=float, default=0.01, help="Response time of the stub")
+
+    async def deliver(self):
+        async with callbacks.session() as session:
+            dispatcher = callbacks.Dispatcher(session)
+            while await dispatcher.run_once():
+                pass
+
+    def handle(self, *args, **options):
+        with benchmark.rolled_back(), benchmark.CallbackStub(delay=options["delay"]) as stub:
+            models.ApplicationCallbackModel.objects.bulk_create(
+                models.ApplicationCallbackModel(uri=stub.uri, username="", password="")
+                for _ in range(options["callbacks"])
+            )
+            for i in range(options["events"] // options["callbacks"]):
+                callbacks.emit("benchmark", number=i)
+            start = time.perf_counter()
+            async_to_sync(self.deliver)()
+            duration = time.perf_counter() - start
+
+        self.stdout.write(f"Delivered {stub.events} events in {len(stub.batches)} requests in {duration:.2f}s")
+        self.stdout.write(f"Throughput: {stub.events / duration:.0f} events/s")
+        self.stdout.write(
+            f"Latency since emit: median {statistics.median(stub.latencies) * 1000:.0f}ms, "
+            f"max {max(stub.latencies) * 1000:.0f}ms"
+        )
+        self.stdout.write(f"Maximum concurrent requests: {stub.max_concurrency}")
@@ -0,0 +1,40 @@
+import time
+
+from django.core.management import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from api import benchmark, models
+from api.views import EndCommunismView
+
+
+class Command(BaseCommand):
+    help = "Report query count and duration of ending a communism depending on the number of participants"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--steps", action="store", type=int, nargs="+", default=[10, 100, 1000])
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{'participants':>12} {'queries':>8} {'ms':>10}")
+        with benchmark.rolled_back():
+            application = models.ApplicationModel.objects.create(token="benchmark")
+            for step in options["steps"]:
+                creator = models.UserModel.objects.create(internal=True)
+                users = models.UserModel.objects.bulk_create(models.UserModel() for _ in range(step))
+                participants = models.CommunismUserModel.objects.bulk_create(
+                    models.CommunismUserModel(user=x, quantity=1 + i % 3) for i, x in enumerate(users)
+                )
+                communism = models.CommunismModel.objects.create(creator=creator, amount=100 * step, reason="")
+                communism.participants.add(*participants)
+
+                request = benchmark.signed_post(
+                    "/api/v1/endCommunism", {"user_id": creator.id, "communism_id": communism.id}, application
+                )
+                with CaptureQueriesContext(connection) as queries:
+                    start = time.perf_counter()
+                    response = EndCommunismView.as_view()(request)
+                    duration = (time.perf_counter() - start) * 1000
+                if response.status_code != 200:
+                    self.stdout.write(self.style.ERROR(response.content.decode()))
+                    return
+                self.stdout.write(f"{step:>12} {len(queries):>8} {duration:>10.2f}")
@@ -0,0 +1,206 @@
+import json
+import platform
+import time
+import tracemalloc
+
+import django
+from django.core.management import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from api import aliases, auth, benchmark, catalogue
+from api.urls import urlpatterns
+
+SAVEPOINT_STATEMENTS = ("SAVEPOINT", "ROLLBACK TO SAVEPOINT", "RELEASE SAVEPOINT")
+
+
+def scenarios(dataset):
+    """Requests sent to the endpoints as tuples of name, method, endpoint and data.
+
+    Every endpoint in api/urls.py needs at least one scenario. Requests are built so they succeed on the
+    seeded dataset.
+    """
+    application = dataset["application"]
+    internal, external = dataset["internal"], dataset["external"]
+    communism, refund, poll = dataset["communism"], dataset["refund"], dataset["poll"]
+    voter = dataset["voter"]
+    transfer = {"sender_id": internal[0].id, "receiver_id": internal[1].id, "amount": 1, "reason": "benchmark"}
+    return [
+        ("getConsumables", "GET", "getConsumables", {}),
+        ("performTransaction", "POST", "performTransaction", transfer),
+        ("consume", "POST", "consume", {"user_id": internal[0].id, "consumable": "benchmark 0", "quantity": 2}),
+        ("getLeaderboard", "GET", "getLeaderboard", {"by": "consumed"}),
+        ("getLeaderboard?of=consumables", "GET", "getLeaderboard", {"of": "consumables"}),
+        ("getStatistics", "GET", "getStatistics", {}),
+        ("getStatistics?user_id", "GET", "getStatistics", {"user_id": internal[0].id}),
+        ("getUser", "GET", "getUser", {"amount": 100}),
+        ("getUser?filter", "GET", "getUser", {"filter": internal[0].id}),
+        ("resolveUser", "GET", "resolveUser",
+         {"application_id": application.id, "user_alias": f"{application.id}-{internal[0].id}"}),
+        ("resolveUser[100]", "POST", "resolveUser",
+         {"application_id": application.id, "user_aliases": [f"{application.id}-{x.id}" for x in internal[:100]]}),
+        ("changes", "GET", "changes", {}),
+        ("createUser", "POST", "createUser", {"application_id": application.id, "user_alias": "benchmark"}),
+        ("getHistory", "GET", "getHistory", {"target_id": internal[0].id, "amount": 100}),
+        ("exportTransactions", "GET", "exportTransactions", {}),
+        ("exportTransactions?format=jsonl", "GET", "exportTransactions", {"format": "jsonl"}),
+        ("getHistory?archive", "GET", "getHistory", {"target_id": internal[0].id, "amount": 100, "archive": 1}),
+        ("deleteUserAlias", "POST", "deleteUserAlias",
+         {"user_id": internal[0].id, "application_id": dataset["alias_application"].id}),
+        ("requestMembership", "POST", "requestMembership", {"user_id": external[2].id}),
+        ("voteMembership", "POST", "voteMembership",
+         {"user_id": voter.id, "membership_poll_id": poll.id, "positive": True}),
+        ("startVouch", "POST", "startVouch", {"user_id": internal[0].id, "target_id": external[2].id}),
+        ("endVouch", "POST", "endVouch", {"user_id": internal[0].id, "target_id": external[0].id}),
+        ("startCommunism", "POST", "startCommunism", {"user_id": internal[1].id, "amount": 100, "reason": ""}),
+        ("endCommunism", "POST", "endCommunism", {"user_id": internal[0].id, "communism_id": communism.id}),
+        ("cancelCommunism", "POST", "cancelCommunism", {"user_id": internal[0].id, "communism_id": communism.id}),
+        ("getCommunisms", "GET", "getCommunisms", {}),
+        ("getCommunisms?filter", "GET", "getCommunisms", {"filter": communism.id}),
+        ("joinCommunism", "POST", "joinCommunism", {"user_id": voter.id, "communism_id": communism.id}),
+        ("leaveCommunism", "POST", "leaveCommunism",
+         {"user_id": (dataset["participant"] or voter).id, "communism_id": communism.id}),
+        ("startRefund", "POST", "startRefund", {"user_id": internal[1].id, "amount": 100}),
+        ("cancelRefund", "POST", "cancelRefund", {"refund_id": refund.id}),
+        ("voteRefund", "POST", "voteRefund", {"user_id": voter.id, "refund_id": refund.id, "positive": True}),
+        ("retractRefundVote", "POST", "retractRefundVote",
+         {"user_id": dataset["previous_voter"].id, "refund_id": refund.id}),
+        ("batch", "POST", "batch",
+         {"operations": [{"operation": "performTransaction", "data": transfer} for _ in range(10)]}),
+    ]
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a synthetic dataset and report query count, duration and allocated memory of every endpoint. "
+        "The report is JSON, pass a previous report with --compare to list regressions."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", action="store", type=int, default=1000)
+        parser.add_argument("--aliases", action="store", type=int, default=2, help="Aliases per user")
+        parser.add_argument("--transactions", action="store", type=int, default=10000)
+        parser.add_argument("--communisms", action="store", type=int, default=100)
+        parser.add_argument("--participants", action="store", type=int, default=10, help="Per communism")
+        parser.add_argument("--votes", action="store", type=int, default=10, help="On the refund and the poll")
+        parser.add_argument("--repeat", action="store", type=int, default=20)
+        parser.add_argument("--output", action="store", help="Write the report to this file instead of stdout")
+        parser.add_argument("--compare", action="store", help="Previous report to compare against")
+        parser.add_argument(
+            "--threshold", action="store", type=float, default=0.25,
+            help="Relative increase of the median duration or memory reported as regression"
+        )
+
+    def request(self, client, application, method, endpoint, data):
+        """Send a request in a savepoint which is rolled back, so every request sees the seeded data."""
+        path = f"/api/v1/{endpoint}"
+        if method == "GET":
+            data = {x: str(y) for x, y in data.items()}
+        authorization = benchmark.authorization(application, data, path)
+        with transaction.atomic():
+            if method == "GET":
+                response = client.get(path, data, HTTP_AUTHORIZATION=authorization)
+            else:
+                response = client.post(
+                    path, json.dumps(data), content_type="application/json", HTTP_AUTHORIZATION=authorization
+                )
+            if response.streaming:
+                # Streamed bodies are read while they are sent, which is part of the request
+                b"".join(response.streaming_content)
+            transaction.set_rollback(True)
+        return response
+
+    def measure(self, client, application, scenario, repeat):
+        name, method, endpoint, data = scenario
+        # The first request fills the in-process caches, all numbers are taken afterwards
+        self.request(client, application, method, endpoint, data)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.request(client, application, method, endpoint, data)
+        # The savepoint around the request is not part of the endpoint
+        query_count = sum(1 for x in queries if not x["sql"].startswith(SAVEPOINT_STATEMENTS))
+        tracemalloc.start()
+        self.request(client, application, method, endpoint, data)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            self.request(client, application, method, endpoint, data)
+            timings.append((time.perf_counter() - start) * 1000)
+        timings.sort()
+        median, p99 = benchmark.percentiles(timings)
+        return {
+            "status": response.status_code,
+            "queries": query_count,
+            "median_ms": round(median, 3),
+            "p99_ms": round(p99, 3),
+            "peak_kb": round(peak / 1024, 1),
+        }
+
+    def compare(self, report, previous, threshold):
+        """Return the regressions of report compared to previous."""
+        regressions = []
+        for name, current in report["endpoints"].items():
+            old = previous["endpoints"].get(name)
+            if old is None:
+                continue
+            if current["queries"] > old["queries"]:
+                regressions.append(f"{name}: {old['queries']} -> {current['queries']} queries")
+            for key in ("median_ms", "peak_kb"):
+                if current[key] > old[key] * (1 + threshold):
+                    regressions.append(f"{name}: {key} {old[key]} -> {current[key]}")
+            if current["status"] != old["status"]:
+                regressions.append(f"{name}: status {old['status']} -> {current['status']}")
+        return regressions
+
+    def handle(self, *args, **options):
+        dataset_options = {
+            x: options[x] for x in ("users", "aliases", "transactions", "communisms", "participants", "votes")
+        }
+        endpoints = {}
+        with benchmark.rolled_back(), override_settings(ALLOWED_HOSTS=["*"]):
+            start = time.perf_counter()
+            dataset = benchmark.seed(**dataset_options)
+            self.stderr.write(f"Seeded dataset in {time.perf_counter() - start:.2f}s")
+            auth.token_cache.invalidate()
+            aliases.alias_cache.invalidate()
+            catalogue.consumable_cache._clear()
+            client = Client()
+            covered = set()
+            for scenario in scenarios(dataset):
+                endpoints[scenario[0]] = self.measure(client, dataset["application"], scenario, options["repeat"])
+                covered.add(scenario[2])
+                self.stderr.write(f"{scenario[0]}: {endpoints[scenario[0]]}")
+        auth.token_cache.invalidate()
+        aliases.alias_cache.invalidate()
+        catalogue.consumable_cache._clear()
+
+        missing = {str(x.pattern) for x in urlpatterns} - covered
+        if missing:
+            raise CommandError(f"No scenario for {', '.join(sorted(missing))}")
+
+        report = {
+            "environment": {
+                "python": platform.python_version(),
+                "django": django.get_version(),
+                "database": connection.vendor,
+            },
+            "dataset": dataset_options,
+            "repeat": options["repeat"],
+            "endpoints": endpoints,
+        }
+        encoded = json.dumps(report, indent=2, sort_keys=True)
+        if options["output"]:
+            with open(options["output"], "w") as fh:
+                fh.write(encoded + "\n")
+        else:
+            self.stdout.write(encoded)
+
+        if options["compare"]:
+            with open(options["compare"]) as fh:
+                regressions = self.compare(report, json.load(fh), options["threshold"])
+            for regression in regressions:
+                self.stderr.write(self.style.ERROR(regression))
+            if regressions:
+                raise CommandError(f"{len(regressions)} regressions")
@@ -0,0 +1,78 @@
+import random
+
+from django.core.management import BaseCommand
+from django.db import connection
+
+from api import benchmark, models
+
+INDEXES = [
+    "refund_active_creator_idx",
+    "poll_active_creator_idx",
+    "useralias_user_app_idx",
+]
+
+
+class Command(BaseCommand):
+    help = "Seed a large dataset and compare query plans and timings of the hot lookups with and without indexes"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", action="store", type=int, default=2000)
+        parser.add_argument("--transactions", action="store", type=int, default=200000)
+        parser.add_argument("--repeat", action="store", type=int, default=50)
+
+    def seed(self, options):
+        rng = random.Random(0)
+        application = models.ApplicationModel.objects.create(token="benchmark")
+        users = models.UserModel.objects.bulk_create(
+            (models.UserModel(internal=True) for _ in range(options["users"])), batch_size=1000
+        )
+        models.UserAliasModel.objects.bulk_create(
+            (models.UserAliasModel(user=x, application=application, user_alias=str(x.id)) for x in users),
+            batch_size=1000
+        )
+        models.TransactionModel.objects.bulk_create(
+            (
+                models.TransactionModel(sender=rng.choice(users), receiver=rng.choice(users), amount=1)
+                for _ in range(options["transactions"])
+            ),
+            batch_size=1000
+        )
+        # Most rows are closed, only a few are active like in a long running installation
+        for model in (models.CommunismModel, models.RefundModel):
+            model.objects.bulk_create(
+                (model(creator=x, amount=1, active=i % 50 == 0) for i, x in enumerate(users)), batch_size=1000
+            )
+        models.MembershipPollModel.objects.bulk_create(
+            (models.MembershipPollModel(creator=x, active=i % 50 == 0) for i, x in enumerate(users)), batch_size=1000
+        )
+        return application, users[len(users) // 2]
+
+    def queries(self, application, user):
+        return {
+            "history": models.TransactionModel.objects.filter(receiver=user).order_by("-id")[:10],
+            "active communism": models.CommunismModel.objects.filter(active=True, creator=user),
+            "active refund": models.RefundModel.objects.filter(creator=user, active=True),
+            "active poll": models.MembershipPollModel.objects.filter(active=True, creator=user),
+            "user alias": models.UserAliasModel.objects.filter(user=user, application=application),
+        }
+
+    def report(self, title, queries, repeat):
+        self.stdout.write(self.style.MIGRATE_HEADING(title))
+        for name, queryset in queries.items():
+            median, p99 = benchmark.measure(lambda: list(queryset.all()), repeat)
+            self.stdout.write(f"{name}: median {median:.3f}ms, p99 {p99:.3f}ms")
+            for line in queryset.explain().splitlines():
+                self.stdout.write(f"    {line}")
+
+    def handle(self, *args, **options):
+        for with_indexes in (False, True):
+            with benchmark.rolled_back():
+                if not with_indexes:
+                    with connection.cursor() as cursor:
+                        for name in INDEXES:
+                            cursor.execute(f"DROP INDEX {connection.ops.quote_name(name)}")
+                application, user = self.seed(options)
+                title = "With indexes" if with_indexes else "Without indexes"
+                self.report(title, self.queries(application, user), options["repeat"])
+            # A new connection doesn't reuse statements prepared for the other schema
+            connection.close()
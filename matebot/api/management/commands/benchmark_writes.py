@@ -0,0 +1,78 @@
+import random
+import threading
+import time
+
+from django.core.management import BaseCommand, CommandError
+from django.db import OperationalError, connection
+
+from api import benchmark, ledger, models
+from matebot import settings
+
+REASON = "benchmark_writes"
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure the write throughput of the configured database with concurrent transfers. "
+        "The transfers are committed, so this only runs against a separate, empty database, "
+        "e.g. with MATEBOT_DATABASE_NAME set to a new file after running migrate there."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", action="store", type=int, nargs="+", default=[1, 4, 16])
+        parser.add_argument("--transfers", action="store", type=int, default=250, help="Per thread")
+        parser.add_argument("--users", action="store", type=int, default=100)
+
+    def run(self, user_ids, threads, transfers):
+        latencies, retries = [], [0]
+        lock = threading.Lock()
+
+        def worker(seed):
+            rng = random.Random(seed)
+            own_latencies, own_retries = [], 0
+            try:
+                for _ in range(transfers):
+                    sender_id, receiver_id = rng.sample(user_ids, 2)
+                    start = time.perf_counter()
+                    while True:
+                        try:
+                            ledger.transfer(sender_id, receiver_id, 1, REASON)
+                            break
+                        except OperationalError:
+                            # SQLite reports some lock conflicts at once instead of waiting for busy_timeout
+                            own_retries += 1
+                            time.sleep(0.001)
+                    own_latencies.append((time.perf_counter() - start) * 1000)
+            finally:
+                connection.close()
+            with lock:
+                latencies.extend(own_latencies)
+                retries[0] += own_retries
+
+        workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+        start = time.perf_counter()
+        [x.start() for x in workers]
+        [x.join() for x in workers]
+        duration = time.perf_counter() - start
+        latencies.sort()
+        return len(latencies) / duration, *benchmark.percentiles(latencies), retries[0]
+
+    def handle(self, *args, **options):
+        # Committed transfers can not be rolled back, they would change balances and the ledger of real users
+        if models.UserModel.objects.exists():
+            raise CommandError("The database contains users, run the benchmark against a separate, empty database")
+        database = settings.DATABASES["default"]
+        self.stdout.write(f"{database['ENGINE']}, CONN_MAX_AGE={database.get('CONN_MAX_AGE', 0)}")
+        if connection.vendor == "sqlite":
+            self.stdout.write(", ".join(f"{x}={y}" for x, y in settings.SQLITE_PRAGMAS.items()))
+
+        users = models.UserModel.objects.bulk_create(models.UserModel() for _ in range(options["users"]))
+        user_ids = [x.id for x in users]
+        try:
+            self.stdout.write(f"{'threads':>8} {'transfers/s':>12} {'median ms':>10} {'p99 ms':>10} {'retries':>8}")
+            for threads in options["threads"]:
+                throughput, median, p99, retries = self.run(user_ids, threads, options["transfers"])
+                self.stdout.write(f"{threads:>8} {throughput:>12.0f} {median:>10.2f} {p99:>10.2f} {retries:>8}")
+        finally:
+            models.TransactionModel.objects.filter(reason=REASON).delete()
+            models.UserModel.objects.filter(id__in=user_ids).delete()
@@ -0,0 +1,26 @@
+
+from asgiref.sync import async_to_sync
+from django.core.management import BaseCommand
+
+from api import callbacks
+
+
+class Command(BaseCommand):
+    help = "Run the worker delivering queued events to the application callbacks"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Send all due events and exit")
+
+    def handle(self, *args, **options):
+        async_to_sync(self.run)(options["once"])
+
+    async def run(self, once):
+        async with callbacks.session() as session:
+            dispatcher = callbacks.Dispatcher(session)
+            if once:
+                delivered = 0
+                while sent := await dispatcher.run_once():
+                    delivered += sent
+                self.stdout.write(self.style.SUCCESS(f"Delivered {delivered} events"))
+            else:
+                await dispatcher.run_forever()
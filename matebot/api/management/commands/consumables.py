@@ -1,36 +1,84 @@
 import json
+import time
 
 from django.core.management import BaseCommand
+from django.db import transaction
 
-from api import models
+from api import catalogue, models
+
+FIELDS = ["description", "price", "symbol"]
 
 
 class Command(BaseCommand):
     help = "Command to import consumables from a json file"
 
     def add_arguments(self, parser):
-        parser.add_argument("--path", action="store")
+        parser.add_argument("--path", action="store", required=True)
+        parser.add_argument("--dry-run", action="store_true", help="Only print the changes")
 
     def handle(self, *args, **options):
-        self.stdout.write(self.style.ERROR("Deleting all old consumables"))
-        [x.delete() for x in models.ConsumableModel.objects.all()]
+        start = time.perf_counter()
         with open(options["path"]) as fh:
             decoded = json.load(fh)
-            if "consumables" not in decoded:
-                raise ValueError
-            if not isinstance(decoded["consumables"], dict):
-                raise ValueError
-            for name in decoded["consumables"]:
-                consumable = decoded["consumables"][name]
-                messages = []
+        if "consumables" not in decoded:
+            raise ValueError
+        if not isinstance(decoded["consumables"], dict):
+            raise ValueError
+        wanted = decoded["consumables"]
+
+        with transaction.atomic():
+            existing = models.ConsumableModel.objects.prefetch_related("messages").in_bulk(field_name="name")
+            deleted = [x for x in existing if x not in wanted]
+            created = [models.ConsumableModel(name=x, **{y: wanted[x][y] for y in FIELDS}) for x in wanted
+                       if x not in existing]
+            updated = []
+            for name, consumable in existing.items():
+                if name in wanted and any(getattr(consumable, x) != wanted[name][x] for x in FIELDS):
+                    for field in FIELDS:
+                        setattr(consumable, field, wanted[name][field])
+                    updated.append(consumable)
+
+            for name in deleted:
+                self.stdout.write(self.style.ERROR(f"Delete consumable {name}"))
+            for consumable in created:
+                self.stdout.write(self.style.SUCCESS(f"Add consumable {consumable.name}"))
+            for consumable in updated:
+                self.stdout.write(self.style.WARNING(f"Update consumable {consumable.name}"))
+
+            # Messages are diffed by their text, unchanged messages are kept
+            added_messages, removed_messages = [], []
+            for name, consumable in wanted.items():
+                current = {x.message: x for x in existing[name].messages.all()} if name in existing else {}
                 for message in consumable["messages"]:
-                    messages.append(models.ConsumableMessageModel.objects.create(message=message).id)
-                c = models.ConsumableModel.objects.create(
-                    name=name,
-                    description=consumable["description"],
-                    price=consumable["price"],
-                    symbol=consumable["symbol"]
+                    if message not in current:
+                        added_messages.append((name, message))
+                        self.stdout.write(self.style.SUCCESS(f"Add message to {name}: {message}"))
+                removed_messages.extend(x for x in current.values() if x.message not in consumable["messages"])
+            for name in deleted:
+                removed_messages.extend(existing[name].messages.all())
+
+            if not options["dry_run"]:
+                models.ConsumableModel.objects.filter(name__in=deleted).delete()
+                models.ConsumableMessageModel.objects.filter(id__in=[x.id for x in removed_messages]).delete()
+                models.ConsumableModel.objects.bulk_create(created)
+                models.ConsumableModel.objects.bulk_update(updated, FIELDS)
+                messages = models.ConsumableMessageModel.objects.bulk_create(
+                    models.ConsumableMessageModel(message=x) for _, x in added_messages
+                )
+                consumable_ids = dict(
+                    models.ConsumableModel.objects.filter(name__in=wanted).values_list("name", "id")
                 )
-                [c.messages.add(x) for x in messages]
-                c.save()
-                self.stdout.write(self.style.SUCCESS(f"Added consumable {name}"))
+                through = models.ConsumableModel.messages.through
+                through.objects.bulk_create(
+                    through(consumablemodel_id=consumable_ids[name], consumablemessagemodel_id=message.id)
+                    for (name, _), message in zip(added_messages, messages)
+                )
+                catalogue.consumable_cache.invalidate()
+
+        self.stdout.write(
+            f"{len(created)} added, {len(updated)} updated, {len(deleted)} deleted, "
+            f"{len(added_messages)} messages added, {len(removed_messages)} messages removed "
+            f"in {time.perf_counter() - start:.3f}s"
+        )
+        if options["dry_run"]:
+            self.stdout.write(self.style.WARNING("Dry run, nothing was changed"))
@@ -0,0 +1,34 @@
+import datetime
+import time
+
+from django.core.management import BaseCommand, CommandError
+
+from api import export
+
+
+def _date(value):
+    return datetime.datetime.combine(datetime.date.fromisoformat(value), datetime.time(), tzinfo=datetime.timezone.utc)
+
+
+class Command(BaseCommand):
+    help = "Export the transactions for accounting as csv, jsonl or parquet"
+
+    def add_arguments(self, parser):
+        parser.add_argument("output", help="File the export is written to")
+        parser.add_argument("--format", action="store", choices=list(export.FORMATS), default="csv")
+        parser.add_argument("--since", action="store", type=_date, help="ISO date of the first exported day")
+        parser.add_argument("--until", action="store", type=_date, help="ISO date of the first day not exported")
+        parser.add_argument("--archive", action="store_true", help="Include the archived transactions")
+
+    def handle(self, *args, **options):
+        try:
+            content = export.export(options["format"], options["since"], options["until"], options["archive"])
+        except ValueError as error:
+            raise CommandError(error)
+        start = time.perf_counter()
+        size = 0
+        with open(options["output"], "wb") as file:
+            for chunk in content:
+                file.write(chunk)
+                size += len(chunk)
+        self.stdout.write(f"Wrote {size / 1024:.0f} KiB to {options['output']} in {time.perf_counter() - start:.2f}s")
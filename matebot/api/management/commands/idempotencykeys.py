@@ -0,0 +1,10 @@
+from django.core.management import BaseCommand
+
+from api import idempotency
+
+
+class Command(BaseCommand):
+    help = "Delete expired idempotency keys, meant to be run periodically"
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"Deleted {idempotency.prune()} expired idempotency keys")
@@ -0,0 +1,75 @@
+import asyncio
+import time
+
+import aiohttp
+import rc_protocol
+from django.core.management import BaseCommand
+from yarl import URL
+
+from api import benchmark
+
+
+class Command(BaseCommand):
+    help = (
+        "Send signed GET requests to running deployments and report requests per second and latency. "
+        "To compare WSGI and ASGI, serve the same database with a WSGI server (e.g. gunicorn matebot.wsgi "
+        "--bind :8000) and an ASGI server (e.g. uvicorn matebot.asgi:application --port 8001) and pass both "
+        "with --url, they are reported side by side."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--url", action="append", dest="urls",
+            help="Base URL of the API, default http://127.0.0.1:8000/api/v1/. Can be given multiple times."
+        )
+        parser.add_argument("--id", action="store", dest="application_id", required=True)
+        parser.add_argument("--token", action="store", required=True)
+        parser.add_argument(
+            "--endpoint", action="append", dest="endpoints",
+            help="Endpoint with optional query, e.g. getHistory?target_id=1. Can be given multiple times."
+        )
+        parser.add_argument("--concurrency", action="store", type=int, default=50)
+        parser.add_argument("--duration", action="store", type=float, default=10)
+
+    async def client(self, session, url, path, params, options, deadline, results):
+        while time.perf_counter() < deadline:
+            checksum = rc_protocol.get_checksum(params, options["token"], salt=path)
+            start = time.perf_counter()
+            try:
+                async with session.get(
+                        url, params=params, headers={"Authorization": f"RCP {options['application_id']}:{checksum}"}
+                ) as response:
+                    await response.read()
+                    ok = response.status == 200
+            except aiohttp.ClientError:
+                ok = False
+            results.append((ok, time.perf_counter() - start))
+
+    async def run(self, url, endpoint, options):
+        name, _, query = endpoint.partition("?")
+        params = dict(x.split("=", 1) for x in query.split("&") if x)
+        url = url.rstrip("/") + "/" + name
+        path = URL(url).path
+        results = []
+        connector = aiohttp.TCPConnector(limit=options["concurrency"])
+        async with aiohttp.ClientSession(connector=connector) as session:
+            start = time.perf_counter()
+            deadline = start + options["duration"]
+            await asyncio.gather(*(
+                self.client(session, url, path, params, options, deadline, results)
+                for _ in range(options["concurrency"])
+            ))
+            duration = time.perf_counter() - start
+        latencies = sorted(x[1] * 1000 for x in results)
+        errors = sum(1 for x in results if not x[0])
+        return len(results) / duration, *benchmark.percentiles(latencies), errors
+
+    def handle(self, *args, **options):
+        urls = options["urls"] or ["http://127.0.0.1:8000/api/v1/"]
+        width = max(len(x) for x in urls)
+        for endpoint in options["endpoints"] or ["getUser", "getCommunisms", "getConsumables"]:
+            self.stdout.write(endpoint)
+            self.stdout.write(f"  {'server':<{width}} {'req/s':>8} {'median ms':>10} {'p99 ms':>10} {'errors':>7}")
+            for url in urls:
+                throughput, median, p99, errors = asyncio.run(self.run(url, endpoint, options))
+                self.stdout.write(f"  {url:<{width}} {throughput:>8.0f} {median:>10.1f} {p99:>10.1f} {errors:>7}")
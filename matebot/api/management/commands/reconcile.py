@@ -0,0 +1,28 @@
+import time
+
+from django.core.management import BaseCommand
+
+from api import reconciliation
+
+
+class Command(BaseCommand):
+    help = "Check the balances of all users against the transaction ledger"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rebuild", action="store_true", help="Read the whole ledger instead of new rows only")
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        if options["rebuild"]:
+            reconciliation.reset()
+        folded = reconciliation.fold()
+        self.stdout.write(f"Folded {folded} new transactions in {time.perf_counter() - start:.2f}s")
+        start = time.perf_counter()
+        drifts = reconciliation.drift()
+        self.stdout.write(f"Checked balances in {time.perf_counter() - start:.2f}s")
+        for user_id, balance, ledger_balance in drifts:
+            self.stdout.write(self.style.ERROR(
+                f"User {user_id}: balance {balance} does not match ledger {ledger_balance}"
+            ))
+        if not drifts:
+            self.stdout.write(self.style.SUCCESS("All balances match the ledger"))
@@ -0,0 +1,21 @@
+import time
+
+from django.core.management import BaseCommand
+
+from api import rollups
+
+
+class Command(BaseCommand):
+    help = "Fold new transactions into the statistics, meant to be run periodically"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--rebuild", action="store_true", help="Drop the statistics and backfill them from the whole ledger"
+        )
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        if options["rebuild"]:
+            rollups.reset()
+        folded = rollups.fold()
+        self.stdout.write(f"Folded {folded} new transactions in {time.perf_counter() - start:.2f}s")
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.30 on 2026-10-17 18:38
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_rename_accessed_communismmodel_modified_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LedgerSumModel',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to='api.usermodel')),
+                ('amount', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ReconciliationModel',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_transaction_id', models.BigIntegerField(default=0)),
+                ('modified', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
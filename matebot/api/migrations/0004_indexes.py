@@ -0,0 +1,37 @@
+# Generated by Django 4.2.30 on 2026-10-17 18:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_reconciliation'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='communismmodel',
+            index=models.Index(fields=['active', 'creator'], name='communism_active_creator_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='membershippollmodel',
+            index=models.Index(condition=models.Q(('active', True)), fields=['creator'], name='poll_active_creator_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='refundmodel',
+            index=models.Index(condition=models.Q(('active', True)), fields=['creator'], name='refund_active_creator_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transactionmodel',
+            index=models.Index(fields=['receiver', '-id'], name='transaction_receiver_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transactionmodel',
+            index=models.Index(fields=['sender', '-id'], name='transaction_sender_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='useraliasmodel',
+            index=models.Index(fields=['user', 'application'], name='useralias_user_app_idx'),
+        ),
+    ]
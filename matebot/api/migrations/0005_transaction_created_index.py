@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-17 18:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transactionmodel',
+            index=models.Index(fields=['created'], name='transaction_created_idx'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 4.2.30 on 2026-10-17 18:46
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_transaction_created_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CallbackEventModel',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event', models.CharField(max_length=255)),
+                ('data', models.JSONField(default=dict)),
+                ('attempts', models.IntegerField(default=0)),
+                ('next_attempt', models.DateTimeField(default=django.utils.timezone.now)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('callback', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.applicationcallbackmodel')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['next_attempt'], name='callbackevent_next_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.30 on 2026-10-17 18:55
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_callback_events'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IdempotencyKeyModel',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=255)),
+                ('path', models.CharField(max_length=255)),
+                ('fingerprint', models.CharField(max_length=64)),
+                ('status', models.IntegerField()),
+                ('response', models.BinaryField()),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('application', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.applicationmodel')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['created'], name='idempotencykey_created_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='idempotencykeymodel',
+            constraint=models.UniqueConstraint(fields=('application', 'key'), name='idempotencykey_unique'),
+        ),
+    ]
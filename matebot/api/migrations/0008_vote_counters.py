@@ -0,0 +1,44 @@
+# Generated by Django 4.2.30 on 2026-10-17 18:56
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_idempotency_keys'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='membershippollmodel',
+            name='negative_votes',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='membershippollmodel',
+            name='positive_votes',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='refundmodel',
+            name='negative_votes',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='refundmodel',
+            name='positive_votes',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='votemodel',
+            name='membership_poll',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.membershippollmodel'),
+        ),
+        migrations.AddField(
+            model_name='votemodel',
+            name='refund',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.refundmodel'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.30 on 2026-10-17 18:56
+
+from django.db import migrations
+
+
+def move_votes(apps, schema_editor):
+    """Attach each vote to its refund or poll directly and count the votes.
+
+    Only the newest vote of a user is kept, older votes a user replaced before were never deleted.
+    """
+    VoteModel = apps.get_model("api", "VoteModel")
+    for model_name, field in (("RefundModel", "refund"), ("MembershipPollModel", "membership_poll")):
+        model = apps.get_model("api", model_name)
+        for poll in model.objects.prefetch_related("votes"):
+            latest = {}
+            for vote in sorted(poll.votes.all(), key=lambda x: x.id):
+                latest[vote.user_id] = vote
+            VoteModel.objects.filter(id__in=[x.id for x in latest.values()]).update(**{field: poll})
+            poll.positive_votes = sum(1 for x in latest.values() if x.positive)
+            poll.negative_votes = sum(1 for x in latest.values() if not x.positive)
+            poll.save(update_fields=["positive_votes", "negative_votes"])
+    VoteModel.objects.filter(refund=None, membership_poll=None).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_vote_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(move_votes, migrations.RunPython.noop),
+    ]
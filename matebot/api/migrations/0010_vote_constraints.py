@@ -0,0 +1,40 @@
+# Generated by Django 4.2.30 on 2026-10-17 18:56
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_move_votes'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='membershippollmodel',
+            name='votes',
+        ),
+        migrations.RemoveField(
+            model_name='refundmodel',
+            name='votes',
+        ),
+        migrations.AlterField(
+            model_name='votemodel',
+            name='membership_poll',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='votes', to='api.membershippollmodel'),
+        ),
+        migrations.AlterField(
+            model_name='votemodel',
+            name='refund',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='votes', to='api.refundmodel'),
+        ),
+        migrations.AddConstraint(
+            model_name='votemodel',
+            constraint=models.UniqueConstraint(fields=('refund', 'user'), name='vote_refund_user_unique'),
+        ),
+        migrations.AddConstraint(
+            model_name='votemodel',
+            constraint=models.UniqueConstraint(fields=('membership_poll', 'user'), name='vote_poll_user_unique'),
+        ),
+    ]
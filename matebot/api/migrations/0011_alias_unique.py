@@ -0,0 +1,45 @@
+# Generated by Django 4.2.30 on 2026-10-17 19:05
+
+from django.db import migrations, models
+
+
+def remove_duplicate_aliases(apps, schema_editor):
+    """Remove repeated aliases of the same user, before an alias can only be used once per application.
+
+    If an alias is used by different users of an application, it is unclear which user it belongs to. The
+    migration is aborted then and lists those aliases, they have to be resolved by hand first.
+    """
+    UserAliasModel = apps.get_model("api", "UserAliasModel")
+    duplicates = (
+        UserAliasModel.objects.values("application_id", "user_alias")
+        .annotate(count=models.Count("id"), users=models.Count("user_id", distinct=True))
+        .filter(count__gt=1)
+        .order_by("application_id", "user_alias")
+    )
+    conflicts = [(x["application_id"], x["user_alias"]) for x in duplicates if x["users"] > 1]
+    if conflicts:
+        raise RuntimeError(
+            "Aliases used by more than one user of an application, keep one user per alias and migrate again: "
+            + ", ".join(f"application {x} alias {y!r}" for x, y in conflicts)
+        )
+    for duplicate in duplicates:
+        # All rows belong to the same user, the oldest one is kept
+        aliases = UserAliasModel.objects.filter(
+            application_id=duplicate["application_id"], user_alias=duplicate["user_alias"]
+        ).order_by("id")
+        aliases.exclude(id=aliases[0].id).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_vote_constraints'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_aliases, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='useraliasmodel',
+            constraint=models.UniqueConstraint(fields=('application', 'user_alias'), name='useralias_app_alias_unique'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.30 on 2026-10-17 19:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_alias_unique'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='communismmodel',
+            index=models.Index(fields=['modified', 'id'], name='communism_modified_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='usermodel',
+            index=models.Index(fields=['modified', 'id'], name='user_modified_idx'),
+        ),
+    ]
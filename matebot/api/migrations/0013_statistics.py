@@ -0,0 +1,90 @@
+# Generated by Django 4.2.30 on 2026-10-17 19:13
+
+from django.db import migrations, models
+import django.db.models.deletion
+import re
+
+
+def tag_consumptions(apps, schema_editor):
+    """Set consumable and quantity of the transactions written by the consume endpoint from their reason."""
+    TransactionModel = apps.get_model("api", "TransactionModel")
+    pattern = re.compile(r"consume: (\d+)x (.+)")
+    for transaction in TransactionModel.objects.filter(reason__startswith="consume: ").iterator():
+        match = pattern.fullmatch(transaction.reason)
+        if match is not None:
+            transaction.quantity = int(match[1])
+            transaction.consumable = match[2]
+            transaction.save(update_fields=["consumable", "quantity"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_modified_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StatisticStateModel',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_transaction_id', models.BigIntegerField(default=0)),
+                ('modified', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='transactionmodel',
+            name='consumable',
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+        migrations.AddField(
+            model_name='transactionmodel',
+            name='quantity',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='UserStatisticModel',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to='api.usermodel')),
+                ('sent', models.BigIntegerField(default=0)),
+                ('received', models.BigIntegerField(default=0)),
+                ('consumed', models.BigIntegerField(default=0)),
+                ('quantity', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['-sent', 'user'], name='userstat_sent_idx'), models.Index(fields=['-received', 'user'], name='userstat_received_idx'), models.Index(fields=['-consumed', 'user'], name='userstat_consumed_idx'), models.Index(fields=['-quantity', 'user'], name='userstat_quantity_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ConsumableStatisticModel',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('quantity', models.BigIntegerField(default=0)),
+                ('amount', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['-quantity', 'name'], name='consumablestat_quantity_idx'), models.Index(fields=['-amount', 'name'], name='consumablestat_amount_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyStatisticModel',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('consumable', models.CharField(blank=True, default='', max_length=255)),
+                ('transactions', models.IntegerField(default=0)),
+                ('amount', models.BigIntegerField(default=0)),
+                ('quantity', models.BigIntegerField(default=0)),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='api.usermodel')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['day'], name='dailystat_day_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='dailystatisticmodel',
+            constraint=models.UniqueConstraint(fields=('user', 'consumable', 'day'), name='dailystat_unique'),
+        ),
+        migrations.RunPython(tag_consumptions, migrations.RunPython.noop),
+    ]
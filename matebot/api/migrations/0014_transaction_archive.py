@@ -0,0 +1,30 @@
+# Generated by Django 4.2.30 on 2026-10-17 19:17
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_statistics'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedTransactionModel',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('amount', models.IntegerField()),
+                ('reason', models.CharField(blank=True, default='', max_length=255)),
+                ('consumable', models.CharField(blank=True, max_length=255, null=True)),
+                ('quantity', models.IntegerField(blank=True, null=True)),
+                ('created', models.DateTimeField()),
+                ('receiver', models.ForeignKey(on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='api.usermodel')),
+                ('sender', models.ForeignKey(on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='api.usermodel')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['receiver', '-id'], name='archived_receiver_idx'), models.Index(fields=['sender', '-id'], name='archived_sender_idx'), models.Index(fields=['created'], name='archived_created_idx')],
+            },
+        ),
+    ]
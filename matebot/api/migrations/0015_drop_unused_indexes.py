@@ -0,0 +1,25 @@
+# Generated by Django 4.2.30 on 2026-10-17 19:57
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_transaction_archive'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='communismmodel',
+            name='communism_active_creator_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='transactionmodel',
+            name='transaction_receiver_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='transactionmodel',
+            name='transaction_sender_idx',
+        ),
+    ]
@@ -1,5 +1,7 @@
 from django.db import models
-from django.db.models import CharField, IntegerField, BooleanField, ForeignKey, DateTimeField, ManyToManyField
+from django.db.models import CharField, IntegerField, BooleanField, ForeignKey, DateTimeField, ManyToManyField, \
+    Prefetch, OneToOneField, F, BigIntegerField, Index, Q, JSONField, BinaryField, UniqueConstraint, DateField
+from django.utils import timezone
 
 
 class ApplicationModel(models.Model):
@@ -10,6 +12,44 @@ class ApplicationModel(models.Model):
     token = CharField(max_length=255)
 
 
+class IdempotencyKeyModel(models.Model):
+    """Response stored for an Idempotency-Key sent by an application.
+
+    A retried request with the same key gets the stored response instead of running again. Keys expire after
+    ``IDEMPOTENCY_KEY_TTL`` seconds.
+    """
+    application = ForeignKey(ApplicationModel, on_delete=models.CASCADE)
+    key = CharField(max_length=255)
+    path = CharField(max_length=255)
+    fingerprint = CharField(max_length=64)
+    status = IntegerField()
+    response = BinaryField()
+    created = DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            UniqueConstraint(fields=["application", "key"], name="idempotencykey_unique"),
+        ]
+        indexes = [
+            Index(fields=["created"], name="idempotencykey_created_idx"),
+        ]
+
+
+class UserQuerySet(models.QuerySet):
+    def with_relations(self):
+        """Prefetch the relations used by UserModel.to_dict.
+
+        Serializing the queryset then costs three queries, independent of the number of users.
+        """
+        return self.prefetch_related(
+            Prefetch("usermodel_set", queryset=UserModel.objects.only("id", "voucher_id")),
+            Prefetch(
+                "useraliasmodel_set",
+                queryset=UserAliasModel.objects.only("user_id", "application_id", "user_alias")
+            )
+        )
+
+
 class UserModel(models.Model):
     """This represents the basic user.
 
@@ -24,6 +64,16 @@ class UserModel(models.Model):
     created = DateTimeField(auto_now_add=True)
     modified = DateTimeField(auto_now=True)
 
+    objects = UserQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            Index(fields=["modified", "id"], name="user_modified_idx"),
+        ]
+
+    def __str__(self):
+        return self.name or f"User {self.id}"
+
     def to_dict(self):
         return {
             "identifier": self.id,
@@ -48,6 +98,15 @@ class UserAliasModel(models.Model):
     application = ForeignKey(ApplicationModel, on_delete=models.CASCADE)
     user = ForeignKey(UserModel, on_delete=models.CASCADE)
 
+    class Meta:
+        constraints = [
+            # Also serves resolving an alias to its user
+            UniqueConstraint(fields=["application", "user_alias"], name="useralias_app_alias_unique"),
+        ]
+        indexes = [
+            Index(fields=["user", "application"], name="useralias_user_app_idx"),
+        ]
+
     def __str__(self):
         return self.user_alias
 
@@ -62,16 +121,53 @@ class ApplicationCallbackModel(models.Model):
     password = CharField(max_length=255)
 
 
+class CallbackEventModel(models.Model):
+    """Outbox of events that still have to be sent to a callback.
+
+    Events are written in the same database transaction as the change they describe and are deleted once
+    they have been delivered.
+    """
+    callback = ForeignKey(ApplicationCallbackModel, on_delete=models.CASCADE)
+    event = CharField(max_length=255)
+    data = JSONField(default=dict)
+    attempts = IntegerField(default=0)
+    next_attempt = DateTimeField(default=timezone.now)
+    created = DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            Index(fields=["next_attempt"], name="callbackevent_next_idx"),
+        ]
+
+    def to_dict(self):
+        return {
+            "identifier": self.id,
+            "event": self.event,
+            "data": self.data,
+            "created": self.created.timestamp()
+        }
+
+
 class TransactionModel(models.Model):
     """This model represents a transaction between two users"""
     sender = ForeignKey(UserModel, on_delete=models.DO_NOTHING, related_name="transaction_sender")
     receiver = ForeignKey(UserModel, on_delete=models.DO_NOTHING, related_name="transaction_receiver")
     amount = IntegerField()
     reason = CharField(max_length=255, default="", blank=True)
+    # Name and quantity of the consumable if the transaction paid for one
+    consumable = CharField(max_length=255, null=True, blank=True)
+    quantity = IntegerField(null=True, blank=True)
     created = DateTimeField(auto_now_add=True)
 
+    class Meta:
+        # The history of a user is read from the indexes of the foreign keys, they also hold the id
+        indexes = [
+            Index(fields=["created"], name="transaction_created_idx"),
+        ]
+
     def to_dict(self):
         return {
+            "identifier": self.id,
             "sender_id": self.sender_id,
             "receiver_id": self.receiver_id,
             "amount": self.amount,
@@ -80,6 +176,140 @@ class TransactionModel(models.Model):
         }
 
 
+class ArchivedTransactionModel(models.Model):
+    """Transaction moved out of TransactionModel by the archive command.
+
+    The id of the transaction is kept, so the archive continues the history where the ledger ends.
+    """
+    id = BigIntegerField(primary_key=True)
+    sender = ForeignKey(UserModel, on_delete=models.DO_NOTHING, related_name="+")
+    receiver = ForeignKey(UserModel, on_delete=models.DO_NOTHING, related_name="+")
+    amount = IntegerField()
+    reason = CharField(max_length=255, default="", blank=True)
+    consumable = CharField(max_length=255, null=True, blank=True)
+    quantity = IntegerField(null=True, blank=True)
+    created = DateTimeField()
+
+    class Meta:
+        indexes = [
+            Index(fields=["receiver", "-id"], name="archived_receiver_idx"),
+            Index(fields=["sender", "-id"], name="archived_sender_idx"),
+            Index(fields=["created"], name="archived_created_idx"),
+        ]
+
+    to_dict = TransactionModel.to_dict
+
+
+class LedgerSumModel(models.Model):
+    """Running sum of all transactions of a user up to the watermark of the reconciliation.
+
+    If the ledger and the balances agree, this equals the balance of the user.
+    """
+    user = OneToOneField(UserModel, on_delete=models.CASCADE, primary_key=True)
+    amount = IntegerField(default=0)
+
+
+class ReconciliationModel(models.Model):
+    """State of the incremental reconciliation.
+
+    Only transactions with an id above last_transaction_id are folded into the LedgerSumModels on the next run.
+    """
+    last_transaction_id = BigIntegerField(default=0)
+
+    modified = DateTimeField(auto_now=True)
+
+
+class UserStatisticModel(models.Model):
+    """Totals of all transactions of a user up to the watermark of the statistics."""
+    user = OneToOneField(UserModel, on_delete=models.CASCADE, primary_key=True)
+    sent = BigIntegerField(default=0)
+    received = BigIntegerField(default=0)
+    consumed = BigIntegerField(default=0)
+    quantity = BigIntegerField(default=0)
+
+    class Meta:
+        # Serve the leaderboards without sorting
+        indexes = [
+            Index(fields=["-sent", "user"], name="userstat_sent_idx"),
+            Index(fields=["-received", "user"], name="userstat_received_idx"),
+            Index(fields=["-consumed", "user"], name="userstat_consumed_idx"),
+            Index(fields=["-quantity", "user"], name="userstat_quantity_idx"),
+        ]
+
+    def to_dict(self):
+        return {
+            "user_id": self.user_id,
+            "sent": self.sent,
+            "received": self.received,
+            "consumed": self.consumed,
+            "quantity": self.quantity
+        }
+
+
+class ConsumableStatisticModel(models.Model):
+    """Totals of all purchases of a consumable up to the watermark of the statistics.
+
+    Consumables are referenced by name, so the numbers survive removing a consumable from the catalogue.
+    """
+    name = CharField(max_length=255, unique=True)
+    quantity = BigIntegerField(default=0)
+    amount = BigIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            Index(fields=["-quantity", "name"], name="consumablestat_quantity_idx"),
+            Index(fields=["-amount", "name"], name="consumablestat_amount_idx"),
+        ]
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "quantity": self.quantity,
+            "amount": self.amount
+        }
+
+
+class DailyStatisticModel(models.Model):
+    """Totals of the transactions of a single day.
+
+    Rows without user and consumable cover all transactions, rows with a user the transactions sent by that user
+    and rows with a consumable all purchases of that consumable.
+    """
+    day = DateField()
+    user = ForeignKey(UserModel, on_delete=models.CASCADE, null=True, blank=True)
+    consumable = CharField(max_length=255, default="", blank=True)
+    transactions = IntegerField(default=0)
+    amount = BigIntegerField(default=0)
+    quantity = BigIntegerField(default=0)
+
+    class Meta:
+        # Also serves the time series of a user or consumable
+        constraints = [
+            UniqueConstraint(fields=["user", "consumable", "day"], name="dailystat_unique"),
+        ]
+        indexes = [
+            Index(fields=["day"], name="dailystat_day_idx"),
+        ]
+
+    def to_dict(self):
+        return {
+            "day": self.day.isoformat(),
+            "transactions": self.transactions,
+            "amount": self.amount,
+            "quantity": self.quantity
+        }
+
+
+class StatisticStateModel(models.Model):
+    """State of the incremental statistics.
+
+    Only transactions with an id above last_transaction_id are folded into the statistics on the next run.
+    """
+    last_transaction_id = BigIntegerField(default=0)
+
+    modified = DateTimeField(auto_now=True)
+
+
 class ConsumableMessageModel(models.Model):
     """This represents a message that is sent when a consumable is consumed."""
     message = CharField(max_length=255)
@@ -95,6 +325,7 @@ class ConsumableModel(models.Model):
 
     def to_dict(self):
         return {
+            "identifier": self.id,
             "name": self.name,
             "description": self.description,
             "price": self.price,
@@ -104,35 +335,99 @@ class ConsumableModel(models.Model):
 
 
 class VoteModel(models.Model):
-    """Model that is used to represent a single Vote."""
+    """Model that is used to represent a single Vote.
+
+    A vote belongs to either a refund or a membership poll, every user has at most one vote on each.
+    """
     positive = BooleanField()
     user = ForeignKey(UserModel, on_delete=models.DO_NOTHING)
+    refund = ForeignKey("RefundModel", on_delete=models.CASCADE, null=True, blank=True, related_name="votes")
+    membership_poll = ForeignKey(
+        "MembershipPollModel", on_delete=models.CASCADE, null=True, blank=True, related_name="votes"
+    )
 
     modified = DateTimeField(auto_now=True)
 
+    class Meta:
+        constraints = [
+            UniqueConstraint(fields=["refund", "user"], name="vote_refund_user_unique"),
+            UniqueConstraint(fields=["membership_poll", "user"], name="vote_poll_user_unique"),
+        ]
+
 
-class RefundModel(models.Model):
+class VotableModel(models.Model):
+    """Base class for models users can vote on.
+
+    The number of positive and negative votes is kept up to date by vote and retract_vote, so checking the
+    result does not need to read the votes. Both have to be called on an instance locked with select_for_update
+    inside a transaction.
+    """
+    positive_votes = IntegerField(default=0)
+    negative_votes = IntegerField(default=0)
+
+    class Meta:
+        abstract = True
+
+    @property
+    def vote_sum(self):
+        return self.positive_votes - self.negative_votes
+
+    def _count(self, positive, negative):
+        type(self).objects.filter(id=self.id).update(
+            positive_votes=F("positive_votes") + positive, negative_votes=F("negative_votes") + negative
+        )
+        self.positive_votes += positive
+        self.negative_votes += negative
+
+    def vote(self, user, positive):
+        """Cast the vote of a user, replacing the previous vote of the user."""
+        previous = self.votes.filter(user=user).first()
+        if previous is None:
+            self.votes.create(user=user, positive=positive)
+            self._count(int(positive), int(not positive))
+        elif previous.positive != positive:
+            previous.positive = positive
+            previous.save()
+            self._count(1 if positive else -1, -1 if positive else 1)
+
+    def retract_vote(self, user):
+        """Remove the vote of a user if there is one."""
+        previous = self.votes.filter(user=user).first()
+        if previous is not None:
+            previous.delete()
+            self._count(-int(previous.positive), -int(not previous.positive))
+
+
+class RefundModel(VotableModel):
     """This represents the action of a payment from the community user to another user."""
     amount = IntegerField()
     reason = CharField(max_length=255, blank=True, default="")
     active = BooleanField(default=True)
     creator = ForeignKey(UserModel, on_delete=models.DO_NOTHING)
     transaction = ForeignKey(TransactionModel, on_delete=models.DO_NOTHING, null=True)
-    votes = ManyToManyField(VoteModel, blank=True)
 
     created = DateTimeField(auto_now_add=True)
     modified = DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            Index(fields=["creator"], condition=Q(active=True), name="refund_active_creator_idx"),
+        ]
+
 
-class MembershipPollModel(models.Model):
+class MembershipPollModel(VotableModel):
     """This class represents a poll. Polls are used to accept the membership requests of users"""
-    votes = ManyToManyField(VoteModel, blank=True)
     creator = ForeignKey(UserModel, on_delete=models.CASCADE)
     active = BooleanField(default=False)
 
     created = DateTimeField(auto_now_add=True)
     modified = DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            Index(fields=["creator"], condition=Q(active=True), name="poll_active_creator_idx"),
+        ]
+
 
 class CommunismUserModel(models.Model):
     """User model for communisms.
@@ -169,6 +464,11 @@ class CommunismModel(models.Model):
     created = DateTimeField(auto_now_add=True)
     modified = DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            Index(fields=["modified", "id"], name="communism_modified_idx"),
+        ]
+
     def to_dict(self):
         return {
             "identifier": self.id,
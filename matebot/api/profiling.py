@@ -0,0 +1,244 @@
+"""Opt-in per-request profiling.
+
+ProfilingMiddleware times every request and splits it into phases: ``auth`` covers checking the signature,
+``view`` the endpoint itself, ``serialization`` the JSON encoding of the response, timed by a hook the
+middleware installs on JsonResponse, and ``other`` everything else, like routing and the other middlewares. It also counts the SQL queries of the request and their duration.
+The aggregated numbers are served in the Prometheus text format by metrics_view.
+
+Bodies of streamed responses are encoded after the middleware returned and are not part of the numbers.
+"""
+import contextlib
+import contextvars
+import cProfile
+import functools
+import re
+import threading
+import time
+from asyncio import iscoroutinefunction
+from collections import defaultdict
+
+from django.contrib.admin.views.decorators import staff_member_required
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse, JsonResponse
+from django.utils.decorators import sync_and_async_middleware
+
+from matebot import settings
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+_current = contextvars.ContextVar("profile", default=None)
+
+# Only one cProfile profiler can be active per process on Python 3.12+, requests are profiled one at a time
+_profiler_lock = threading.Lock()
+
+
+class Profile:
+    """Numbers collected during a single request."""
+
+    def __init__(self):
+        self.phases = defaultdict(float)
+        self.queries = 0
+        self.sql = 0.0
+        self._children = []
+
+
+@contextlib.contextmanager
+def phase(name):
+    """Add the time spent in the block to the given phase of the current request.
+
+    Time spent in a nested phase only counts for the nested one.
+    """
+    profile = _current.get()
+    if profile is None:
+        yield
+        return
+    start = time.perf_counter()
+    profile._children.append(0.0)
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        profile.phases[name] += elapsed - profile._children.pop()
+        if profile._children:
+            profile._children[-1] += elapsed
+
+
+def _time_serialization():
+    """Account encoding the data of every JsonResponse to the serialization phase of the current request."""
+    encode = JsonResponse.__init__
+    if getattr(encode, "profiled", False):
+        return
+
+    @functools.wraps(encode)
+    def __init__(self, *args, **kwargs):
+        with phase("serialization"):
+            encode(self, *args, **kwargs)
+
+    __init__.profiled = True
+    JsonResponse.__init__ = __init__
+
+
+def _record_query(execute, sql, params, many, context):
+    profile = _current.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        profile.queries += 1
+        profile.sql += time.perf_counter() - start
+
+
+def _install(connection, **kwargs):
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+class Metrics:
+    """Numbers of all profiled requests, aggregated per endpoint."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.requests = defaultdict(int)
+        self.phases = defaultdict(float)
+        self.queries = defaultdict(int)
+        self.sql = defaultdict(float)
+        self.buckets = defaultdict(lambda: [0] * len(BUCKETS))
+        self.durations = defaultdict(float)
+
+    def record(self, endpoint, status, profile, duration):
+        with self._lock:
+            self.requests[endpoint, status] += 1
+            for name, elapsed in profile.phases.items():
+                self.phases[endpoint, name] += elapsed
+            self.phases[endpoint, "other"] += max(duration - sum(profile.phases.values()), 0)
+            self.queries[endpoint] += profile.queries
+            self.sql[endpoint] += profile.sql
+            self.durations[endpoint] += duration
+            for i, bound in enumerate(BUCKETS):
+                if duration <= bound:
+                    self.buckets[endpoint][i] += 1
+
+    def render(self):
+        """Return the numbers in the Prometheus text format."""
+        with self._lock:
+            counts = defaultdict(int)
+            for (endpoint, _), count in self.requests.items():
+                counts[endpoint] += count
+            lines = [
+                "# HELP matebot_requests_total Requests per endpoint and status code",
+                "# TYPE matebot_requests_total counter",
+            ]
+            lines += [
+                f'matebot_requests_total{{endpoint="{endpoint}",status="{status}"}} {count}'
+                for (endpoint, status), count in sorted(self.requests.items())
+            ]
+            lines += [
+                "# HELP matebot_request_phase_seconds_total Time spent in each phase of the requests",
+                "# TYPE matebot_request_phase_seconds_total counter",
+            ]
+            lines += [
+                f'matebot_request_phase_seconds_total{{endpoint="{endpoint}",phase="{name}"}} {elapsed:.6f}'
+                for (endpoint, name), elapsed in sorted(self.phases.items())
+            ]
+            lines += [
+                "# HELP matebot_sql_queries_total SQL queries per endpoint",
+                "# TYPE matebot_sql_queries_total counter",
+            ]
+            lines += [f'matebot_sql_queries_total{{endpoint="{x}"}} {y}' for x, y in sorted(self.queries.items())]
+            lines += [
+                "# HELP matebot_sql_seconds_total Time spent in SQL queries per endpoint",
+                "# TYPE matebot_sql_seconds_total counter",
+            ]
+            lines += [f'matebot_sql_seconds_total{{endpoint="{x}"}} {y:.6f}' for x, y in sorted(self.sql.items())]
+            lines += [
+                "# HELP matebot_request_seconds Duration of the requests",
+                "# TYPE matebot_request_seconds histogram",
+            ]
+            for endpoint, buckets in sorted(self.buckets.items()):
+                lines += [
+                    f'matebot_request_seconds_bucket{{endpoint="{endpoint}",le="{bound}"}} {count}'
+                    for bound, count in zip(BUCKETS, buckets)
+                ]
+                lines += [
+                    f'matebot_request_seconds_bucket{{endpoint="{endpoint}",le="+Inf"}} {counts[endpoint]}',
+                    f'matebot_request_seconds_sum{{endpoint="{endpoint}"}} {self.durations[endpoint]:.6f}',
+                    f'matebot_request_seconds_count{{endpoint="{endpoint}"}} {counts[endpoint]}',
+                ]
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+def _endpoint(request):
+    match = getattr(request, "resolver_match", None)
+    return match.route if match is not None else "unmatched"
+
+
+def _dump(profiler, request, duration):
+    directory = settings.PROFILING_DUMP_DIR
+    directory.mkdir(parents=True, exist_ok=True)
+    name = re.sub(r"[^A-Za-z0-9]+", "_", _endpoint(request)).strip("_")
+    profiler.dump_stats(directory / f"{time.strftime('%Y%m%d-%H%M%S')}-{name}-{duration * 1000:.0f}ms.prof")
+
+
+@sync_and_async_middleware
+def ProfilingMiddleware(get_response):
+    """Collect the numbers of every request into metrics.
+
+    With ``PROFILING_SLOW_REQUEST`` set, synchronous requests are run under cProfile and requests taking longer
+    than that many seconds are dumped to ``PROFILING_DUMP_DIR``. Only one request is run under cProfile at a
+    time, requests arriving meanwhile in other threads are not profiled with cProfile. Async views are not
+    profiled with cProfile, as requests running concurrently on the event loop would end up in the same profile.
+    """
+    _time_serialization()
+    connection_created.connect(_install)
+    for connection in connections.all(initialized_only=True):
+        _install(connection)
+
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            profile = Profile()
+            token = _current.set(profile)
+            start = time.perf_counter()
+            try:
+                response = await get_response(request)
+            finally:
+                _current.reset(token)
+            metrics.record(_endpoint(request), response.status_code, profile, time.perf_counter() - start)
+            return response
+    else:
+        def middleware(request):
+            profile = Profile()
+            token = _current.set(profile)
+            profiler = None
+            if settings.PROFILING_SLOW_REQUEST is not None and _profiler_lock.acquire(blocking=False):
+                profiler = cProfile.Profile()
+            start = time.perf_counter()
+            try:
+                if profiler is None:
+                    response = get_response(request)
+                else:
+                    try:
+                        response = profiler.runcall(get_response, request)
+                    finally:
+                        _profiler_lock.release()
+            finally:
+                _current.reset(token)
+            duration = time.perf_counter() - start
+            metrics.record(_endpoint(request), response.status_code, profile, duration)
+            if profiler is not None and duration > settings.PROFILING_SLOW_REQUEST:
+                _dump(profiler, request, duration)
+            return response
+    return middleware
+
+
+@staff_member_required
+def metrics_view(request):
+    return HttpResponse(metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
@@ -0,0 +1,89 @@
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import F, Sum, Value
+from django.db.models.functions import Coalesce
+
+from api import ledger, models
+
+
+def net_amounts(transactions):
+    """Return a dict mapping the id of every user in the transactions to the amount received minus sent."""
+    deltas = defaultdict(int)
+    for user_id, amount in transactions.values_list("sender_id").annotate(amount=Sum("amount")).order_by():
+        deltas[user_id] -= amount
+    for user_id, amount in transactions.values_list("receiver_id").annotate(amount=Sum("amount")).order_by():
+        deltas[user_id] += amount
+    return deltas
+
+
+def _add(transactions):
+    deltas = net_amounts(transactions)
+    sums = models.LedgerSumModel.objects.in_bulk(list(deltas))
+    for user_id, amount in deltas.items():
+        if user_id in sums:
+            sums[user_id].amount += amount
+    models.LedgerSumModel.objects.bulk_update(sums.values(), ["amount"], batch_size=500)
+    models.LedgerSumModel.objects.bulk_create(
+        [models.LedgerSumModel(user_id=x, amount=y) for x, y in deltas.items() if x not in sums],
+        batch_size=500
+    )
+
+
+def fold(settle_delay=None):
+    """Add all transactions created since the last run to the running sums of the users.
+
+    Only the new rows are read, grouped by sender and receiver, so the cost depends on the number of new
+    transactions and not on the size of the ledger.
+
+    :param settle_delay: See ledger.settled
+    :return: Number of folded transactions
+    """
+    with transaction.atomic():
+        state, _ = models.ReconciliationModel.objects.select_for_update().get_or_create(id=1)
+        settled = ledger.settled(state.last_transaction_id, settle_delay)
+        if settled is None:
+            return 0
+        new, state.last_transaction_id = settled
+        _add(new)
+        count = new.count()
+        state.save()
+    return count
+
+
+def reset():
+    """Forget all running sums, the next fold reads the whole ledger again.
+
+    Balances carried forward by the archival have ids below every watermark, they are added right away.
+    """
+    with transaction.atomic():
+        models.LedgerSumModel.objects.all().delete()
+        models.ReconciliationModel.objects.filter(id=1).update(last_transaction_id=0)
+        _add(models.TransactionModel.objects.filter(id__lte=0))
+
+
+def _ledger_balance(user_id):
+    received = models.TransactionModel.objects.filter(receiver_id=user_id).aggregate(total=Sum("amount"))["total"]
+    sent = models.TransactionModel.objects.filter(sender_id=user_id).aggregate(total=Sum("amount"))["total"]
+    return (received or 0) - (sent or 0)
+
+
+def drift():
+    """Compare the balance of every user with the sum of its transactions.
+
+    Transactions written while the check runs change the balance before they are folded, so every mismatch
+    is verified against the full ledger of that user before it is reported.
+
+    :return: List of tuples of user id, balance and ledger balance for every user that does not match
+    """
+    suspects = models.UserModel.objects.annotate(
+        ledger_balance=Coalesce(F("ledgersummodel__amount"), Value(0))
+    ).exclude(balance=F("ledger_balance")).values_list("id", flat=True)
+    result = []
+    for user_id in suspects:
+        with transaction.atomic():
+            balance = models.UserModel.objects.select_for_update().get(id=user_id).balance
+            ledger_balance = _ledger_balance(user_id)
+        if balance != ledger_balance:
+            result.append((user_id, balance, ledger_balance))
+    return result
@@ -0,0 +1,106 @@
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+
+from api import ledger, models
+
+
+def _save(model, rows, deltas, fields):
+    """Add the deltas to the rows, update the existing ones and insert the new ones."""
+    changed = []
+    for key, values in deltas.items():
+        row = rows[key]
+        for field, value in zip(fields, values):
+            setattr(row, field, getattr(row, field) + value)
+        changed.append(row)
+    model.objects.bulk_update([x for x in changed if not x._state.adding], fields, batch_size=500)
+    model.objects.bulk_create([x for x in changed if x._state.adding], batch_size=500)
+
+
+def _add(transactions):
+    """Add the transactions to the statistics.
+
+    :return: Number of added transactions
+    """
+    # sent, received, consumed, quantity
+    users = defaultdict(lambda: [0, 0, 0, 0])
+    # quantity, amount
+    consumables = defaultdict(lambda: [0, 0])
+    # transactions, amount, quantity
+    days = defaultdict(lambda: [0, 0, 0])
+    count = 0
+    grouped = transactions.annotate(day=TruncDate("created")).values_list("day", "sender_id", "consumable")
+    grouped = grouped.annotate(number=Count("id"), amount=Sum("amount"), quantity=Sum("quantity")).order_by()
+    for day, user_id, consumable, number, amount, quantity in grouped:
+        quantity = quantity or 0
+        count += number
+        users[user_id][0] += amount
+        keys = [(day, None, ""), (day, user_id, "")]
+        if consumable is not None:
+            users[user_id][2] += amount
+            users[user_id][3] += quantity
+            consumables[consumable][0] += quantity
+            consumables[consumable][1] += amount
+            keys.append((day, None, consumable))
+        for key in keys:
+            days[key][0] += number
+            days[key][1] += amount
+            days[key][2] += quantity
+    for user_id, amount in transactions.values_list("receiver_id").annotate(amount=Sum("amount")).order_by():
+        users[user_id][1] += amount
+
+    fields = ["sent", "received", "consumed", "quantity"]
+    rows = models.UserStatisticModel.objects.in_bulk(list(users))
+    for user_id in users:
+        rows.setdefault(user_id, models.UserStatisticModel(user_id=user_id))
+    _save(models.UserStatisticModel, rows, users, fields)
+
+    fields = ["quantity", "amount"]
+    rows = models.ConsumableStatisticModel.objects.in_bulk(list(consumables), field_name="name")
+    for name in consumables:
+        rows.setdefault(name, models.ConsumableStatisticModel(name=name))
+    _save(models.ConsumableStatisticModel, rows, consumables, fields)
+
+    fields = ["transactions", "amount", "quantity"]
+    rows = {
+        (x.day, x.user_id, x.consumable): x
+        for x in models.DailyStatisticModel.objects.filter(day__in={x[0] for x in days})
+    }
+    for key in days:
+        rows.setdefault(key, models.DailyStatisticModel(day=key[0], user_id=key[1], consumable=key[2]))
+    _save(models.DailyStatisticModel, rows, days, fields)
+    return count
+
+
+def fold(settle_delay=None):
+    """Add all transactions created since the last run to the statistics.
+
+    Like the reconciliation, only the new rows are read, grouped by day, sender and consumable.
+
+    :param settle_delay: See ledger.settled
+    :return: Number of folded transactions
+    """
+    with transaction.atomic():
+        state, _ = models.StatisticStateModel.objects.select_for_update().get_or_create(id=1)
+        settled = ledger.settled(state.last_transaction_id, settle_delay)
+        if settled is None:
+            return 0
+        new, state.last_transaction_id = settled
+        count = _add(new)
+        state.save()
+    return count
+
+
+def reset():
+    """Forget all statistics, the next fold reads the whole ledger again.
+
+    Archived transactions are no longer part of the ledger, they are added right away.
+    """
+    with transaction.atomic():
+        models.UserStatisticModel.objects.all().delete()
+        models.ConsumableStatisticModel.objects.all().delete()
+        models.DailyStatisticModel.objects.all().delete()
+        models.StatisticStateModel.objects.filter(id=1).update(last_transaction_id=0)
+        _add(models.ArchivedTransactionModel.objects.all())
@@ -1,3 +1,1415 @@
-from django.test import TestCase
+import csv
+import datetime
+import importlib.util
+import io
+import json
+import pathlib
+import random
+import tempfile
+import threading
+import time
+from unittest import mock, skipUnless
+
+import rc_protocol
+from asgiref.sync import async_to_sync
+from django.conf import settings as django_settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache as django_cache
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, OperationalError, connection
+from django.db.models import F, Sum
+from django.http import JsonResponse
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from api import aliases, archival, auth, benchmark, callbacks, catalogue, export, idempotency, ledger, models, \
+    profiling, reconciliation, rollups
+from matebot import settings
+
+
+class APITestCase(TestCase):
+    """Base class providing an application and helpers to send signed requests."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.application = models.ApplicationModel.objects.create(token="secret")
+
+    def setUp(self):
+        auth.token_cache.invalidate()
+        aliases.alias_cache.invalidate()
+
+    def tearDown(self):
+        auth.token_cache.invalidate()
+        aliases.alias_cache.invalidate()
+
+    def get(self, endpoint, params=None, application=None):
+        path = f"/api/v1/{endpoint}"
+        params = params or {}
+        return self.client.get(
+            path, params,
+            HTTP_AUTHORIZATION=benchmark.authorization(application or self.application, params, path)
+        )
+
+    def post(self, endpoint, data, application=None):
+        path = f"/api/v1/{endpoint}"
+        return self.client.post(
+            path, json.dumps(data), content_type="application/json",
+            HTTP_AUTHORIZATION=benchmark.authorization(application or self.application, data, path)
+        )
+
+
+class AuthTestCase(APITestCase):
+    def test_application_id(self):
+        response = self.get("getUser")
+        self.assertEqual(response.status_code, 200)
+
+    def test_legacy_header(self):
+        checksum = rc_protocol.get_checksum({}, self.application.token, salt="/api/v1/getUser")
+        response = self.client.get("/api/v1/getUser", HTTP_AUTHORIZATION=f"RCP {checksum}")
+        self.assertEqual(response.status_code, 200)
+
+    def test_wrong_application(self):
+        other = models.ApplicationModel.objects.create(token="other")
+        checksum = rc_protocol.get_checksum({}, other.token, salt="/api/v1/getUser")
+        response = self.client.get(
+            "/api/v1/getUser", HTTP_AUTHORIZATION=f"RCP {self.application.id}:{checksum}"
+        )
+        self.assertEqual(response.status_code, 403)
+
+    def test_malformed_header(self):
+        response = self.client.get("/api/v1/getUser", HTTP_AUTHORIZATION="RCP abc:def")
+        self.assertEqual(response.status_code, 401)
+
+    def test_rotated_token(self):
+        self.assertEqual(self.get("getUser").status_code, 200)
+        models.ApplicationModel.objects.filter(id=self.application.id).update(token="rotated")
+        self.application.refresh_from_db()
+        self.assertEqual(self.get("getUser").status_code, 200)
+
+    def test_deleted_application(self):
+        self.assertEqual(self.get("getUser").status_code, 200)
+        # The command runs in its own process, it can not touch the cache of the server
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command("application", "delete", "--id", str(self.application.id), stdout=io.StringIO())
+        self.assertEqual(self.get("getUser").status_code, 403)
+
+    def test_changed_by_other_process(self):
+        other = models.ApplicationModel.objects.create(token="other")
+        self.assertEqual(self.get("getUser", application=other).status_code, 200)
+        # Deleted without signals, as another process would, which then changes the shared generation
+        with connection.cursor() as cursor:
+            cursor.execute("DELETE FROM api_applicationmodel WHERE id = %s", [other.id])
+        self.assertEqual(self.get("getUser", application=other).status_code, 200)
+        django_cache.set(auth.generation.key, "other process", None)
+        self.assertEqual(self.get("getUser", application=other).status_code, 403)
+
+
+class PerformTransactionTestCase(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.sender = models.UserModel.objects.create(balance=100)
+        self.receiver = models.UserModel.objects.create()
+
+    def test_transfer(self):
+        response = self.post(
+            "performTransaction",
+            {"sender_id": self.sender.id, "receiver_id": self.receiver.id, "amount": 30, "reason": "mate"}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.sender.refresh_from_db()
+        self.receiver.refresh_from_db()
+        self.assertEqual((self.sender.balance, self.receiver.balance), (70, 30))
+        self.assertTrue(models.TransactionModel.objects.filter(id=response.json()["data"]).exists())
+
+    def test_unknown_receiver(self):
+        response = self.post(
+            "performTransaction", {"sender_id": self.sender.id, "receiver_id": 0, "amount": 30, "reason": ""}
+        )
+        self.assertEqual(response.status_code, 400)
+        self.sender.refresh_from_db()
+        self.assertEqual(self.sender.balance, 100)
+        self.assertFalse(models.TransactionModel.objects.exists())
+
+    def test_self_transfer(self):
+        ledger.transfer(self.sender.id, self.sender.id, 30, "")
+        self.sender.refresh_from_db()
+        self.assertEqual(self.sender.balance, 100)
+
+
+class ConcurrentTransferTestCase(TransactionTestCase):
+    threads = 8
+    transfers_per_thread = 250
+
+    def test_balance_sum_is_constant(self):
+        users = [models.UserModel.objects.create(balance=1000) for _ in range(5)]
+        user_ids = [x.id for x in users]
+        total = sum(x.balance for x in users)
+
+        def worker(seed):
+            rng = random.Random(seed)
+            try:
+                for _ in range(self.transfers_per_thread):
+                    sender_id, receiver_id = rng.sample(user_ids, 2)
+                    while True:
+                        try:
+                            ledger.transfer(sender_id, receiver_id, rng.randint(1, 50), "stress")
+                            break
+                        except OperationalError:
+                            # SQLite reports lock contention instead of blocking
+                            time.sleep(0.001)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=worker, args=(i,)) for i in range(self.threads)]
+        [x.start() for x in workers]
+        [x.join() for x in workers]
+
+        self.assertEqual(
+            models.UserModel.objects.filter(id__in=user_ids).aggregate(total=Sum("balance"))["total"], total
+        )
+        self.assertEqual(models.TransactionModel.objects.count(), self.threads * self.transfers_per_thread)
+
+
+class EndCommunismTestCase(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.creator = models.UserModel.objects.create(internal=True)
+
+    def start_communism(self, participants):
+        users = models.UserModel.objects.bulk_create(models.UserModel() for _ in range(participants))
+        communism = models.CommunismModel.objects.create(creator=self.creator, amount=10 * participants, reason="")
+        communism.participants.add(*models.CommunismUserModel.objects.bulk_create(
+            models.CommunismUserModel(user=x, quantity=1 + i % 2) for i, x in enumerate(users)
+        ))
+        return communism
+
+    def end_communism(self, communism):
+        return self.post("endCommunism", {"user_id": self.creator.id, "communism_id": communism.id})
+
+    def test_settlement(self):
+        communism = self.start_communism(4)
+        communism.participants.create(user=self.creator)
+        self.assertEqual(self.end_communism(communism).status_code, 200)
+        communism.refresh_from_db()
+        self.assertFalse(communism.active)
+        self.assertEqual(models.TransactionModel.objects.count(), 5)
+        self.assertEqual(models.UserModel.objects.aggregate(total=Sum("balance"))["total"], 0)
+        self.creator.refresh_from_db()
+        # 40 // 5 = 8 per quantity, the creator pays its own share to itself
+        self.assertEqual(self.creator.balance, 8 * (1 + 2 + 1 + 2))
+        self.assertEqual(self.end_communism(communism).status_code, 400)
+
+    def test_constant_query_count(self):
+        self.get("getUser")
+        small = self.start_communism(10)
+        with CaptureQueriesContext(connection) as queries:
+            self.end_communism(small)
+        large = self.start_communism(100)
+        with self.assertNumQueries(len(queries)):
+            self.end_communism(large)
+
+
+class LeaveCommunismTestCase(APITestCase):
+    def test_last_quantity(self):
+        user = models.UserModel.objects.create()
+        communism = models.CommunismModel.objects.create(
+            creator=models.UserModel.objects.create(internal=True), amount=10, reason=""
+        )
+        communism.participants.create(user=user, quantity=2)
+        leave = {"user_id": user.id, "communism_id": communism.id}
+        self.assertEqual(self.post("leaveCommunism", leave).status_code, 200)
+        self.assertEqual(communism.participants.get(user=user).quantity, 1)
+        self.assertEqual(self.post("leaveCommunism", leave).status_code, 200)
+        self.assertTrue(models.CommunismModel.objects.filter(id=communism.id, active=True).exists())
+        self.assertFalse(communism.participants.exists())
+        self.assertFalse(models.CommunismUserModel.objects.exists())
+
+
+class VoteMembershipTestCase(APITestCase):
+    def test_accepted(self):
+        creator = models.UserModel.objects.create()
+        membership_poll = models.MembershipPollModel.objects.create(creator=creator, active=True)
+        voters = models.UserModel.objects.bulk_create(
+            models.UserModel(internal=True) for _ in range(settings.USER_PROMOTE_DELTA)
+        )
+        for voter in voters:
+            vote = {"user_id": voter.id, "membership_poll_id": membership_poll.id, "positive": True}
+            self.assertEqual(self.post("voteMembership", vote).status_code, 200)
+        membership_poll.refresh_from_db()
+        creator.refresh_from_db()
+        self.assertFalse(membership_poll.active)
+        self.assertTrue(creator.internal)
+        vote = {"user_id": voters[0].id, "membership_poll_id": membership_poll.id, "positive": False}
+        self.assertEqual(self.post("voteMembership", vote).status_code, 400)
+
+
+class GetUserTestCase(APITestCase):
+    users = 10000
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        users = models.UserModel.objects.bulk_create(models.UserModel(name=str(i)) for i in range(cls.users))
+        models.UserModel.objects.filter(id__in=[x.id for x in users[1::2]]).update(voucher=users[0])
+        models.UserAliasModel.objects.bulk_create(
+            models.UserAliasModel(user=x, application=cls.application, user_alias=x.name) for x in users
+        )
+
+    def setUp(self):
+        super().setUp()
+        self.get("getUser")
+
+    def test_constant_query_count(self):
+        # Users, vouched users and aliases
+        with self.assertNumQueries(3):
+            data = [x.to_dict() for x in models.UserModel.objects.with_relations()]
+        self.assertEqual(len(data), self.users)
+        self.assertEqual(len(data[0]["vouched_for"]), self.users // 2)
+        self.assertEqual(data[1]["user_alias_ids"], {self.application.id: "1"})
+
+    def test_view(self):
+        # Users, then vouched users and aliases for every chunk of users
+        chunks = -(-self.users // settings.STREAM_CHUNK_SIZE)
+        with self.assertNumQueries(1 + 2 * chunks):
+            response = self.get("getUser")
+        data = response.json()["data"]
+        self.assertEqual(len(data), self.users)
+        self.assertEqual(data[-1]["user_alias_ids"], {str(self.application.id): str(self.users - 1)})
+
+
+class PaginationTestCase(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.users = models.UserModel.objects.bulk_create(models.UserModel() for _ in range(25))
+        models.TransactionModel.objects.bulk_create(
+            models.TransactionModel(sender=cls.users[1], receiver=cls.users[0], amount=i + 1) for i in range(25)
+        )
+
+    def collect(self, endpoint, params):
+        pages, cursor = [], None
+        while True:
+            response = self.get(endpoint, dict(params, **({"cursor": cursor} if cursor else {}))).json()
+            pages.append(response["data"])
+            cursor = response["next"]
+            if cursor is None:
+                return pages
+
+    def test_users(self):
+        pages = self.collect("getUser", {"amount": 10})
+        self.assertEqual([len(x) for x in pages], [10, 10, 5])
+        self.assertEqual([x["identifier"] for page in pages for x in page], [x.id for x in self.users])
+
+    def test_history(self):
+        pages = self.collect("getHistory", {"target_id": self.users[0].id, "amount": 20})
+        self.assertEqual([len(x) for x in pages], [20, 5])
+        self.assertEqual([x["amount"] for page in pages for x in page], list(range(25, 0, -1)))
+
+    def test_stream(self):
+        params = {"target_id": self.users[0].id, "amount": 20}
+        streamed = self.get("getHistory", dict(params, stream="1"))
+        self.assertTrue(streamed.streaming)
+        self.assertEqual(json.loads(b"".join(streamed.streaming_content)), self.get("getHistory", params).json())
+
+    def test_stream_users(self):
+        streamed = self.get("getUser", {"stream": "true"})
+        self.assertEqual(json.loads(b"".join(streamed.streaming_content)), self.get("getUser").json())
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.get("getUser", {"cursor": "x"}).status_code, 400)
+
+
+@mock.patch.multiple(settings, LEDGER_SETTLE_DELAY=0)
+class ReconciliationTestCase(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.users = models.UserModel.objects.bulk_create(models.UserModel() for _ in range(3))
+
+    def insert(self, transaction_id, amount):
+        ledger.apply_balances({self.users[0].id: -amount, self.users[1].id: amount})
+        models.TransactionModel.objects.create(
+            id=transaction_id, sender=self.users[0], receiver=self.users[1], amount=amount
+        )
+
+    def test_late_commit_is_not_skipped(self):
+        start = ledger.transfer(self.users[0].id, self.users[1].id, 1, "").id
+        self.assertEqual(reconciliation.fold(), 1)
+        self.insert(start + 2, 10)
+        self.assertEqual(reconciliation.fold(settle_delay=60), 0)
+        # A transaction which got its id earlier commits only now
+        self.insert(start + 1, 5)
+        self.assertEqual(reconciliation.fold(), 2)
+        self.assertEqual(reconciliation.drift(), [])
+
+    def test_incremental(self):
+        ledger.transfer(self.users[0].id, self.users[1].id, 10, "")
+        self.assertEqual(reconciliation.fold(), 1)
+        self.assertEqual(reconciliation.drift(), [])
+        ledger.transfer(self.users[1].id, self.users[2].id, 4, "")
+        ledger.transfer(self.users[2].id, self.users[0].id, 1, "")
+        self.assertEqual(reconciliation.fold(), 2)
+        self.assertEqual(reconciliation.fold(), 0)
+        self.assertEqual(
+            dict(models.LedgerSumModel.objects.values_list("user_id", "amount")),
+            {self.users[0].id: -9, self.users[1].id: 6, self.users[2].id: 3}
+        )
+        self.assertEqual(reconciliation.drift(), [])
+
+    def test_drift(self):
+        ledger.transfer(self.users[0].id, self.users[1].id, 10, "")
+        models.UserModel.objects.filter(id=self.users[1].id).update(balance=F("balance") + 5)
+        reconciliation.fold()
+        self.assertEqual(reconciliation.drift(), [(self.users[1].id, 15, 10)])
+
+    def test_unfolded_transactions_are_no_drift(self):
+        reconciliation.fold()
+        ledger.transfer(self.users[0].id, self.users[1].id, 10, "")
+        self.assertEqual(reconciliation.drift(), [])
+
+    def test_refund_is_credited(self):
+        community = models.UserModel.objects.create(id=settings.COMMUNITY_USER_ID)
+        creator = models.UserModel.objects.create(internal=True)
+        refund = models.RefundModel.objects.create(creator=creator, amount=50)
+        for _ in range(settings.REFUND_VOTE_DELTA):
+            voter = models.UserModel.objects.create(internal=True)
+            self.post("voteRefund", {"user_id": voter.id, "refund_id": refund.id, "positive": True})
+        creator.refresh_from_db()
+        community.refresh_from_db()
+        self.assertEqual((creator.balance, community.balance), (50, -50))
+        reconciliation.fold()
+        self.assertEqual(reconciliation.drift(), [])
+
+
+class HistoryTestCase(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.user, cls.other = models.UserModel.objects.bulk_create([models.UserModel(), models.UserModel()])
+        start = datetime.datetime(2022, 1, 1, tzinfo=datetime.timezone.utc)
+        for i in range(10):
+            sender, receiver = (cls.user, cls.other) if i % 2 else (cls.other, cls.user)
+            transaction = models.TransactionModel.objects.create(sender=sender, receiver=receiver, amount=i + 1)
+            models.TransactionModel.objects.filter(id=transaction.id).update(
+                created=start + datetime.timedelta(days=i)
+            )
+        cls.start = start.timestamp()
+
+    def amounts(self, **params):
+        response = self.get("getHistory", dict(params, target_id=self.user.id, amount=20))
+        return [x["amount"] for x in response.json()["data"]]
+
+    def test_directions(self):
+        self.assertEqual(self.amounts(), list(range(10, 0, -1)))
+        self.assertEqual(self.amounts(direction="incoming"), [9, 7, 5, 3, 1])
+        self.assertEqual(self.amounts(direction="outgoing"), [10, 8, 6, 4, 2])
+        self.assertEqual(self.get("getHistory", {"target_id": self.user.id, "direction": "x"}).status_code, 400)
+
+    def test_date_range(self):
+        day = 24 * 60 * 60
+        self.assertEqual(self.amounts(since=self.start + 3 * day), [10, 9, 8, 7, 6, 5, 4])
+        self.assertEqual(self.amounts(until=self.start + 3 * day), [3, 2, 1])
+        self.assertEqual(self.amounts(since=self.start + 3 * day, until=self.start + 5 * day), [5, 4])
+        self.assertEqual(self.amounts(since=self.start + 30 * day), [])
+        self.assertEqual(self.get("getHistory", {"target_id": self.user.id, "since": "x"}).status_code, 400)
+
+    def test_pages_in_both_directions(self):
+        response = self.get("getHistory", {"target_id": self.user.id, "amount": 4}).json()
+        self.assertEqual([x["amount"] for x in response["data"]], [10, 9, 8, 7])
+        response = self.get("getHistory", {"target_id": self.user.id, "amount": 4, "cursor": response["next"]})
+        self.assertEqual([x["amount"] for x in response.json()["data"]], [6, 5, 4, 3])
+
+    def test_self_transfer_once(self):
+        models.TransactionModel.objects.create(sender=self.user, receiver=self.user, amount=99)
+        self.assertEqual(self.amounts()[:2], [99, 10])
+        streamed = self.get("getHistory", {"target_id": self.user.id, "amount": 20, "stream": "1"})
+        data = json.loads(b"".join(streamed.streaming_content))["data"]
+        self.assertEqual([x["amount"] for x in data][:2], [99, 10])
+
+
+class ConsumableTestCase(APITestCase):
+    def setUp(self):
+        super().setUp()
+        catalogue.consumable_cache._clear()
+        consumable = models.ConsumableModel.objects.create(name="Mate", price=100, symbol="M")
+        consumable.messages.create(message="Enjoy")
+
+    def tearDown(self):
+        super().tearDown()
+        catalogue.consumable_cache._clear()
+
+    def test_catalogue(self):
+        response = self.get("getConsumables")
+        self.assertEqual(response.json()["data"][0]["messages"], ["Enjoy"])
+        self.assertIn("ETag", response.headers)
+
+    def test_not_modified(self):
+        etag = self.get("getConsumables").headers["ETag"]
+        path = "/api/v1/getConsumables"
+        with self.assertNumQueries(0):
+            response = self.client.get(
+                path, HTTP_AUTHORIZATION=benchmark.authorization(self.application, {}, path), HTTP_IF_NONE_MATCH=etag
+            )
+        self.assertEqual(response.status_code, 304)
+
+    def test_invalidation(self):
+        etag = self.get("getConsumables").headers["ETag"]
+        consumable = models.ConsumableModel.objects.get(name="Mate")
+        self.client.force_login(get_user_model().objects.create_superuser("admin"))
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f"/admin/api/consumablemodel/{consumable.id}/change/", {
+                "name": "Mate", "description": "", "price": 150, "symbol": "M",
+                "messages": [x.id for x in consumable.messages.all()],
+            })
+        self.assertEqual(response.status_code, 302)
+        response = self.get("getConsumables")
+        self.assertNotEqual(response.headers["ETag"], etag)
+        self.assertEqual(response.json()["data"][0]["price"], 150)
+
+        etag = response.headers["ETag"]
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f"/admin/api/consumablemodel/{consumable.id}/delete/", {"post": "yes"})
+        self.assertEqual(response.status_code, 302)
+        response = self.get("getConsumables")
+        self.assertNotEqual(response.headers["ETag"], etag)
+        self.assertEqual(response.json()["data"], [])
+
+    def test_changed_by_other_process(self):
+        etag = self.get("getConsumables").headers["ETag"]
+        # Changed by the consumables command in another process, which then changes the shared generation
+        models.ConsumableModel.objects.filter(name="Mate").update(price=150)
+        self.assertEqual(self.get("getConsumables").headers["ETag"], etag)
+        django_cache.set(catalogue.generation.key, "other process", None)
+        response = self.get("getConsumables")
+        self.assertNotEqual(response.headers["ETag"], etag)
+        self.assertEqual(response.json()["data"][0]["price"], 150)
+
+
+class ConsumablesCommandTestCase(TestCase):
+    def run_import(self, consumables, *args):
+        with tempfile.NamedTemporaryFile("w", suffix=".json") as fh:
+            json.dump({"consumables": consumables}, fh)
+            fh.flush()
+            out = io.StringIO()
+            call_command("consumables", "--path", fh.name, *args, stdout=out)
+        return out.getvalue()
+
+    def catalogue(self):
+        return {
+            x.name: (x.price, sorted(y.message for y in x.messages.all()))
+            for x in models.ConsumableModel.objects.prefetch_related("messages")
+        }
+
+    def test_import(self):
+        mate = {"description": "", "price": 100, "symbol": "M", "messages": ["a", "b"]}
+        beer = {"description": "", "price": 150, "symbol": "B", "messages": ["c"]}
+        self.run_import({"Mate": mate, "Beer": beer})
+        self.assertEqual(self.catalogue(), {"Mate": (100, ["a", "b"]), "Beer": (150, ["c"])})
+        kept = models.ConsumableMessageModel.objects.get(message="a").id
+
+        output = self.run_import({"Mate": dict(mate, price=120, messages=["a", "d"])})
+        self.assertIn("0 added, 1 updated, 1 deleted, 1 messages added, 2 messages removed", output)
+        self.assertEqual(self.catalogue(), {"Mate": (120, ["a", "d"])})
+        self.assertTrue(models.ConsumableMessageModel.objects.filter(id=kept).exists())
+        self.assertEqual(models.ConsumableMessageModel.objects.count(), 2)
+
+    def test_changes_generation(self):
+        generation = catalogue.generation.get()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.run_import({"Mate": {"description": "", "price": 100, "symbol": "M", "messages": []}})
+        self.assertNotEqual(catalogue.generation.get(), generation)
+
+    def test_dry_run(self):
+        output = self.run_import(
+            {"Mate": {"description": "", "price": 100, "symbol": "M", "messages": ["a"]}}, "--dry-run"
+        )
+        self.assertIn("1 added", output)
+        self.assertFalse(models.ConsumableModel.objects.exists())
+
+
+class CallbackTestCase(APITestCase):
+    def deliver(self):
+        async def run():
+            async with callbacks.session() as session:
+                dispatcher = callbacks.Dispatcher(session)
+                delivered = 0
+                while sent := await dispatcher.run_once():
+                    delivered += sent
+                return delivered
+        return async_to_sync(run)()
+
+    def register(self, stub, count=1):
+        models.ApplicationCallbackModel.objects.bulk_create(
+            models.ApplicationCallbackModel(uri=stub.uri, username="user", password="pass") for _ in range(count)
+        )
+
+    def test_view_emits_event(self):
+        with benchmark.CallbackStub() as stub:
+            self.register(stub)
+            user = models.UserModel.objects.create(internal=True)
+            refund_id = self.post("startRefund", {"user_id": user.id, "amount": 10}).json()["data"]
+            self.assertEqual(self.deliver(), 1)
+        self.assertEqual(stub.batches[0][0]["event"], "refundCreated")
+        self.assertEqual(stub.batches[0][0]["data"]["refund_id"], refund_id)
+        self.assertFalse(models.CallbackEventModel.objects.exists())
+
+    def test_batching_and_concurrency(self):
+        patch = mock.patch.multiple(settings, CALLBACK_BATCH_SIZE=10, CALLBACK_CONCURRENCY=2)
+        with benchmark.CallbackStub(delay=0.01) as stub, patch:
+            self.register(stub, count=3)
+            for i in range(100):
+                callbacks.emit("test", number=i)
+            self.assertEqual(self.deliver(), 300)
+        self.assertEqual(stub.events, 300)
+        self.assertEqual(len(stub.batches), 30)
+        self.assertLessEqual(stub.max_concurrency, 2)
+
+    def test_retry(self):
+        with benchmark.CallbackStub(failures=1) as stub:
+            self.register(stub)
+            callbacks.emit("test")
+            self.assertEqual(self.deliver(), 0)
+            event = models.CallbackEventModel.objects.get()
+            self.assertEqual(event.attempts, 1)
+            self.assertGreater(event.next_attempt, timezone.now())
+            models.CallbackEventModel.objects.update(next_attempt=timezone.now())
+            self.assertEqual(self.deliver(), 1)
+        self.assertEqual(stub.events, 1)
+
+
+class AsyncViewTestCase(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.user, cls.other = models.UserModel.objects.bulk_create([models.UserModel(), models.UserModel()])
+        models.TransactionModel.objects.bulk_create(
+            models.TransactionModel(sender=cls.other, receiver=cls.user, amount=i + 1) for i in range(5)
+        )
+        communism = models.CommunismModel.objects.create(creator=cls.user, amount=10, reason="")
+        communism.participants.create(user=cls.other, quantity=2)
+
+    async def aget(self, endpoint, params=None):
+        path = f"/api/v1/{endpoint}"
+        params = params or {}
+        return await self.async_client.get(
+            path, params, AUTHORIZATION=benchmark.authorization(self.application, params, path)
+        )
+
+    async def test_views(self):
+        response = await self.aget("getUser")
+        self.assertEqual(len(response.json()["data"]), 2)
+        response = await self.aget("getHistory", {"target_id": self.user.id, "amount": 3})
+        self.assertEqual([x["amount"] for x in response.json()["data"]], [5, 4, 3])
+        response = await self.aget("getCommunisms")
+        self.assertEqual(response.json()["data"][0]["participants"], [{"user_id": self.other.id, "quantity": 2}])
+        response = await self.aget("getConsumables")
+        self.assertEqual(response.json()["data"], [])
+
+    async def test_stream(self):
+        response = await self.aget("getHistory", {"target_id": self.user.id, "stream": "1"})
+        body = b"".join([x async for x in response.streaming_content])
+        self.assertEqual([x["amount"] for x in json.loads(body)["data"]], [5, 4, 3, 2, 1])
+
+    async def test_authorization_failed(self):
+        response = await self.async_client.get("/api/v1/getUser", AUTHORIZATION=f"RCP {self.application.id}:x")
+        self.assertEqual(response.status_code, 403)
+
+
+class BatchTestCase(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.sender = models.UserModel.objects.create(balance=100)
+        self.receiver = models.UserModel.objects.create()
+
+    def transfer(self, amount, receiver_id=None):
+        return {
+            "operation": "performTransaction",
+            "data": {
+                "sender_id": self.sender.id,
+                "receiver_id": self.receiver.id if receiver_id is None else receiver_id,
+                "amount": amount,
+                "reason": "round",
+            }
+        }
+
+    def balances(self):
+        self.sender.refresh_from_db()
+        self.receiver.refresh_from_db()
+        return self.sender.balance, self.receiver.balance
+
+    def test_batch(self):
+        response = self.post("batch", {"operations": [self.transfer(x) for x in range(1, 21)]})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(all(x["status"] == 200 for x in response.json()["data"]))
+        self.assertEqual(self.balances(), (-110, 210))
+        self.assertEqual(models.TransactionModel.objects.count(), 20)
+
+    def test_atomic_failure(self):
+        response = self.post("batch", {"operations": [self.transfer(10), self.transfer(10, 0), self.transfer(10)]})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([x["status"] for x in response.json()["data"]], [200, 400])
+        self.assertEqual(self.balances(), (100, 0))
+        self.assertFalse(models.TransactionModel.objects.exists())
+
+    def test_per_item(self):
+        response = self.post(
+            "batch", {"atomic": False, "operations": [self.transfer(10), self.transfer(10, 0), self.transfer(10)]}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([x["success"] for x in response.json()["data"]], [True, False, True])
+        self.assertEqual(self.balances(), (80, 20))
+
+    def test_unknown_operation(self):
+        response = self.post("batch", {"operations": [{"operation": "getUser", "data": {}}]})
+        self.assertEqual(response.status_code, 400)
+
+    def test_limit(self):
+        with mock.patch.multiple(settings, BATCH_MAX_OPERATIONS=2):
+            response = self.post("batch", {"operations": [self.transfer(1)] * 3})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(models.TransactionModel.objects.exists())
+
+
+class IdempotencyTestCase(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.sender = models.UserModel.objects.create(balance=100)
+        self.receiver = models.UserModel.objects.create()
+        self.data = {"sender_id": self.sender.id, "receiver_id": self.receiver.id, "amount": 30, "reason": "mate"}
+
+    def post(self, endpoint, data, application=None, key="retry-1"):
+        path = f"/api/v1/{endpoint}"
+        return self.client.post(
+            path, json.dumps(data), content_type="application/json",
+            HTTP_AUTHORIZATION=benchmark.authorization(application or self.application, data, path),
+            HTTP_IDEMPOTENCY_KEY=key
+        )
+
+    def test_retry(self):
+        first = self.post("performTransaction", self.data)
+        with self.assertNumQueries(1):
+            second = self.post("performTransaction", self.data)
+        self.assertEqual(first.json(), second.json())
+        self.assertEqual(second["Idempotent-Replayed"], "true")
+        self.sender.refresh_from_db()
+        self.assertEqual(self.sender.balance, 70)
+        self.assertEqual(models.TransactionModel.objects.count(), 1)
+
+    def test_different_request(self):
+        self.post("performTransaction", self.data)
+        response = self.post("performTransaction", {**self.data, "amount": 40})
+        self.assertEqual(response.status_code, 422)
+
+    def test_keys_per_application(self):
+        other = models.ApplicationModel.objects.create(token="other")
+        self.post("performTransaction", self.data)
+        self.post("performTransaction", self.data, application=other)
+        self.assertEqual(models.TransactionModel.objects.count(), 2)
+
+    def test_expired(self):
+        self.post("performTransaction", self.data)
+        models.IdempotencyKeyModel.objects.update(created=timezone.now() - datetime.timedelta(days=2))
+        self.post("performTransaction", self.data)
+        self.assertEqual(models.TransactionModel.objects.count(), 2)
+        self.assertEqual(models.IdempotencyKeyModel.objects.count(), 1)
+
+    def test_concurrent_duplicate(self):
+        response = self.post("performTransaction", self.data)
+        record = models.IdempotencyKeyModel.objects.get()
+        # The key is inserted by a concurrent request after this one looked it up
+        with mock.patch("api.idempotency._lookup", return_value=None):
+            replayed = self.post("performTransaction", self.data)
+        self.assertEqual(replayed.json(), response.json())
+        self.assertEqual(models.TransactionModel.objects.count(), 1)
+        self.assertEqual(models.IdempotencyKeyModel.objects.get(), record)
+
+    def test_server_error_is_rolled_back(self):
+        def view():
+            ledger.transfer(self.sender.id, self.receiver.id, 30, "mate")
+            return JsonResponse({"success": False, "info": "Failed"}, status=500)
+
+        request = RequestFactory().post("/api/v1/performTransaction", self.data, content_type="application/json")
+        response = idempotency.respond(request, self.application.id, "retry-1", view)
+        self.assertEqual(response.status_code, 500)
+        self.assertFalse(models.TransactionModel.objects.exists())
+        self.assertFalse(models.IdempotencyKeyModel.objects.exists())
+        self.sender.refresh_from_db()
+        self.assertEqual(self.sender.balance, 100)
+
+    def test_prune(self):
+        self.post("performTransaction", self.data)
+        models.IdempotencyKeyModel.objects.update(created=timezone.now() - datetime.timedelta(days=2))
+        call_command("idempotencykeys", stdout=io.StringIO())
+        self.assertFalse(models.IdempotencyKeyModel.objects.exists())
+
+
+class VoteTestCase(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.community = models.UserModel.objects.create(id=settings.COMMUNITY_USER_ID, balance=100, internal=True)
+        self.creator = models.UserModel.objects.create(internal=True)
+        self.voters = models.UserModel.objects.bulk_create([models.UserModel(internal=True) for _ in range(3)])
+        self.refund = models.RefundModel.objects.create(creator=self.creator, amount=20)
+
+    def vote(self, voter, positive):
+        return self.post("voteRefund", {"user_id": voter.id, "refund_id": self.refund.id, "positive": positive})
+
+    def counters(self):
+        self.refund.refresh_from_db()
+        return self.refund.positive_votes, self.refund.negative_votes
+
+    def test_revote(self):
+        self.vote(self.voters[0], True)
+        self.vote(self.voters[0], True)
+        self.assertEqual(self.counters(), (1, 0))
+        self.vote(self.voters[0], False)
+        self.assertEqual(self.counters(), (0, 1))
+        self.assertEqual(self.refund.votes.count(), 1)
+
+    def test_retract(self):
+        self.vote(self.voters[0], False)
+        self.post("retractRefundVote", {"user_id": self.voters[0].id, "refund_id": self.refund.id})
+        self.assertEqual(self.counters(), (0, 0))
+        self.assertFalse(self.refund.votes.exists())
+
+    def test_accept(self):
+        self.vote(self.voters[0], True)
+        self.vote(self.voters[1], False)
+        self.vote(self.voters[2], True)
+        self.assertTrue(self.refund.active)
+        self.vote(self.voters[1], True)
+        self.refund.refresh_from_db()
+        self.assertFalse(self.refund.active)
+        self.creator.refresh_from_db()
+        self.assertEqual(self.creator.balance, 20)
+
+    @mock.patch.multiple(settings, REFUND_VOTE_DELTA=1000)
+    def test_constant_queries(self):
+        self.vote(self.voters[2], False)
+        models.VoteModel.objects.bulk_create(
+            models.VoteModel(refund=self.refund, user=models.UserModel.objects.create(internal=True), positive=i % 2)
+            for i in range(100)
+        )
+        with CaptureQueriesContext(connection) as few:
+            self.vote(self.voters[0], True)
+        models.VoteModel.objects.bulk_create(
+            models.VoteModel(refund=self.refund, user=models.UserModel.objects.create(internal=True), positive=i % 2)
+            for i in range(100)
+        )
+        with CaptureQueriesContext(connection) as many:
+            self.vote(self.voters[1], True)
+        self.assertEqual(len(few), len(many))
+
+    def test_membership_poll(self):
+        user = models.UserModel.objects.create()
+        poll = models.MembershipPollModel.objects.create(creator=user, active=True)
+        for voter in self.voters[:2]:
+            self.post("voteMembership", {"user_id": voter.id, "membership_poll_id": poll.id, "positive": True})
+        poll.refresh_from_db()
+        user.refresh_from_db()
+        self.assertEqual((poll.positive_votes, poll.active, user.internal), (2, False, True))
+
+    def test_unique_vote(self):
+        models.VoteModel.objects.create(refund=self.refund, user=self.voters[0], positive=True)
+        with self.assertRaises(IntegrityError):
+            models.VoteModel.objects.create(refund=self.refund, user=self.voters[0], positive=False)
+
+
+class BenchmarkEndpointsTestCase(TestCase):
+    def test_report(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = f"{directory}/report.json"
+            arguments = ["--users", "20", "--transactions", "50", "--communisms", "3", "--repeat", "1"]
+            call_command("benchmark_endpoints", *arguments, "--output", path, stderr=io.StringIO())
+            with open(path) as fh:
+                report = json.load(fh)
+            self.assertTrue(all(x["status"] == 200 for x in report["endpoints"].values()))
+            self.assertEqual(report["endpoints"]["getConsumables"]["queries"], 0)
+
+            report["endpoints"]["getUser"]["queries"] -= 1
+            with open(path, "w") as fh:
+                json.dump(report, fh)
+            with self.assertRaises(CommandError):
+                call_command(
+                    "benchmark_endpoints", *arguments, "--compare", path, "--threshold", "100",
+                    stdout=io.StringIO(), stderr=io.StringIO()
+                )
+        self.assertFalse(models.UserModel.objects.exists())
+
+
+@override_settings(MIDDLEWARE=["api.profiling.ProfilingMiddleware", *django_settings.MIDDLEWARE])
+class ProfilingTestCase(APITestCase):
+    def setUp(self):
+        super().setUp()
+        profiling.metrics.reset()
+        models.UserModel.objects.create()
+
+    def tearDown(self):
+        super().tearDown()
+        profiling.metrics.reset()
+
+    def test_metrics(self):
+        self.get("getUser")
+        self.get("getUser")
+        self.post("performTransaction", {})
+        endpoint = 'endpoint="api/v1/getUser"'
+        self.assertEqual(profiling.metrics.requests["api/v1/getUser", 200], 2)
+        self.assertGreater(profiling.metrics.queries["api/v1/getUser"], 0)
+        self.assertEqual(profiling.metrics.queries["api/v1/performTransaction"], 0)
+        for name in ("auth", "view", "serialization", "other"):
+            self.assertIn(("api/v1/getUser", name), profiling.metrics.phases)
+
+        self.client.force_login(get_user_model().objects.create_superuser("admin"))
+        response = self.client.get("/admin/metrics")
+        self.assertEqual(response.status_code, 200)
+        body = response.content.decode()
+        self.assertIn(f'matebot_requests_total{{{endpoint},status="200"}} 2', body)
+        self.assertIn(f'matebot_request_seconds_count{{{endpoint}}} 2', body)
+        self.assertIn(f'matebot_request_seconds_bucket{{{endpoint},le="+Inf"}} 2', body)
+
+    def test_metrics_admin_only(self):
+        response = self.client.get("/admin/metrics")
+        self.assertEqual(response.status_code, 302)
+
+    def test_slow_request_dump(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with mock.patch.multiple(
+                    settings, PROFILING_SLOW_REQUEST=0, PROFILING_DUMP_DIR=pathlib.Path(directory)
+            ):
+                self.post("performTransaction", {})
+            self.assertEqual(len(list(pathlib.Path(directory).glob("*-api_v1_performTransaction-*.prof"))), 1)
+
+    def test_one_profiler_at_a_time(self):
+        with mock.patch.multiple(settings, PROFILING_SLOW_REQUEST=0), mock.patch.object(profiling, "_dump") as dump:
+            # Held by a request profiled in another thread
+            with profiling._profiler_lock:
+                self.post("performTransaction", {})
+            self.assertEqual(dump.call_count, 0)
+            self.post("performTransaction", {})
+            self.assertEqual(dump.call_count, 1)
+        self.assertEqual(profiling.metrics.requests["api/v1/performTransaction", 400], 2)
+
+    async def test_async(self):
+        path = "/api/v1/getCommunisms"
+        await self.async_client.get(path, AUTHORIZATION=benchmark.authorization(self.application, {}, path))
+        self.assertEqual(profiling.metrics.requests["api/v1/getCommunisms", 200], 1)
+        self.assertIn(("api/v1/getCommunisms", "auth"), profiling.metrics.phases)
+
+
+class DatabaseSettingsTestCase(TestCase):
+    def test_sqlite_pragmas(self):
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA busy_timeout")
+            self.assertEqual(cursor.fetchone()[0], settings.SQLITE_PRAGMAS["busy_timeout"])
+            cursor.execute("PRAGMA synchronous")
+            # 1 is normal
+            self.assertEqual(cursor.fetchone()[0], 1)
+
+
+class ResolveUserTestCase(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = models.UserModel.objects.create(name="alice")
+        models.UserAliasModel.objects.create(user=self.user, application=self.application, user_alias="42")
+
+    def test_resolve(self):
+        response = self.get("resolveUser", {"application_id": self.application.id, "user_alias": "42"})
+        self.assertEqual(response.json()["data"]["identifier"], self.user.id)
+        response = self.get("resolveUser", {"application_id": self.application.id, "user_alias": "43"})
+        self.assertEqual(response.status_code, 404)
+
+    def test_batch(self):
+        other = models.UserModel.objects.create()
+        models.UserAliasModel.objects.create(user=other, application=self.application, user_alias="7")
+        data = {"application_id": self.application.id, "user_aliases": ["42", "7", "unknown"]}
+        response = self.post("resolveUser", data)
+        self.assertEqual(
+            {x: y and y["identifier"] for x, y in response.json()["data"].items()},
+            {"42": self.user.id, "7": other.id, "unknown": None}
+        )
+        # Known aliases come from the cache, only the users and the unknown alias are read
+        with self.assertNumQueries(4):
+            self.post("resolveUser", data)
+
+    def test_create_user_evicts(self):
+        params = {"application_id": self.application.id, "user_alias": "new"}
+        self.assertEqual(self.get("resolveUser", params).status_code, 404)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.post("createUser", {"application_id": self.application.id, "user_alias": "new"})
+        self.assertEqual(self.get("resolveUser", params).json()["data"]["identifier"], response.json()["data"])
+
+    def test_miss_is_not_cached(self):
+        params = {"application_id": self.application.id, "user_alias": "new"}
+        self.assertEqual(self.get("resolveUser", params).status_code, 404)
+        # Created by another process, which can not evict the alias here
+        models.UserAliasModel.objects.create(user=self.user, application=self.application, user_alias="new")
+        self.assertEqual(self.get("resolveUser", params).json()["data"]["identifier"], self.user.id)
+
+    def test_delete_alias_evicts(self):
+        other = models.ApplicationModel.objects.create(token="other")
+        models.UserAliasModel.objects.create(user=self.user, application=other, user_alias="alice")
+        params = {"application_id": other.id, "user_alias": "alice"}
+        self.assertEqual(self.get("resolveUser", params).status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.post("deleteUserAlias", {"user_id": self.user.id, "application_id": other.id})
+        self.assertEqual(self.get("resolveUser", params).status_code, 404)
+
+    def test_deleted_by_other_process(self):
+        params = {"application_id": self.application.id, "user_alias": "42"}
+        self.assertEqual(self.get("resolveUser", params).status_code, 200)
+        # Deleted by another process, which then changes the shared generation
+        models.UserAliasModel.objects.filter(user_alias="42").delete()
+        self.assertEqual(self.get("resolveUser", params).status_code, 200)
+        django_cache.set(aliases.generation.key, "other process", None)
+        self.assertEqual(self.get("resolveUser", params).status_code, 404)
+
+    def test_evict_changes_generation(self):
+        generation = aliases.generation.get()
+        other = models.ApplicationModel.objects.create(token="other")
+        models.UserAliasModel.objects.create(user=self.user, application=other, user_alias="alice")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.post("deleteUserAlias", {"user_id": self.user.id, "application_id": other.id})
+        self.assertNotEqual(aliases.generation.get(), generation)
+
+    def test_duplicate_alias(self):
+        response = self.post("createUser", {"application_id": self.application.id, "user_alias": "42"})
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(models.UserModel.objects.count(), 1)
+
+    def test_lru(self):
+        for alias in ("a", "b"):
+            models.UserAliasModel.objects.create(user=self.user, application=self.application, user_alias=alias)
+        cache = aliases.AliasCache(size=2, ttl=60)
+        for alias in ("a", "b", "42", "unknown"):
+            cache.get(self.application.id, [alias])
+        self.assertEqual(
+            cache.cached(self.application.id, ["a", "b", "42", "unknown"]),
+            ({"b": self.user.id, "42": self.user.id}, ["a", "unknown"])
+        )
+
+
+@mock.patch.multiple(settings, CHANGES_SETTLE_DELAY=0)
+class ChangesTestCase(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.users = models.UserModel.objects.bulk_create(models.UserModel(internal=True) for _ in range(5))
+        self.communism = models.CommunismModel.objects.create(creator=self.users[0], amount=10, reason="")
+
+    def sync(self, since=None, amount=None):
+        params = {"since": since} if since else {}
+        if amount:
+            params["amount"] = amount
+        return self.get("changes", params).json()
+
+    def test_full_sync_in_pages(self):
+        seen, cursor, more = [], None, True
+        while more:
+            response = self.sync(cursor, amount=2)
+            seen += [x["identifier"] for x in response["data"]["users"]]
+            cursor, more = response["next"], response["more"]
+        self.assertEqual(seen, [x.id for x in self.users])
+
+    def test_only_changes(self):
+        cursor = self.sync()["next"]
+        self.assertEqual(self.sync(cursor)["data"], {"users": [], "communisms": []})
+        ledger.transfer(self.users[1].id, self.users[2].id, 5, "")
+        self.post("joinCommunism", {"user_id": self.users[3].id, "communism_id": self.communism.id})
+        response = self.sync(cursor)
+        self.assertEqual(
+            sorted(x["identifier"] for x in response["data"]["users"]), [self.users[1].id, self.users[2].id]
+        )
+        self.assertEqual([x["identifier"] for x in response["data"]["communisms"]], [self.communism.id])
+        self.assertEqual(self.sync(response["next"])["data"], {"users": [], "communisms": []})
+
+    def test_settle_delay(self):
+        with mock.patch.multiple(settings, CHANGES_SETTLE_DELAY=60):
+            self.assertEqual(self.sync()["data"], {"users": [], "communisms": []})
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.get("changes", {"since": "abc"}).status_code, 400)
+
+
+class ConsumeTestCase(APITestCase):
+    def setUp(self):
+        super().setUp()
+        catalogue.consumable_cache._clear()
+        self.community = models.UserModel.objects.create(id=settings.COMMUNITY_USER_ID, internal=True)
+        self.user = models.UserModel.objects.create(balance=500)
+        self.mate = models.ConsumableModel.objects.create(name="mate", price=150, symbol="m")
+        self.mate.messages.create(message="Enjoy your mate")
+
+    def tearDown(self):
+        super().tearDown()
+        catalogue.consumable_cache._clear()
+
+    def test_consume(self):
+        response = self.post("consume", {"user_id": self.user.id, "consumable": "mate", "quantity": 2})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()["data"]
+        self.assertEqual((data["amount"], data["balance"], data["message"]), (300, 200, "Enjoy your mate"))
+        self.community.refresh_from_db()
+        self.assertEqual(self.community.balance, 300)
+        transaction = models.TransactionModel.objects.get(id=data["transaction_id"])
+        self.assertEqual((transaction.sender_id, transaction.receiver_id), (self.user.id, self.community.id))
+
+    def test_by_id(self):
+        self.post("consume", {"user_id": self.user.id, "consumable": self.mate.id})
+        # The catalogue is cached, only the transfer and the balance are queried, plus two savepoints
+        with self.assertNumQueries(7):
+            response = self.post("consume", {"user_id": self.user.id, "consumable": self.mate.id})
+        self.assertEqual(response.json()["data"]["balance"], 200)
+
+    def test_unknown(self):
+        response = self.post("consume", {"user_id": self.user.id, "consumable": "club mate"})
+        self.assertEqual(response.status_code, 404)
+        response = self.post("consume", {"user_id": 1234, "consumable": "mate"})
+        self.assertEqual(response.status_code, 400)
+        self.community.refresh_from_db()
+        self.assertEqual(self.community.balance, 0)
+        self.assertFalse(models.TransactionModel.objects.exists())
+
+
+class RollupsTestCase(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.users = models.UserModel.objects.bulk_create(models.UserModel() for _ in range(3))
+
+    def fold(self):
+        return rollups.fold(settle_delay=0)
+
+    def test_incremental(self):
+        ledger.transfer(self.users[0].id, self.users[1].id, 10, "")
+        ledger.transfer(self.users[0].id, self.users[2].id, 6, "", consumable="mate", quantity=2)
+        self.assertEqual(self.fold(), 2)
+        ledger.transfer(self.users[1].id, self.users[2].id, 3, "", consumable="mate", quantity=1)
+        ledger.transfer(self.users[1].id, self.users[2].id, 5, "", consumable="pizza", quantity=1)
+        self.assertEqual(self.fold(), 2)
+        self.assertEqual(self.fold(), 0)
+        self.assertEqual(
+            [x.to_dict() for x in models.UserStatisticModel.objects.order_by("user_id")],
+            [
+                {"user_id": self.users[0].id, "sent": 16, "received": 0, "consumed": 6, "quantity": 2},
+                {"user_id": self.users[1].id, "sent": 8, "received": 10, "consumed": 8, "quantity": 2},
+                {"user_id": self.users[2].id, "sent": 0, "received": 14, "consumed": 0, "quantity": 0},
+            ]
+        )
+        self.assertEqual(
+            list(models.ConsumableStatisticModel.objects.order_by("name").values_list("name", "quantity", "amount")),
+            [("mate", 3, 9), ("pizza", 1, 5)]
+        )
+        today = timezone.now().date()
+        self.assertEqual(
+            models.DailyStatisticModel.objects.get(day=today, user=None, consumable="").to_dict(),
+            {"day": today.isoformat(), "transactions": 4, "amount": 24, "quantity": 4}
+        )
+
+    def test_settle_delay(self):
+        ledger.transfer(self.users[0].id, self.users[1].id, 10, "")
+        self.assertEqual(rollups.fold(settle_delay=60), 0)
+        self.assertEqual(self.fold(), 1)
+
+    def test_rebuild(self):
+        ledger.transfer(self.users[0].id, self.users[1].id, 10, "")
+        self.fold()
+        models.UserStatisticModel.objects.update(sent=0)
+        with mock.patch.multiple(settings, LEDGER_SETTLE_DELAY=0):
+            call_command("rollups", "--rebuild", stdout=io.StringIO())
+        self.assertEqual(models.UserStatisticModel.objects.get(user=self.users[0]).sent, 10)
+
+    def test_consume_is_tagged(self):
+        community = models.UserModel.objects.create(id=settings.COMMUNITY_USER_ID)
+        models.ConsumableModel.objects.create(name="mate", price=150, symbol="m")
+        catalogue.consumable_cache._clear()
+        self.post("consume", {"user_id": self.users[0].id, "consumable": "mate", "quantity": 2})
+        catalogue.consumable_cache._clear()
+        self.fold()
+        self.assertEqual(models.ConsumableStatisticModel.objects.get(name="mate").quantity, 2)
+        self.assertEqual(models.UserStatisticModel.objects.get(user=community).received, 300)
+
+    def test_leaderboard(self):
+        for i, user in enumerate(self.users):
+            ledger.transfer(user.id, self.users[0].id, i + 1, "", consumable=f"c{i}", quantity=3 - i)
+        self.fold()
+        response = self.get("getLeaderboard", {"by": "sent", "amount": 2})
+        self.assertEqual([x["user_id"] for x in response.json()["data"]], [self.users[2].id, self.users[1].id])
+        response = self.get("getLeaderboard", {"of": "consumables", "by": "quantity"})
+        self.assertEqual([x["name"] for x in response.json()["data"]], ["c0", "c1", "c2"])
+        # A single query on the rollups, independent of the size of the ledger
+        with self.assertNumQueries(1):
+            self.get("getLeaderboard")
+        self.assertEqual(self.get("getLeaderboard", {"of": "transactions"}).status_code, 400)
+        self.assertEqual(self.get("getLeaderboard", {"by": "amount"}).status_code, 400)
+        self.assertEqual(self.get("getLeaderboard", {"amount": 1000}).status_code, 400)
+
+    def test_statistics(self):
+        ledger.transfer(self.users[0].id, self.users[1].id, 10, "", consumable="mate", quantity=1)
+        ledger.transfer(self.users[1].id, self.users[0].id, 4, "")
+        yesterday = timezone.now() - datetime.timedelta(days=1)
+        models.TransactionModel.objects.filter(amount=4).update(created=yesterday)
+        self.fold()
+        today = timezone.now().date()
+        response = self.get("getStatistics")
+        self.assertEqual(
+            [(x["day"], x["transactions"], x["amount"]) for x in response.json()["data"]],
+            [(yesterday.date().isoformat(), 1, 4), (today.isoformat(), 1, 10)]
+        )
+        response = self.get("getStatistics", {"user_id": self.users[0].id})
+        self.assertEqual([x["amount"] for x in response.json()["data"]], [10])
+        response = self.get("getStatistics", {"consumable": "mate", "since": today.isoformat()})
+        self.assertEqual([x["quantity"] for x in response.json()["data"]], [1])
+        response = self.get("getStatistics", {"since": today.isoformat(), "until": yesterday.date().isoformat()})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.get("getStatistics", {"since": "yesterday"}).status_code, 400)
+
+
+@mock.patch.multiple(settings, LEDGER_SETTLE_DELAY=0)
+class ArchivalTestCase(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.community = models.UserModel.objects.create(id=settings.COMMUNITY_USER_ID, internal=True)
+        self.users = models.UserModel.objects.bulk_create(models.UserModel() for _ in range(3))
+        self.old = timezone.now() - datetime.timedelta(days=100)
+
+    def transfer(self, sender, receiver, amount, old=False, **kwargs):
+        transaction = ledger.transfer(sender.id, receiver.id, amount, "", **kwargs)
+        if old:
+            models.TransactionModel.objects.filter(id=transaction.id).update(created=self.old)
+        return transaction
+
+    def archive(self):
+        call_command("archive", "--days", "30", stdout=io.StringIO())
+
+    def test_carry_forward(self):
+        self.transfer(self.users[0], self.users[1], 10, old=True)
+        self.transfer(self.users[1], self.users[2], 4, old=True)
+        self.transfer(self.community, self.users[0], 3, old=True)
+        recent = self.transfer(self.users[2], self.users[0], 1)
+        self.archive()
+        self.assertEqual(models.ArchivedTransactionModel.objects.count(), 3)
+        self.assertEqual(
+            set(models.TransactionModel.objects.filter(id__lt=0).values_list("sender_id", "receiver_id", "amount")),
+            {
+                (self.users[0].id, self.community.id, 7),
+                (self.community.id, self.users[1].id, 6),
+                (self.community.id, self.users[2].id, 4),
+            }
+        )
+        self.assertEqual(reconciliation.drift(), [])
+        reconciliation.reset()
+        self.assertEqual(reconciliation.drift(), [])
+        self.assertEqual(reconciliation.fold(), 1)
+        self.assertEqual(reconciliation.drift(), [])
+
+        response = self.get("getHistory", {"target_id": self.users[0].id})
+        self.assertEqual(
+            [x["identifier"] for x in response.json()["data"]],
+            [recent.id, archival.carry_forward_id(self.users[0].id)]
+        )
+        response = self.get("getHistory", {"target_id": self.users[0].id, "archive": 1})
+        self.assertEqual([x["amount"] for x in response.json()["data"]], [3, 10])
+
+    def test_repeated(self):
+        self.transfer(self.users[0], self.users[1], 10, old=True)
+        self.archive()
+        self.transfer(self.users[0], self.users[1], 5, old=True)
+        self.transfer(self.users[1], self.users[0], 15, old=True)
+        self.archive()
+        self.assertEqual(models.ArchivedTransactionModel.objects.count(), 3)
+        # Both users are even, their carry-forward transactions are gone
+        self.assertFalse(models.TransactionModel.objects.exists())
+        self.assertEqual(reconciliation.drift(), [])
+
+    def test_statistics_survive(self):
+        self.transfer(self.users[0], self.users[1], 10, old=True, consumable="mate", quantity=2)
+        self.archive()
+        # Carry-forward transactions are no activity
+        self.assertEqual(rollups.fold(), 0)
+        call_command("rollups", "--rebuild", stdout=io.StringIO())
+        self.assertEqual(models.UserStatisticModel.objects.get(user=self.users[0]).sent, 10)
+        self.assertEqual(models.ConsumableStatisticModel.objects.get(name="mate").quantity, 2)
+
+    def test_refund_transaction_is_kept(self):
+        refund_transaction = self.transfer(self.community, self.users[0], 50, old=True)
+        models.RefundModel.objects.create(creator=self.users[0], amount=50, transaction=refund_transaction)
+        self.transfer(self.users[0], self.users[1], 10, old=True)
+        self.archive()
+        self.assertTrue(models.TransactionModel.objects.filter(id=refund_transaction.id).exists())
+        self.assertEqual(models.ArchivedTransactionModel.objects.count(), 1)
+        self.assertEqual(reconciliation.drift(), [])
+
+    def test_since_after_archive(self):
+        refund_transaction = self.transfer(self.community, self.users[0], 50, old=True)
+        models.RefundModel.objects.create(creator=self.users[0], amount=50, transaction=refund_transaction)
+        self.transfer(self.users[0], self.users[1], 10, old=True)
+        recent = self.transfer(self.users[1], self.users[0], 1)
+        self.archive()
+        carry_forward = sorted(models.TransactionModel.objects.filter(id__lte=0).values_list("id", flat=True))
+        self.assertEqual(len(carry_forward), 2)
+
+        since = (self.old - datetime.timedelta(days=1)).timestamp()
+        rows = self.get("exportTransactions", {"format": "jsonl", "since": since}).streaming_content
+        self.assertEqual(
+            [json.loads(x)["id"] for x in b"".join(rows).splitlines()],
+            carry_forward + [refund_transaction.id, recent.id]
+        )
+        response = self.get("getHistory", {"target_id": self.users[0].id, "since": since})
+        self.assertEqual(
+            [x["identifier"] for x in response.json()["data"]],
+            [recent.id, refund_transaction.id, archival.carry_forward_id(self.users[0].id)]
+        )
+        until = (timezone.now() - datetime.timedelta(days=1)).timestamp()
+        response = self.get("getHistory", {"target_id": self.users[0].id, "until": until})
+        self.assertEqual(
+            [x["identifier"] for x in response.json()["data"]],
+            [refund_transaction.id, archival.carry_forward_id(self.users[0].id)]
+        )
+
+    def test_history_pages_into_archive(self):
+        first = self.transfer(self.users[0], self.users[1], 10, old=True)
+        second = self.transfer(self.users[1], self.users[0], 3, old=True)
+        recent = self.transfer(self.users[0], self.users[2], 1)
+        self.archive()
+        # The last page of the ledger ends on the carry-forward transaction, its cursor continues in the archive
+        params = {"target_id": self.users[0].id, "amount": 1}
+        identifiers = []
+        for archive in (0, 1):
+            while data := self.get("getHistory", {**params, "archive": archive}).json()["data"]:
+                identifiers.extend(x["identifier"] for x in data)
+                params["cursor"] = data[-1]["identifier"]
+        self.assertEqual(
+            identifiers, [recent.id, archival.carry_forward_id(self.users[0].id), second.id, first.id]
+        )
+
+    def test_missing_community_user(self):
+        self.transfer(self.users[0], self.users[1], 10, old=True)
+        self.community.delete()
+        with self.assertRaises(CommandError):
+            self.archive()
+        self.assertFalse(models.ArchivedTransactionModel.objects.exists())
+
+
+class ExportTestCase(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.users = models.UserModel.objects.bulk_create(models.UserModel() for _ in range(2))
+        self.old = ledger.transfer(self.users[0].id, self.users[1].id, 10, "old")
+        models.TransactionModel.objects.filter(id=self.old.id).update(
+            created=timezone.now() - datetime.timedelta(days=10)
+        )
+        self.mate = ledger.transfer(self.users[1].id, self.users[0].id, 3, "", consumable="mate", quantity=2)
+
+    def content(self, params):
+        response = self.get("exportTransactions", params)
+        self.assertEqual(response.status_code, 200)
+        return b"".join(response.streaming_content)
+
+    def test_csv(self):
+        with mock.patch.multiple(settings, STREAM_CHUNK_SIZE=1):
+            response = self.get("exportTransactions")
+            chunks = list(response.streaming_content)
+        self.assertEqual(response["Content-Type"], "text/csv")
+        self.assertEqual(len(chunks), 3)
+        rows = list(csv.reader(io.StringIO(b"".join(chunks).decode())))
+        self.assertEqual(rows[0], export.FIELDS)
+        self.assertEqual(
+            [x[:7] for x in rows[1:]],
+            [
+                [str(self.old.id), str(self.users[0].id), str(self.users[1].id), "10", "old", "", ""],
+                [str(self.mate.id), str(self.users[1].id), str(self.users[0].id), "3", "", "mate", "2"],
+            ]
+        )
+
+    def test_jsonl_since(self):
+        since = timezone.now() - datetime.timedelta(days=1)
+        rows = [json.loads(x) for x in self.content({"format": "jsonl", "since": since.timestamp()}).splitlines()]
+        self.assertEqual([(x["id"], x["consumable"], x["quantity"]) for x in rows], [(self.mate.id, "mate", 2)])
+        rows = self.content({"format": "jsonl", "until": since.timestamp()}).splitlines()
+        self.assertEqual([json.loads(x)["id"] for x in rows], [self.old.id])
+        self.assertEqual(self.content({"format": "jsonl", "since": time.time() + 60}), b"")
+
+    @skipUnless(importlib.util.find_spec("pyarrow"), "pyarrow is not installed")
+    def test_parquet(self):
+        import pyarrow.parquet
+        table = pyarrow.parquet.read_table(io.BytesIO(self.content({"format": "parquet"})))
+        self.assertEqual(table.column_names, export.FIELDS)
+        self.assertEqual(table.column("amount").to_pylist(), [10, 3])
+        self.assertEqual(table.column("created").to_pylist()[1], self.mate.created)
+
+    def test_bad_parameters(self):
+        self.assertEqual(self.get("exportTransactions", {"format": "xlsx"}).status_code, 400)
+        self.assertEqual(self.get("exportTransactions", {"since": "yesterday"}).status_code, 400)
+
+    def test_command(self):
+        models.UserModel.objects.create(id=settings.COMMUNITY_USER_ID)
+        with mock.patch.multiple(settings, LEDGER_SETTLE_DELAY=0):
+            archival.archive(timezone.now() - datetime.timedelta(days=5))
+        with tempfile.TemporaryDirectory() as directory:
+            path = pathlib.Path(directory) / "transactions.jsonl"
+            call_command("export", str(path), "--format", "jsonl", stdout=io.StringIO())
+            ledger_ids = [json.loads(x)["id"] for x in path.read_text().splitlines()]
+            call_command("export", str(path), "--format", "jsonl", "--archive", stdout=io.StringIO())
+            all_ids = [json.loads(x)["id"] for x in path.read_text().splitlines()]
+        # The carry-forward transactions replace the archived one in the ledger
+        self.assertEqual(len(ledger_ids), 3)
+        self.assertNotIn(self.old.id, ledger_ids)
+        self.assertEqual(all_ids, [self.old.id, self.mate.id])
+
+
+class AdminTestCase(TestCase):
+    def setUp(self):
+        self.client.force_login(get_user_model().objects.create_superuser("admin"))
+        self.application = models.ApplicationModel.objects.create(token="secret")
+
+    def create(self, model):
+        """Create one row of the model with all its foreign keys set."""
+        user = models.UserModel.objects.create(voucher=models.UserModel.objects.create())
+        if model is models.UserModel:
+            return
+        if model is models.UserAliasModel:
+            models.UserAliasModel.objects.create(user=user, application=self.application, user_alias=str(user.id))
+        elif model is models.TransactionModel:
+            ledger.transfer(user.id, user.voucher_id, 1, "")
+        elif model is models.ArchivedTransactionModel:
+            models.ArchivedTransactionModel.objects.create(
+                id=user.id, sender=user, receiver=user.voucher, amount=1, created=timezone.now()
+            )
+        elif model is models.CommunismModel:
+            models.CommunismModel.objects.create(creator=user, amount=1, reason="")
+        elif model is models.CommunismUserModel:
+            models.CommunismUserModel.objects.create(user=user)
+        elif model is models.RefundModel:
+            models.RefundModel.objects.create(creator=user, amount=1)
+        elif model is models.MembershipPollModel:
+            models.MembershipPollModel.objects.create(creator=user)
+        elif model is models.VoteModel:
+            refund = models.RefundModel.objects.create(creator=user, amount=1)
+            models.VoteModel.objects.create(user=user, refund=refund, positive=True)
+
+    def changelist_queries(self, model):
+        url = f"/admin/api/{model._meta.model_name}/"
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_changelists(self):
+        for model in [
+            models.UserModel, models.UserAliasModel, models.TransactionModel, models.ArchivedTransactionModel,
+            models.CommunismModel, models.CommunismUserModel, models.RefundModel, models.MembershipPollModel,
+            models.VoteModel,
+        ]:
+            with self.subTest(model=model.__name__):
+                self.create(model)
+                few = self.changelist_queries(model)
+                for _ in range(10):
+                    self.create(model)
+                # Related rows are joined in, the number of queries does not grow with the rows shown
+                self.assertEqual(self.changelist_queries(model), few)
+
+    def test_transaction_form_has_no_user_select(self):
+        models.UserModel.objects.bulk_create(models.UserModel() for _ in range(50))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/admin/api/transactionmodel/add/")
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse([x for x in queries if 'FROM "api_usermodel"' in x["sql"]])
 
-# Create your tests here.
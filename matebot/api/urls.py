@@ -7,10 +7,16 @@ urlpatterns = [
     path("getConsumables", GetConsumableView.as_view()),
 
     path("performTransaction", PerformTransactionView.as_view()),
+    path("consume", ConsumeView.as_view()),
+    path("getLeaderboard", GetLeaderboardView.as_view()),
+    path("getStatistics", GetStatisticsView.as_view()),
 
     path("getUser", GetUserView.as_view()),
+    path("resolveUser", ResolveUserView.as_view()),
+    path("changes", ChangesView.as_view()),
     path("createUser", CreateUserView.as_view()),
     path("getHistory", GetHistoryView.as_view()),
+    path("exportTransactions", ExportTransactionsView.as_view()),
     path("deleteUserAlias", DeleteUserAliasView.as_view()),
 
     path("requestMembership", RequestMembershipView.as_view()),
@@ -30,4 +36,6 @@ urlpatterns = [
     path("cancelRefund", CancelRefundView.as_view()),
     path("voteRefund", VoteRefundView.as_view()),
     path("retractRefundVote", RetractRefundVoteView.as_view()),
+
+    path("batch", BatchView.as_view()),
 ]
@@ -1,63 +1,87 @@
+import datetime
+import heapq
+import itertools
 import json
+import random
 import signal
 
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
 from django.core.handlers.wsgi import WSGIRequest
-from django.db.models import F
-from django.http import JsonResponse
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q, QuerySet
+from django.http import HttpResponse, HttpResponseNotModified, JsonResponse, StreamingHttpResponse
+from django.utils import timezone
 from django.utils.decorators import method_decorator
+from django.utils.http import parse_etags
 from django.views import View
-import rc_protocol
 from django.views.decorators.csrf import csrf_exempt
 
-from api import models
+from api import aliases, auth, callbacks, catalogue, export, idempotency, ledger, models
+from api.profiling import phase
 from matebot import settings
 
 
 @method_decorator(csrf_exempt, name='dispatch')
 class AuthView(View):
-    """This is the base class to ensure requests are only allowed when authenticated"""
+    """This is the base class to ensure requests are only allowed when authenticated
 
-    def _check_auth(self, request, data=None):
+    Views with ``idempotent`` set accept an Idempotency-Key header on POST requests, see api/idempotency.py.
+    """
+
+    idempotent = False
+
+    def _parse_auth(self, request, data=None):
+        """Extract what has to be validated from the request.
+
+        :return: Tuple of the signed data, checksum and application id or a JsonResponse if it is malformed
+        """
         if "Authorization" not in request.headers:
             return JsonResponse({"success": False, "info": "Authentication failed"}, status=401)
-        if " " not in request.headers["Authorization"]:
+        credentials = auth.parse_authorization(request.headers["Authorization"])
+        if credentials is None:
             return JsonResponse({"success": False, "info": "Authentication failed"}, status=401)
-        checksum = request.headers["Authorization"].split(" ")[1]
+        application_id, checksum = credentials
         if request.META["REQUEST_METHOD"] == "GET":
-            if not any([
-                rc_protocol.validate_checksum(
-                    dict(((x, request.GET[x]) for x in request.GET)),
-                    checksum,
-                    x.token,
-                    salt=request.path
-                )
-                for x in models.ApplicationModel.objects.all()
-            ]):
-                return JsonResponse({"success": False, "info": "Authorization failed"}, status=403)
-        elif request.META["REQUEST_METHOD"] == "POST":
-            if not any([
-                rc_protocol.validate_checksum(data, checksum, x.token, salt=request.path)
-                for x in models.ApplicationModel.objects.all()
-            ]):
-                return JsonResponse({"success": False, "info": "Authorization failed"}, status=403)
-        else:
+            data = dict(((x, request.GET[x]) for x in request.GET))
+        elif request.META["REQUEST_METHOD"] != "POST":
             return JsonResponse({"success": False, "info": "Method not supported"}, status=405)
+        return data, checksum, application_id
+
+    def _check_auth(self, request, data=None):
+        parsed = self._parse_auth(request, data)
+        if isinstance(parsed, JsonResponse):
+            return parsed
+        data, checksum, application_id = parsed
+        if not auth.validate(data, checksum, application_id, salt=request.path):
+            return JsonResponse({"success": False, "info": "Authorization failed"}, status=403)
 
     def get(self, request: WSGIRequest, *args, **kwargs):
-        ret = self._check_auth(request)
+        with phase("auth"):
+            ret = self._check_auth(request)
         if isinstance(ret, JsonResponse):
             return ret
-        return self.secure_get(request, *args, **kwargs)
+        with phase("view"):
+            return self.secure_get(request, *args, **kwargs)
 
     def post(self, request, *args, **kwargs):
         try:
             decoded = json.loads(request.body)
         except json.JSONDecodeError:
             return JsonResponse({"success": False, "info": "JSON could not be decoded"}, status=400)
-        ret = self._check_auth(request, data=decoded)
+        with phase("auth"):
+            ret = self._check_auth(request, data=decoded)
         if isinstance(ret, JsonResponse):
             return ret
-        return self.secure_post(request, decoded, *args, **kwargs)
+        with phase("view"):
+            if self.idempotent and idempotency.HEADER in request.headers:
+                application_id, _ = auth.parse_authorization(request.headers["Authorization"])
+                return idempotency.respond(
+                    request, application_id, request.headers[idempotency.HEADER],
+                    lambda: self.secure_post(request, decoded, *args, **kwargs)
+                )
+            return self.secure_post(request, decoded, *args, **kwargs)
 
     def secure_get(self, request, *args, **kwargs):
         return JsonResponse({"success": False, "info": "Method not allowed"}, status=405)
@@ -66,22 +90,241 @@ class AuthView(View):
         return JsonResponse({"success": False, "info": "Method not allowed"}, status=405)
 
 
-class GetConsumableView(AuthView):
-    def secure_get(self, request, *args, **kwargs):
-        data = [x.to_dict() for x in models.ConsumableModel.objects.all()]
-        return JsonResponse({"success": True, "data": data})
+class AsyncAuthView(AuthView):
+    """Base class for views with native async implementations.
 
+    Subclasses implement secure_get and secure_post as coroutines.
+    """
 
-class GetUserView(AuthView):
-    def secure_get(self, request, *args, **kwargs):
+    async def _check_auth(self, request, data=None):
+        parsed = self._parse_auth(request, data)
+        if isinstance(parsed, JsonResponse):
+            return parsed
+        data, checksum, application_id = parsed
+        if not await auth.avalidate(data, checksum, application_id, salt=request.path):
+            return JsonResponse({"success": False, "info": "Authorization failed"}, status=403)
+
+    async def get(self, request, *args, **kwargs):
+        with phase("auth"):
+            ret = await self._check_auth(request)
+        if isinstance(ret, JsonResponse):
+            return ret
+        with phase("view"):
+            return await self.secure_get(request, *args, **kwargs)
+
+    async def post(self, request, *args, **kwargs):
+        try:
+            decoded = json.loads(request.body)
+        except json.JSONDecodeError:
+            return JsonResponse({"success": False, "info": "JSON could not be decoded"}, status=400)
+        with phase("auth"):
+            ret = await self._check_auth(request, data=decoded)
+        if isinstance(ret, JsonResponse):
+            return ret
+        with phase("view"):
+            return await self.secure_post(request, decoded, *args, **kwargs)
+
+    async def secure_get(self, request, *args, **kwargs):
+        return JsonResponse({"success": False, "info": "Method not allowed"}, status=405)
+
+    async def secure_post(self, request, decoded, *args, **kwargs):
+        return JsonResponse({"success": False, "info": "Method not allowed"}, status=405)
+
+
+def _parse_page(request, default_amount=None):
+    """Parse the pagination parameters of a GET request.
+
+    :return: Tuple of amount and cursor, each None if not given, or a JsonResponse if a parameter is invalid
+    """
+    amount, cursor = default_amount, None
+    try:
+        if "amount" in request.GET:
+            amount = int(request.GET["amount"])
+            if amount <= 0:
+                raise ValueError
+        if "cursor" in request.GET:
+            cursor = int(request.GET["cursor"])
+    except ValueError:
+        return JsonResponse({"success": False, "info": "Amount or cursor is no valid positive integer"}, status=400)
+    return amount, cursor
+
+
+def _is_streaming(request):
+    return request.GET.get("stream") in ("1", "true")
+
+
+def _page_rows(request, rows, amount):
+    if isinstance(rows, QuerySet):
+        if amount is not None:
+            rows = rows[:amount]
+        if _is_streaming(request):
+            rows = rows.iterator(chunk_size=settings.STREAM_CHUNK_SIZE)
+    return rows
+
+
+def _next_cursor(amount, count, last):
+    return last.id if amount is not None and count == amount else None
+
+
+def _page_data(rows, amount):
+    return {
+        "success": True,
+        "data": [x.to_dict() for x in rows],
+        "next": _next_cursor(amount, len(rows), rows[-1] if rows else None)
+    }
+
+
+def _encode_page(rows, amount):
+    """Encode the rows of a page to JSON while iterating over them, yielding chunks of the response body."""
+    encoder = DjangoJSONEncoder()
+    count, last, chunk = 0, None, []
+    yield '{"success": true, "data": ['
+    for row in rows:
+        chunk.append(("," if count else "") + encoder.encode(row.to_dict()))
+        count, last = count + 1, row
+        if len(chunk) == settings.STREAM_CHUNK_SIZE:
+            yield "".join(chunk)
+            chunk = []
+    yield "".join(chunk)
+    yield f'], "next": {encoder.encode(_next_cursor(amount, count, last))}}}'
+
+
+async def _aiterate(iterator):
+    """Iterate over a blocking iterator from async code.
+
+    Each step runs in the thread used for database access, so a server side cursor stays on its connection.
+    """
+    step = sync_to_async(next)
+    end = object()
+    while (item := await step(iterator, end)) is not end:
+        yield item
+
+
+async def _page_response(request, rows, amount):
+    """Respond with a page of rows.
+
+    rows is either a queryset, which is sliced to the page, or an iterable already limited to the page.
+    Unless the response is streamed, such an iterable has to be in memory already.
+    If a page is requested, the id of its last row is returned as cursor for the next page. With ``stream``
+    set, rows are encoded while they are fetched in chunks instead of building the whole list in memory first.
+    """
+    rows = _page_rows(request, rows, amount)
+    if not _is_streaming(request):
+        if isinstance(rows, QuerySet) and amount is None:
+            # All rows are read, in chunks the relations are prefetched for a chunk at a time instead of with
+            # one IN list holding every row
+            rows = await sync_to_async(list)(rows.iterator(chunk_size=settings.STREAM_CHUNK_SIZE))
+        else:
+            rows = [x async for x in rows] if isinstance(rows, QuerySet) else list(rows)
+        return JsonResponse(_page_data(rows, amount))
+    content = _encode_page(rows, amount)
+    if isinstance(request, ASGIRequest):
+        content = _aiterate(content)
+    return StreamingHttpResponse(content, content_type="application/json")
+
+
+def _merge_newest_first(request, querysets, amount):
+    """Merge querysets ordered by descending id into one page.
+
+    Every queryset is limited to the page on its own, so each one can be read from its own index.
+    Rows contained in more than one queryset are only returned once.
+    """
+    if amount is not None:
+        querysets = [x[:amount] for x in querysets]
+    if _is_streaming(request):
+        querysets = [x.iterator(chunk_size=settings.STREAM_CHUNK_SIZE) for x in querysets]
+    merged = heapq.merge(*querysets, key=lambda x: x.id, reverse=True)
+    unique = (next(group) for _, group in itertools.groupby(merged, key=lambda x: x.id))
+    return itertools.islice(unique, amount)
+
+
+def _parse_timestamp(value):
+    return datetime.datetime.fromtimestamp(float(value), tz=datetime.timezone.utc)
+
+
+class GetConsumableView(AsyncAuthView):
+    async def secure_get(self, request, *args, **kwargs):
+        _, body, etag = await catalogue.consumable_cache.aget()
+        if etag in parse_etags(request.headers.get("If-None-Match", "")):
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(body, content_type="application/json")
+        response.headers["ETag"] = etag
+        return response
+
+
+class GetUserView(AsyncAuthView):
+    async def secure_get(self, request, *args, **kwargs):
         if "filter" in request.GET:
             try:
-                data = models.UserModel.objects.get(id=request.GET["filter"]).to_dict()
+                data = (await models.UserModel.objects.with_relations().aget(id=request.GET["filter"])).to_dict()
             except models.UserModel.DoesNotExist:
                 return JsonResponse({"success": True, "data": []})
-        else:
-            data = [x.to_dict() for x in models.UserModel.objects.all()]
-        return JsonResponse({"success": True, "data": data})
+            return JsonResponse({"success": True, "data": data})
+        page = _parse_page(request)
+        if isinstance(page, JsonResponse):
+            return page
+        amount, cursor = page
+        users = models.UserModel.objects.with_relations().order_by("id")
+        if cursor is not None:
+            users = users.filter(id__gt=cursor)
+        return await _page_response(request, users, amount)
+
+
+_EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def _encode_change_cursor(*positions):
+    return ".".join(f"{(x - _EPOCH) // datetime.timedelta(microseconds=1)}.{y}" for x, y in positions)
+
+
+def _decode_change_cursor(cursor):
+    """Split the cursor into the positions of the users and the communisms, each a tuple of modified and id."""
+    values = [int(x) for x in cursor.split(".")]
+    if len(values) != 4:
+        raise ValueError
+    return [(_EPOCH + datetime.timedelta(microseconds=values[i]), values[i + 1]) for i in (0, 2)]
+
+
+class ChangesView(AsyncAuthView):
+    """Return users and communisms modified since the cursor, so clients can keep a local copy up to date.
+
+    Rows are read in order of modified and id, the cursor holds the position of the last returned row of both.
+    Without ``since`` all rows are returned. As long as ``more`` is set, the next page can be requested at once.
+    Rows which are not settled yet, see ledger.settle_horizon, are left for the next request, so changes of
+    transactions committing after a later one are not skipped.
+    """
+
+    async def _changed(self, rows, position, horizon, amount):
+        modified, row_id = position
+        rows = rows.filter(
+            Q(modified__gt=modified) | Q(modified=modified, id__gt=row_id), modified__lte=horizon
+        ).order_by("modified", "id")
+        return [x async for x in rows[:amount]]
+
+    async def secure_get(self, request, *args, **kwargs):
+        page = _parse_page(request, default_amount=settings.CHANGES_PAGE_SIZE)
+        if isinstance(page, JsonResponse):
+            return page
+        amount, _ = page
+        try:
+            positions = _decode_change_cursor(request.GET["since"]) if "since" in request.GET else [(_EPOCH, 0)] * 2
+        except ValueError:
+            return JsonResponse({"success": False, "info": "Invalid cursor"}, status=400)
+        horizon = await sync_to_async(ledger.settle_horizon)(settings.CHANGES_SETTLE_DELAY)
+        users = await self._changed(models.UserModel.objects.with_relations(), positions[0], horizon, amount)
+        communisms = await self._changed(
+            models.CommunismModel.objects.prefetch_related("participants"), positions[1], horizon, amount
+        )
+        for i, rows in enumerate([users, communisms]):
+            if rows:
+                positions[i] = (rows[-1].modified, rows[-1].id)
+        return JsonResponse({
+            "success": True,
+            "data": {"users": [x.to_dict() for x in users], "communisms": [x.to_dict() for x in communisms]},
+            "next": _encode_change_cursor(*positions),
+            "more": len(users) == amount or len(communisms) == amount
+        })
 
 
 class CreateUserView(AuthView):
@@ -98,26 +341,77 @@ class CreateUserView(AuthView):
             application = models.ApplicationModel.objects.get(id=decoded["application_id"])
         except models.ApplicationModel.DoesNotExist:
             return JsonResponse({"success": False, "info": "Application with that ID does not exist"}, status=400)
-        user = models.UserModel.objects.create(name=name)
-        models.UserAliasModel.objects.create(
-            user_alias=decoded["user_alias"],
-            application=application,
-            user=user
-        )
+        try:
+            with transaction.atomic():
+                user = models.UserModel.objects.create(name=name)
+                models.UserAliasModel.objects.create(
+                    user_alias=decoded["user_alias"],
+                    application=application,
+                    user=user
+                )
+        except IntegrityError:
+            return JsonResponse(
+                {"success": False, "info": "The alias is already used in this application"}, status=409
+            )
+        aliases.alias_cache.evict(application.id, [decoded["user_alias"]])
         return JsonResponse({"success": True, "data": user.id})
 
 
+class ResolveUserView(AsyncAuthView):
+    """Resolve aliases of an application to users.
+
+    GET resolves the single ``user_alias``, POST resolves the list ``user_aliases`` and returns a dict mapping
+    each alias to its user or null.
+    """
+
+    async def _resolve(self, application_id, user_aliases):
+        found, missing = await aliases.alias_cache.acached(application_id, user_aliases)
+        if missing:
+            found = await sync_to_async(aliases.alias_cache.get)(application_id, user_aliases)
+        user_ids = {x for x in found.values() if x is not None}
+        users = {}
+        if user_ids:
+            users = {x.id: x async for x in models.UserModel.objects.with_relations().filter(id__in=user_ids)}
+        return {x: users[y].to_dict() if y in users else None for x, y in found.items()}
+
+    async def secure_get(self, request, *args, **kwargs):
+        if not all(x in request.GET for x in ["application_id", "user_alias"]):
+            return JsonResponse({"success": False, "info": "Missing mandatory parameter"}, status=400)
+        try:
+            application_id = int(request.GET["application_id"])
+        except ValueError:
+            return JsonResponse({"success": False, "info": "Bad parameter type"}, status=400)
+        user = (await self._resolve(application_id, [request.GET["user_alias"]]))[request.GET["user_alias"]]
+        if user is None:
+            return JsonResponse({"success": False, "info": "There is no user with that alias"}, status=404)
+        return JsonResponse({"success": True, "data": user})
+
+    async def secure_post(self, request, decoded, *args, **kwargs):
+        if not all(x in decoded for x in ["application_id", "user_aliases"]):
+            return JsonResponse({"success": False, "info": "Missing mandatory parameter"}, status=400)
+        user_aliases = decoded["user_aliases"]
+        if not isinstance(decoded["application_id"], int) or not isinstance(user_aliases, list) \
+                or not all(isinstance(x, str) for x in user_aliases):
+            return JsonResponse({"success": False, "info": "Bad parameter type"}, status=400)
+        if len(user_aliases) > settings.ALIAS_RESOLVE_MAX:
+            return JsonResponse(
+                {"success": False, "info": f"At most {settings.ALIAS_RESOLVE_MAX} aliases are allowed"}, status=400
+            )
+        return JsonResponse({"success": True, "data": await self._resolve(decoded["application_id"], user_aliases)})
+
+
 class PerformTransactionView(AuthView):
+    idempotent = True
 
     def secure_post(self, request, decoded, *args, **kwargs):
         required = ["sender_id", "receiver_id", "amount", "reason"]
         if not all([x in decoded for x in required]):
             return JsonResponse({"success": False, "info": "Missing mandatory parameter"}, status=400)
         try:
-            sender = models.UserModel.objects.get(id=decoded["sender_id"])
-            receiver = models.UserModel.objects.get(id=decoded["receiver_id"])
-        except models.UserModel.DoesNotExist:
-            return JsonResponse({"success": False, "info": "Sender or Received not found"}, status=400)
+            sender_id = int(decoded["sender_id"])
+            receiver_id = int(decoded["receiver_id"])
+        except (TypeError, ValueError):
+            return JsonResponse({"success": False, "info": "Bad parameter type"}, status=400)
         try:
             amount = int(decoded["amount"])
             if amount <= 0:
@@ -125,38 +419,197 @@ class PerformTransactionView(AuthView):
         except ValueError:
             return JsonResponse({"success": False, "info": "Amount was no positive integer"}, status=400)
         reason = decoded["reason"]
-        transaction = models.TransactionModel.objects.create(
-            sender=sender, receiver=receiver, amount=amount, reason=reason
-        )
-        sender.balance -= amount
-        receiver.balance += amount
-        sender.save()
-        receiver.save()
-        return JsonResponse({"success": True, "data": transaction.id})
+        try:
+            new_transaction = ledger.transfer(sender_id, receiver_id, amount, reason)
+        except models.UserModel.DoesNotExist:
+            return JsonResponse({"success": False, "info": "Sender or Received not found"}, status=400)
+        return JsonResponse({"success": True, "data": new_transaction.id})
 
 
-class GetHistoryView(AuthView):
+class ConsumeView(AuthView):
+    """Charge a user for consuming a consumable.
 
-    def secure_get(self, request, *args, **kwargs):
+    The consumable is given by name or id and priced from the cached catalogue. Its price times the quantity is
+    moved from the user to the community user. Responds with the new balance of the user and a random message
+    of the consumable.
+    """
+
+    idempotent = True
+
+    def secure_post(self, request, decoded, *args, **kwargs):
+        required = ["user_id", "consumable"]
+        if not all([x in decoded for x in required]):
+            return JsonResponse({"success": False, "info": "Missing mandatory parameter"}, status=400)
+        try:
+            user_id = int(decoded["user_id"])
+            quantity = int(decoded.get("quantity", 1))
+            if quantity <= 0:
+                raise ValueError
+        except (TypeError, ValueError):
+            return JsonResponse({"success": False, "info": "Bad parameter type"}, status=400)
+        consumable = catalogue.consumable_cache.find(decoded["consumable"])
+        if consumable is None:
+            return JsonResponse({"success": False, "info": "There is no consumable with that name or id"}, status=404)
+        amount = consumable["price"] * quantity
+        try:
+            with transaction.atomic():
+                new_transaction = ledger.transfer(
+                    user_id, settings.COMMUNITY_USER_ID, amount, f"consume: {quantity}x {consumable['name']}",
+                    consumable=consumable["name"], quantity=quantity
+                )
+                balance = models.UserModel.objects.values_list("balance", flat=True).get(id=user_id)
+        except models.UserModel.DoesNotExist:
+            return JsonResponse({"success": False, "info": "User or community user not found"}, status=400)
+        return JsonResponse({
+            "success": True,
+            "data": {
+                "transaction_id": new_transaction.id,
+                "amount": amount,
+                "balance": balance,
+                "message": random.choice(consumable["messages"]) if consumable["messages"] else None
+            }
+        })
+
+
+class GetLeaderboardView(AsyncAuthView):
+    """Return the users or consumables with the highest totals.
+
+    The totals are read from the statistics, which are kept up to date by the rollups command, so the
+    leaderboard lags behind the ledger until its next run.
+    """
+
+    orders = {
+        "users": (models.UserStatisticModel, ["sent", "received", "consumed", "quantity"], "user_id"),
+        "consumables": (models.ConsumableStatisticModel, ["quantity", "amount"], "name"),
+    }
+
+    async def secure_get(self, request, *args, **kwargs):
+        of = request.GET.get("of", "users")
+        if of not in self.orders:
+            return JsonResponse({"success": False, "info": "of must be one of users or consumables"}, status=400)
+        model, fields, tie = self.orders[of]
+        by = request.GET.get("by", fields[0])
+        if by not in fields:
+            return JsonResponse({"success": False, "info": f"by must be one of {', '.join(fields)}"}, status=400)
+        page = _parse_page(request, default_amount=10)
+        if isinstance(page, JsonResponse):
+            return page
+        amount, _ = page
+        if amount > settings.STATISTICS_MAX_AMOUNT:
+            return JsonResponse(
+                {"success": False, "info": f"At most {settings.STATISTICS_MAX_AMOUNT} entries can be requested"},
+                status=400
+            )
+        rows = model.objects.order_by(f"-{by}", tie)[:amount]
+        return JsonResponse({"success": True, "data": [x.to_dict() async for x in rows]})
+
+
+class GetStatisticsView(AsyncAuthView):
+    """Return the daily totals of all transactions, of the transactions sent by a user or of a consumable.
+
+    ``since`` and ``until`` are inclusive ISO dates, by default the last 30 days are returned. Days without
+    transactions are left out.
+    """
+
+    async def secure_get(self, request, *args, **kwargs):
+        if "user_id" in request.GET and "consumable" in request.GET:
+            return JsonResponse({"success": False, "info": "Give either user_id or consumable"}, status=400)
+        until = timezone.now().date()
+        try:
+            if "until" in request.GET:
+                until = datetime.date.fromisoformat(request.GET["until"])
+            since = until - datetime.timedelta(days=29)
+            if "since" in request.GET:
+                since = datetime.date.fromisoformat(request.GET["since"])
+            user_id = int(request.GET["user_id"]) if "user_id" in request.GET else None
+        except ValueError:
+            return JsonResponse({"success": False, "info": "Bad parameter type"}, status=400)
+        if since > until or (until - since).days >= settings.STATISTICS_MAX_DAYS:
+            return JsonResponse(
+                {"success": False, "info": f"The range must cover 1 to {settings.STATISTICS_MAX_DAYS} days"},
+                status=400
+            )
+        rows = models.DailyStatisticModel.objects.filter(
+            user_id=user_id, consumable=request.GET.get("consumable", ""), day__gte=since, day__lte=until
+        ).order_by("day")
+        return JsonResponse({"success": True, "data": [x.to_dict() async for x in rows]})
+
+
+class GetHistoryView(AsyncAuthView):
+
+    async def secure_get(self, request, *args, **kwargs):
         required = ["target_id"]
         if not all([x in request.GET for x in required]):
             return JsonResponse({"success": False, "info": "Missing mandatory parameter"}, status=400)
         target_id = request.GET["target_id"]
         try:
-            target = models.UserModel.objects.get(id=target_id)
+            target = await models.UserModel.objects.aget(id=target_id)
         except models.UserModel.DoesNotExist:
             return JsonResponse({"success": False, "info": "Target user is invalid"}, status=400)
-        if "amount" in request.GET:
-            try:
-                amount = int(request.GET["amount"])
-                if amount <= 0:
-                    raise ValueError
-            except ValueError:
-                return JsonResponse({"success": False, "info": "Amount is no valid positive integer"}, status=400)
-        else:
-            amount = 10
-        transactions = models.TransactionModel.objects.filter(receiver=target).order_by("-created")[:amount]
-        return JsonResponse({"success": True, "data": [x.to_dict() for x in transactions]})
+        page = _parse_page(request, default_amount=10)
+        if isinstance(page, JsonResponse):
+            return page
+        amount, cursor = page
+        direction = request.GET.get("direction", "both")
+        if direction not in ("both", "incoming", "outgoing"):
+            return JsonResponse({"success": False, "info": "Direction is invalid"}, status=400)
+        try:
+            since = _parse_timestamp(request.GET["since"]) if "since" in request.GET else None
+            until = _parse_timestamp(request.GET["until"]) if "until" in request.GET else None
+        except (ValueError, OverflowError, OSError):
+            return JsonResponse({"success": False, "info": "Since or until is no valid timestamp"}, status=400)
+
+        model = models.TransactionModel
+        if request.GET.get("archive") in ("1", "true"):
+            model = models.ArchivedTransactionModel
+            # Archived transactions keep their ids, so a positive cursor continues the history in the archive.
+            # The history in the ledger ends with the carry-forward transactions (ids <= 0), which summed up
+            # the whole archive, so their cursor starts the archive from the newest transaction.
+            if cursor is not None and cursor <= 0:
+                cursor = None
+
+        # Ids grow with the creation time, so they order the history like created but are unique as cursor
+        transactions = ledger.created_between(model.objects.all(), since, until).order_by("-id")
+        if cursor is not None:
+            transactions = transactions.filter(id__lt=cursor)
+
+        querysets = []
+        if direction in ("both", "incoming"):
+            querysets.append(transactions.filter(receiver=target))
+        if direction in ("both", "outgoing"):
+            querysets.append(transactions.filter(sender=target))
+        if len(querysets) == 1:
+            return await _page_response(request, querysets[0], amount)
+        if not _is_streaming(request):
+            # Read the pages of both directions before merging them in memory
+            querysets = [[x async for x in y[:amount]] for y in querysets]
+        return await _page_response(request, _merge_newest_first(request, querysets, amount), amount)
+
+
+class ExportTransactionsView(AsyncAuthView):
+    """Stream all transactions for accounting as csv, jsonl or parquet, see api/export.py.
+
+    ``since`` and ``until`` are timestamps like in getHistory, with ``archive`` set archived transactions are
+    exported as well.
+    """
+
+    async def secure_get(self, request, *args, **kwargs):
+        file_format = request.GET.get("format", "csv")
+        try:
+            export.check(file_format)
+        except ValueError as error:
+            return JsonResponse({"success": False, "info": str(error)}, status=400)
+        try:
+            since = _parse_timestamp(request.GET["since"]) if "since" in request.GET else None
+            until = _parse_timestamp(request.GET["until"]) if "until" in request.GET else None
+        except (ValueError, OverflowError, OSError):
+            return JsonResponse({"success": False, "info": "Since or until is no valid timestamp"}, status=400)
+        content = export.export(file_format, since, until, archive=request.GET.get("archive") in ("1", "true"))
+        if isinstance(request, ASGIRequest):
+            content = _aiterate(content)
+        response = StreamingHttpResponse(content, content_type=export.FORMATS[file_format][1])
+        response.headers["Content-Disposition"] = f'attachment; filename="transactions.{file_format}"'
+        return response
 
 
 class DeleteUserAliasView(AuthView):
@@ -179,11 +632,14 @@ class DeleteUserAliasView(AuthView):
                 status=409
             )
         for match in matches:
+            aliases.alias_cache.evict(match.application_id, [match.user_alias])
             match.delete()
+        models.UserModel.objects.filter(id=decoded["user_id"]).update(modified=timezone.now())
         return JsonResponse({"success": True, "data": True})
 
 
 class StartVouchView(AuthView):
+    @transaction.atomic
     def secure_post(self, request, decoded, *args, **kwargs):
         required = ["user_id", "target_id"]
         if not all([x in decoded for x in required]):
@@ -201,7 +657,8 @@ class StartVouchView(AuthView):
             return JsonResponse({"success": False, "info": "Target is already vouched for"}, status=409)
         target.voucher = user
         target.save()
-        # TODO Send callback to target
+        models.UserModel.objects.filter(id=user.id).update(modified=timezone.now())
+        callbacks.emit("vouchStarted", user_id=user.id, target_id=target.id)
         return JsonResponse({"success": True})
 
 
@@ -219,10 +676,12 @@ class EndVouchView(AuthView):
             return JsonResponse({"success": False, "info": "User is not vouching for target"}, status=409)
         target.voucher = None
         target.save()
+        models.UserModel.objects.filter(id=user.id).update(modified=timezone.now())
         return JsonResponse({"success": True})
 
 
 class StartRefundView(AuthView):
+    @transaction.atomic
     def secure_post(self, request, decoded, *args, **kwargs):
         required = ["user_id", "amount"]
         if not all([x in decoded for x in required]):
@@ -242,11 +701,12 @@ class StartRefundView(AuthView):
             creator=user,
             reason=decoded["reason"] if "reason" in decoded else ""
         )
-        # TODO Send callback to all applications
+        callbacks.emit("refundCreated", refund_id=refund.id, user_id=user.id, amount=amount)
         return JsonResponse({"success": True, "data": refund.id})
 
 
 class CancelRefundView(AuthView):
+    @transaction.atomic
     def secure_post(self, request, decoded, *args, **kwargs):
         required = ["refund_id"]
         if not all([x in decoded for x in required]):
@@ -257,11 +717,14 @@ class CancelRefundView(AuthView):
             return JsonResponse({"success": False, "info": "There is no running refund with that id"}, status=404)
         refund.active = False
         refund.save()
-        # TODO Send callback
+        callbacks.emit("refundCanceled", refund_id=refund.id)
         return JsonResponse({"success": True})
 
 
 class VoteRefundView(AuthView):
+    idempotent = True
+
+    @transaction.atomic
     def secure_post(self, request, decoded, *args, **kwargs):
         required = ["user_id", "refund_id", "positive"]
         if not all([x in decoded for x in required]):
@@ -271,7 +734,7 @@ class VoteRefundView(AuthView):
         except models.UserModel.DoesNotExist:
             return JsonResponse({"success": False, "info": "There is no internal user with this id"}, status=404)
         try:
-            refund = models.RefundModel.objects.get(id=decoded["refund_id"], active=True)
+            refund = models.RefundModel.objects.select_for_update().get(id=decoded["refund_id"], active=True)
         except models.RefundModel.DoesNotExist:
             return JsonResponse({"success": False, "info": "There is no active refund with that id"}, status=404)
         if refund.creator == user:
@@ -280,31 +743,26 @@ class VoteRefundView(AuthView):
             positive = bool(decoded["positive"])
         except ValueError:
             return JsonResponse({"success": False, "info": "Positive is no valid bool"}, status=400)
-        vote = models.VoteModel.objects.create(user=user, positive=positive)
-        user_votes = refund.votes.filter(user=user)
-        if user_votes.exists():
-            for x in user_votes:
-                refund.votes.remove(x)
-        refund.votes.add(vote)
-        votes_sum = sum([1 if x.positive else -1 for x in refund.votes.all()])
-        if votes_sum >= settings.REFUND_VOTE_DELTA:
+        refund.vote(user, positive)
+        if refund.vote_sum >= settings.REFUND_VOTE_DELTA:
             refund.active = False
-            transaction = models.TransactionModel.objects.create(
-                sender=models.UserModel.objects.get(id=0),
-                receiver=user,
-                amount=refund.amount,
-                reason=refund.reason
-            )
-            refund.transaction = transaction
-            # TODO Callback: refundAccepted
-        if votes_sum <= -settings.REFUND_VOTE_DELTA:
+            try:
+                refund.transaction = ledger.transfer(
+                    settings.COMMUNITY_USER_ID, refund.creator_id, refund.amount, refund.reason
+                )
+            except models.UserModel.DoesNotExist:
+                transaction.set_rollback(True)
+                return JsonResponse({"success": False, "info": "The community user does not exist"}, status=500)
+            callbacks.emit("refundAccepted", refund_id=refund.id, transaction_id=refund.transaction.id)
+        if refund.vote_sum <= -settings.REFUND_VOTE_DELTA:
             refund.active = False
-            # TODO Callback: refundDeclined
+            callbacks.emit("refundDeclined", refund_id=refund.id)
         refund.save()
         return JsonResponse({"success": True})
 
 
 class RetractRefundVoteView(AuthView):
+    @transaction.atomic
     def secure_post(self, request, decoded, *args, **kwargs):
         required = ["user_id", "refund_id"]
         if not all([x in decoded for x in required]):
@@ -314,16 +772,15 @@ class RetractRefundVoteView(AuthView):
         except models.UserModel.DoesNotExist:
             return JsonResponse({"success": False, "info": "There is no internal user with that id"}, status=400)
         try:
-            refund = models.RefundModel.objects.get(id=decoded["refund_id"], active=True)
+            refund = models.RefundModel.objects.select_for_update().get(id=decoded["refund_id"], active=True)
         except models.RefundModel.DoesNotExist:
             return JsonResponse({"success": False, "info": "There is no active refund with that id"}, status=400)
-        if refund.votes.filter(user=user).exists():
-            votes = refund.votes.filter(user=user)
-            votes.delete()
+        refund.retract_vote(user)
         return JsonResponse({"success": True})
 
 
 class RequestMembershipView(AuthView):
+    @transaction.atomic
     def secure_post(self, request, decoded, *args, **kwargs):
         required = ["user_id"]
         if not all([x in decoded for x in required]):
@@ -335,11 +792,12 @@ class RequestMembershipView(AuthView):
         if models.MembershipPollModel.objects.filter(active=True, creator=user).exists():
             return JsonResponse({"success": False, "info": "You have already a membership poll running"}, status=409)
         membership_poll = models.MembershipPollModel.objects.create(creator=user, active=True)
-        # TODO Send Callback: CreatedMembershipPoll
+        callbacks.emit("membershipPollCreated", membership_poll_id=membership_poll.id, user_id=user.id)
         return JsonResponse({"success": True, "data": membership_poll.id})
 
 
 class VoteMembershipView(AuthView):
+    @transaction.atomic
     def secure_post(self, request, decoded, *args, **kwargs):
         required = ["user_id", "membership_poll_id", "positive"]
         if not all([x in decoded for x in required]):
@@ -353,27 +811,25 @@ class VoteMembershipView(AuthView):
         except ValueError:
             return JsonResponse({"success": False, "info": "Positive couldn't be parsed to a bool"}, status=400)
         try:
-            membership_poll = models.MembershipPollModel.objects.get(id=decoded["membership_poll_id"], active=True)
+            membership_poll = models.MembershipPollModel.objects.select_for_update().get(
+                id=decoded["membership_poll_id"], active=True
+            )
         except models.MembershipPollModel.DoesNotExist:
             return JsonResponse({"success": False, "info": "There is no membership poll with that id"}, status=400)
-        vote = models.VoteModel.objects.create(user=user, positive=positive)
-        user_votes = membership_poll.votes.filter(user=user)
-        if user_votes.exists():
-            for x in user_votes:
-                membership_poll.votes.remove(x)
-                x.delete()
-        membership_poll.votes.add(vote)
-        vote_sum = sum([1 if x.positive else -1 for x in membership_poll.votes.all()])
-        if vote_sum >= settings.USER_PROMOTE_DELTA:
+        membership_poll.vote(user, positive)
+        if membership_poll.vote_sum >= settings.USER_PROMOTE_DELTA:
             membership_poll.active = False
+            # The former voucher no longer lists the creator as vouched for
+            models.UserModel.objects.filter(id=membership_poll.creator.voucher_id).update(modified=timezone.now())
             membership_poll.creator.voucher = None
             membership_poll.creator.internal = True
             membership_poll.creator.save()
-            # TODO: Invoke callback: MembershipRequestAccepted
-        elif vote_sum <= -settings.USER_PROMOTE_DELTA:
+            membership_poll.save()
+            callbacks.emit("membershipAccepted", membership_poll_id=membership_poll.id)
+        elif membership_poll.vote_sum <= -settings.USER_PROMOTE_DELTA:
             membership_poll.active = False
             membership_poll.save()
-            # TODO: Invoke callback: MembershipRequestDeclined
+            callbacks.emit("membershipDeclined", membership_poll_id=membership_poll.id)
         return JsonResponse({"success": True})
 
 
@@ -405,6 +861,9 @@ class StartCommunismView(AuthView):
 
 
 class EndCommunismView(AuthView):
+    idempotent = True
+
+    @transaction.atomic
     def secure_post(self, request, decoded, *args, **kwargs):
         required = ["user_id", "communism_id"]
         if not all([x in decoded for x in required]):
@@ -417,7 +876,7 @@ class EndCommunismView(AuthView):
             communism = models.CommunismModel.objects.get(id=decoded["communism_id"], active=True)
         except models.CommunismModel.DoesNotExist:
             return JsonResponse({"success": False, "info": "There is no active communism with that id"}, status=400)
-        if communism.creator != user:
+        if communism.creator_id != user.id:
             return JsonResponse(
                 {"success": False, "info": "Only the creator is allowed to end this communism"},
                 status=400
@@ -427,24 +886,14 @@ class EndCommunismView(AuthView):
                 {"success": False, "info": "In order to end a communism, there have to be participants"},
                 status=400
             )
-        for participant in communism.participants.all():
-            amount = (communism.amount//len(communism.participants.all())) * participant.quantity
-            models.TransactionModel.objects.create(
-                amount=amount,
-                sender=participant.user,
-                receiver=communism.creator,
-                reason=communism.reason
-            )
-            participant.user.balance -= amount
-            participant.user.save()
-            communism.creator.balance += amount
-            communism.creator.save()
-        communism.save()
-        # TODO: Invoke callback: CommunismFinished
+        if not ledger.settle_communism(communism):
+            return JsonResponse({"success": False, "info": "There is no active communism with that id"}, status=400)
+        callbacks.emit("communismFinished", communism_id=communism.id)
         return JsonResponse({"success": True})
 
 
 class CancelCommunismView(AuthView):
+    @transaction.atomic
     def secure_post(self, request, decoded, *args, **kwargs):
         required = ["user_id", "communism_id"]
         if not all([x in decoded for x in required]):
@@ -464,24 +913,26 @@ class CancelCommunismView(AuthView):
             )
         communism.active = False
         communism.save()
-        # TODO: Create callback: send CommunismCanceled
+        callbacks.emit("communismCanceled", communism_id=communism.id)
         return JsonResponse({"success": True})
 
 
-class GetCommunismView(AuthView):
-    def secure_get(self, request, *args, **kwargs):
+class GetCommunismView(AsyncAuthView):
+    async def secure_get(self, request, *args, **kwargs):
+        communisms = models.CommunismModel.objects.prefetch_related("participants")
         if "filter" in request.GET:
             try:
-                communism = models.CommunismModel.objects.get(id=request.GET["filter"])
+                communism = await communisms.aget(id=request.GET["filter"])
             except models.CommunismModel.DoesNotExist:
                 return JsonResponse({"success": False, "info": "There is no such communism"}, status=404)
             return JsonResponse({"success": True, "data": communism.to_dict()})
         else:
-            communisms = models.CommunismModel.objects.filter(active=True)
-            return JsonResponse({"success": True, "data": [x.to_dict() for x in communisms.all()]})
+            communisms = communisms.filter(active=True)
+            return JsonResponse({"success": True, "data": [x.to_dict() async for x in communisms]})
 
 
 class JoinCommunismView(AuthView):
+    @transaction.atomic
     def secure_post(self, request, decoded, *args, **kwargs):
         required = ["user_id", "communism_id"]
         if not all([x in decoded for x in required]):
@@ -501,12 +952,13 @@ class JoinCommunismView(AuthView):
         else:
             communism_user = models.CommunismUserModel.objects.create(user=user, quantity=1)
             communism.participants.add(communism_user)
-            communism.save()
-        # TODO: Invoke callback: CommunismUpdate
+        communism.save()
+        callbacks.emit("communismUpdated", communism_id=communism.id)
         return JsonResponse({"success": True})
 
 
 class LeaveCommunismView(AuthView):
+    @transaction.atomic
     def secure_post(self, request, decoded, *args, **kwargs):
         required = ["user_id", "communism_id"]
         if not all([x in decoded for x in required]):
@@ -523,8 +975,90 @@ class LeaveCommunismView(AuthView):
             if communism.participants.get(user=user).quantity == 1:
                 communism_user = communism.participants.get(user=user)
                 communism.participants.remove(communism_user)
-                communism.delete()
+                communism_user.delete()
             else:
                 communism.participants.filter(user=user).update(quantity=F("quantity")-1)
-            # TODO: Invoke callback: UpdateCommunism
+            communism.save()
+            callbacks.emit("communismUpdated", communism_id=communism.id)
         return JsonResponse({"success": True})
+
+
+class BatchView(AuthView):
+    """Run several write operations with a single authenticated request.
+
+    The body contains a list of ``operations``, each with the name of the endpoint as ``operation`` and its
+    parameters as ``data``. All operations run in one database transaction and each gets its own savepoint,
+    so a failed operation leaves no partial changes behind.
+
+    With ``atomic`` set (the default), the first failing operation rolls back the whole batch and the
+    remaining operations are skipped. Otherwise only the failing operation is rolled back.
+    """
+
+    idempotent = True
+
+    operations = {
+        "performTransaction": PerformTransactionView,
+        "consume": ConsumeView,
+        "createUser": CreateUserView,
+        "deleteUserAlias": DeleteUserAliasView,
+        "requestMembership": RequestMembershipView,
+        "voteMembership": VoteMembershipView,
+        "startVouch": StartVouchView,
+        "endVouch": EndVouchView,
+        "startCommunism": StartCommunismView,
+        "endCommunism": EndCommunismView,
+        "cancelCommunism": CancelCommunismView,
+        "joinCommunism": JoinCommunismView,
+        "leaveCommunism": LeaveCommunismView,
+        "startRefund": StartRefundView,
+        "cancelRefund": CancelRefundView,
+        "voteRefund": VoteRefundView,
+        "retractRefundVote": RetractRefundVoteView,
+    }
+
+    def _run(self, request, operation):
+        """Run a single operation in its own savepoint.
+
+        :return: The decoded response of the operation with its status code added
+        """
+        with transaction.atomic():
+            response = self.operations[operation["operation"]]().secure_post(request, operation["data"])
+            if response.status_code >= 400:
+                transaction.set_rollback(True)
+        return {"status": response.status_code, **json.loads(response.content)}
+
+    def secure_post(self, request, decoded, *args, **kwargs):
+        if "operations" not in decoded:
+            return JsonResponse({"success": False, "info": "Missing mandatory parameter"}, status=400)
+        operations = decoded["operations"]
+        atomic = decoded.get("atomic", True)
+        if not isinstance(operations, list) or not isinstance(atomic, bool):
+            return JsonResponse({"success": False, "info": "Bad parameter type"}, status=400)
+        if len(operations) > settings.BATCH_MAX_OPERATIONS:
+            return JsonResponse(
+                {"success": False, "info": f"At most {settings.BATCH_MAX_OPERATIONS} operations are allowed"},
+                status=400
+            )
+        for operation in operations:
+            if not isinstance(operation, dict) or not isinstance(operation.get("data"), dict):
+                return JsonResponse({"success": False, "info": "Bad parameter type"}, status=400)
+            if operation.get("operation") not in self.operations:
+                return JsonResponse(
+                    {"success": False, "info": f"Unknown operation {operation.get('operation')}"}, status=400
+                )
+
+        results = []
+        with transaction.atomic():
+            for operation in operations:
+                result = self._run(request, operation)
+                results.append(result)
+                if atomic and not result["success"]:
+                    transaction.set_rollback(True)
+                    break
+        if atomic and results and not results[-1]["success"]:
+            return JsonResponse({
+                "success": False,
+                "info": f"Operation {len(results) - 1} failed, no operation was applied",
+                "data": results
+            }, status=400)
+        return JsonResponse({"success": True, "data": results})
@@ -10,6 +10,8 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.0/ref/settings/
 """
 
+import os
+import sys
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -80,13 +82,63 @@ WSGI_APPLICATION = 'matebot.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.0/ref/settings/#databases
 
-DATABASES = {
+# The database is configured with environment variables, SQLite next to the project is the default.
+# MATEBOT_DATABASE_ENGINE=postgresql uses PostgreSQL (requires psycopg), connections are kept open for
+# MATEBOT_DATABASE_CONN_MAX_AGE seconds and checked before they are reused. Set MATEBOT_DATABASE_POOLER=1 when
+# connecting through a transaction pooler like PgBouncer, which does not support server side cursors.
+
+if os.environ.get("MATEBOT_DATABASE_ENGINE", "sqlite") == "postgresql":
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get("MATEBOT_DATABASE_NAME", "matebot"),
+            'USER': os.environ.get("MATEBOT_DATABASE_USER", ""),
+            'PASSWORD': os.environ.get("MATEBOT_DATABASE_PASSWORD", ""),
+            'HOST': os.environ.get("MATEBOT_DATABASE_HOST", ""),
+            'PORT': os.environ.get("MATEBOT_DATABASE_PORT", ""),
+            'CONN_MAX_AGE': int(os.environ.get("MATEBOT_DATABASE_CONN_MAX_AGE", 60)),
+            'CONN_HEALTH_CHECKS': True,
+            'DISABLE_SERVER_SIDE_CURSORS': os.environ.get("MATEBOT_DATABASE_POOLER") == "1",
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get("MATEBOT_DATABASE_NAME", BASE_DIR / 'db.sqlite3'),
+            'CONN_MAX_AGE': int(os.environ.get("MATEBOT_DATABASE_CONN_MAX_AGE", 0)),
+        }
+    }
+
+# Pragmas set on every SQLite connection. WAL lets readers run alongside the writer, synchronous=normal only
+# syncs at checkpoints, busy_timeout (ms) makes a writer wait for the lock instead of failing at once.
+SQLITE_PRAGMAS = {
+    "journal_mode": os.environ.get("MATEBOT_SQLITE_JOURNAL_MODE", "wal"),
+    "synchronous": os.environ.get("MATEBOT_SQLITE_SYNCHRONOUS", "normal"),
+    "busy_timeout": int(os.environ.get("MATEBOT_SQLITE_BUSY_TIMEOUT", 5000)),
+}
+
+# Cache shared by all processes of a deployment, used to tell the in-process caches that their data changed, see
+# api/generations.py. The default works for all processes on one host, use e.g. MATEBOT_CACHE_BACKEND=
+# django.core.cache.backends.redis.RedisCache with MATEBOT_CACHE_LOCATION=redis://... across hosts.
+# Every authenticated request reads one key from it, getConsumables and resolveUser one or two more. With the
+# default FileBasedCache a read opens and unpickles a small file from the page cache, about 20 µs, with Redis or
+# Memcached it costs a network round trip.
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'BACKEND': os.environ.get("MATEBOT_CACHE_BACKEND", "django.core.cache.backends.filebased.FileBasedCache"),
+        'LOCATION': os.environ.get("MATEBOT_CACHE_LOCATION", str(BASE_DIR / "cache")),
     }
 }
 
+# The tests run in a single process and must not write to the cache of a deployment
+if sys.argv[1:2] == ["test"]:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.0/ref/settings/#auth-password-validators
@@ -131,3 +183,66 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REFUND_VOTE_DELTA = 2
 USER_PROMOTE_DELTA = 2
+
+# Seconds an application token is cached in process before it is read from the database again
+AUTH_TOKEN_CACHE_TTL = 60
+
+# Rows fetched from the database at once when a response is streamed
+STREAM_CHUNK_SIZE = 2000
+
+# Seconds a transaction has to be old before the reconciliation and the statistics fold it, see ledger.settled.
+# It has to cover the time between taking the timestamp of a row and the start of its database transaction, and
+# the clock difference to the database server. On PostgreSQL transactions still open hold the horizon back, see
+# ledger.settle_horizon. On SQLite writers are serialized, so ids are taken in the order of the commits.
+LEDGER_SETTLE_DELAY = 1
+
+# Id of the user representing the community, refunds are paid from its balance
+COMMUNITY_USER_ID = 0
+
+# Seconds the serialized consumables are cached in process before they are read from the database again
+CONSUMABLES_CACHE_TTL = 300
+
+# Delivery of events to the application callbacks, see api/callbacks.py
+CALLBACK_CONNECTIONS = 100
+CALLBACK_CONCURRENCY = 4
+CALLBACK_BATCH_SIZE = 50
+CALLBACK_TIMEOUT = 10
+CALLBACK_MAX_ATTEMPTS = 10
+CALLBACK_RETRY_DELAY = 1
+CALLBACK_RETRY_MAX_DELAY = 600
+CALLBACK_POLL_INTERVAL = 1
+
+# Maximum number of operations in a single batch request
+BATCH_MAX_OPERATIONS = 100
+
+# Seconds the response to an Idempotency-Key is kept, retries after that run the request again
+IDEMPOTENCY_KEY_TTL = 24 * 60 * 60
+
+# Per-request profiling, see api/profiling.py, enabled with MATEBOT_PROFILING=1. Numbers are served to staff users
+# at /admin/metrics. With MATEBOT_PROFILING_SLOW_REQUEST set, requests slower than that many seconds are dumped
+# with cProfile.
+PROFILING = os.environ.get("MATEBOT_PROFILING") == "1"
+PROFILING_SLOW_REQUEST = (
+    float(os.environ["MATEBOT_PROFILING_SLOW_REQUEST"]) if "MATEBOT_PROFILING_SLOW_REQUEST" in os.environ else None
+)
+PROFILING_DUMP_DIR = BASE_DIR / "profiles"
+
+if PROFILING:
+    MIDDLEWARE.insert(0, "api.profiling.ProfilingMiddleware")
+
+# Aliases resolved to users, cached in process for ALIAS_CACHE_TTL seconds, see api/aliases.py
+ALIAS_CACHE_SIZE = 100000
+ALIAS_CACHE_TTL = 60
+ALIAS_RESOLVE_MAX = 1000
+
+# Change feed, see the changes endpoint. Rows modified during the last CHANGES_SETTLE_DELAY seconds are left for
+# the next request, like LEDGER_SETTLE_DELAY. On SQLite a writer waits up to busy_timeout for the lock after it
+# took the modified timestamp, the delay has to be longer than that.
+CHANGES_PAGE_SIZE = 1000
+CHANGES_SETTLE_DELAY = 1
+if DATABASES["default"]["ENGINE"] == "django.db.backends.sqlite3":
+    CHANGES_SETTLE_DELAY += SQLITE_PRAGMAS["busy_timeout"] / 1000
+
+# Statistics folded from the ledger by the rollups command, see api/rollups.py
+STATISTICS_MAX_AMOUNT = 100
+STATISTICS_MAX_DAYS = 366
@@ -18,8 +18,10 @@ from django.contrib import admin
 from django.urls import path, include
 
 import api.urls
+from api.profiling import metrics_view
 
 urlpatterns = [
+    path('admin/metrics', metrics_view),
     path('admin/', admin.site.urls),
     path('api/v1/', include(api.urls)),
 ]